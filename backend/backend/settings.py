@@ -1,6 +1,7 @@
 from pathlib import Path
 from datetime import timedelta
 import os
+import tempfile
 import environ
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -67,8 +68,8 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 5,
 
     'DEFAULT_THROTTLE_CLASSES': (
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
+        'base.throttling.AnonRateThrottle',
+        'base.throttling.UserRateThrottle',
     ),
     'DEFAULT_THROTTLE_RATES': {
         'anon':  '50/hour',
@@ -77,8 +78,10 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'base.metrics.MetricsMiddleware',
+    'base.routing.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'base.staticfiles.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -92,6 +95,67 @@ CORS_ALLOWED_ORIGINS = env.list('DJANGO_CORS_ALLOWED_ORIGINS', default=['http://
 
 CORS_ALLOW_CREDENTIALS = True
 
+TIMELINE_FANOUT_LIMIT = env.int('TIMELINE_FANOUT_LIMIT', default=10000)
+TIMELINE_BACKFILL_POSTS = env.int('TIMELINE_BACKFILL_POSTS', default=50)
+
+DISCOVER_WINDOW_DAYS = env.int('DISCOVER_WINDOW_DAYS', default=30)
+USER_SEARCH_INDEX_TTL = env.int('USER_SEARCH_INDEX_TTL', default=300)
+USER_SEARCH_INDEX_BACKGROUND = env.bool('USER_SEARCH_INDEX_BACKGROUND', default=True)
+NOTIFICATION_JOBS_EAGER = env.bool('NOTIFICATION_JOBS_EAGER', default=False)
+NOTIFICATION_BUCKET_HOURS = env.int('NOTIFICATION_BUCKET_HOURS', default=24)
+# Notifications are written by notification_worker, so streams only hear of them
+# through a backend shared between processes. LocalBackend suits a single
+# process with NOTIFICATION_JOBS_EAGER on.
+NOTIFICATION_STREAM_BACKEND = env('NOTIFICATION_STREAM_BACKEND', default='base.stream.DatabaseBackend')
+NOTIFICATION_STREAM_POLL_INTERVAL = env.float('NOTIFICATION_STREAM_POLL_INTERVAL', default=1.0)
+# How far back each poll re-reads, bounding how long a notification batch may
+# take to commit; rows are kept for the retention, which has to be longer.
+NOTIFICATION_STREAM_OVERLAP = env.float('NOTIFICATION_STREAM_OVERLAP', default=10.0)
+NOTIFICATION_STREAM_RETENTION = env.float('NOTIFICATION_STREAM_RETENTION', default=60.0)
+NOTIFICATION_STREAM_HEARTBEAT = env.float('NOTIFICATION_STREAM_HEARTBEAT', default=15.0)
+
+IMAGE_JOBS_EAGER = env.bool('IMAGE_JOBS_EAGER', default=False)
+MEDIA_DELETE_EAGER = env.bool('MEDIA_DELETE_EAGER', default=False)
+
+AUTH_USER_CACHE_SIZE = env.int('AUTH_USER_CACHE_SIZE', default=10000)
+AUTH_USER_CACHE_TTL = env.float('AUTH_USER_CACHE_TTL', default=30.0)
+
+TOKEN_BLACKLIST_FILTER_TTL = env.float('TOKEN_BLACKLIST_FILTER_TTL', default=3600.0)
+# How far back each sync re-reads; bounds how long a blacklisting may take to
+# commit, and the clock skew between workers.
+TOKEN_BLACKLIST_SYNC_OVERLAP = env.float('TOKEN_BLACKLIST_SYNC_OVERLAP', default=5.0)
+
+FOLLOW_GRAPH_CACHE_SIZE = env.int('FOLLOW_GRAPH_CACHE_SIZE', default=100000)
+FOLLOW_GRAPH_CACHE_TTL = env.float('FOLLOW_GRAPH_CACHE_TTL', default=30.0)
+
+THROTTLE_STORE = env('THROTTLE_STORE', default='base.throttling.SQLiteStore')
+THROTTLE_DB_PATH = env('THROTTLE_DB_PATH', default=os.path.join(tempfile.gettempdir(), 'lipu-pona-throttle.sqlite3'))
+
+SERVER_TIMING = env.bool('SERVER_TIMING', default=True)
+METRICS_DIR = env('METRICS_DIR', default=os.path.join(tempfile.gettempdir(), 'lipu-pona-metrics'))
+METRICS_FLUSH_INTERVAL = env.float('METRICS_FLUSH_INTERVAL', default=5.0)
+
+BATCH_MAX_REQUESTS = env.int('BATCH_MAX_REQUESTS', default=10)
+BATCH_MAX_WORKERS = env.int('BATCH_MAX_WORKERS', default=4)
+
+# Serve the hottest reads from async views; only worth it under an ASGI server.
+ASYNC_VIEWS = env.bool('ASYNC_VIEWS', default=False)
+ASYNC_VIEWS_PARALLEL_QUERIES = env.bool('ASYNC_VIEWS_PARALLEL_QUERIES', default=True)
+
+REPLICA_STICKY_SECONDS = env.int('REPLICA_STICKY_SECONDS', default=10)
+REPLICA_HEALTH_INTERVAL = env.float('REPLICA_HEALTH_INTERVAL', default=5.0)
+REPLICA_MAX_LAG = env.float('REPLICA_MAX_LAG', default=5.0)
+
+# Generations live in the cache, so it has to be shared by every worker for a
+# write on one to invalidate the others; the default is a file cache next to
+# the throttle store. Point CACHE_URL at redis:// when the workers span hosts.
+CACHES = {'default': env.cache(
+    'CACHE_URL', default=f"filecache://{os.path.join(tempfile.gettempdir(), 'lipu-pona-cache')}",
+)}
+RESPONSE_CACHE_ALIAS = env('RESPONSE_CACHE_ALIAS', default='default')
+RESPONSE_CACHE_TTL = env.int('RESPONSE_CACHE_TTL', default=30)
+RESPONSE_CACHE_DISCOVER_TTL = env.int('RESPONSE_CACHE_DISCOVER_TTL', default=15)
+
 MEDIA_URL = '/api/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
@@ -118,6 +182,14 @@ DATABASES = {
     'default': env.db()
 }
 
+# Read replicas as a comma separated list of database URLs. Tests run them
+# as mirrors of the default database.
+DATABASE_REPLICAS = []
+for i, url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[]), 1):
+    DATABASES[f'replica{i}'] = {**env.db_url_config(url), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{i}')
+DATABASE_ROUTERS = ['base.routing.ReplicaRouter']
+
 AUTH_PASSWORD_VALIDATORS = [
     # {
     #     'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -2,4 +2,14 @@ from django.apps import AppConfig
 
 class BaseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'base'
\ No newline at end of file
+    name = 'base'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_save
+        from .authenticate import invalidate_cached_user
+        from .metrics import install_query_timer
+
+        post_save.connect(invalidate_cached_user, sender='base.MyUser')
+        post_delete.connect(invalidate_cached_user, sender='base.MyUser')
+        connection_created.connect(install_query_timer)
@@ -0,0 +1,131 @@
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import Page
+from django.db import close_old_connections
+from django.http import HttpResponse
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .authenticate import CookiesAuthentication
+from .conditional import etag_matches, with_etag
+from .throttling import AnonRateThrottle, UserRateThrottle
+
+class ApiResponse(HttpResponse):
+    """JSON rendered the way DRF's Response would be, keeping ``data`` for batched calls."""
+
+    def __init__(self, data=None, status=status.HTTP_200_OK, headers=None):
+        content = b'' if data is None else JSONRenderer().render(data)
+        super().__init__(content, status=status, headers=headers, content_type='application/json')
+        self.data = data
+
+def async_api_view(view):
+    """Async counterpart of ``@api_view(['GET'])`` with IsAuthenticated and the default throttles.
+
+    Authentication runs on the event loop, and only a user cache miss leaves
+    it; the throttle checks run on a worker thread. The view gets a DRF Request, so helpers written for the
+    sync views can be shared.
+    """
+    authentication = CookiesAuthentication()
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request = Request(request)
+        try:
+            if request.method not in ('GET', 'HEAD'):
+                raise exceptions.MethodNotAllowed(request.method)
+            await authenticate(request, authentication)
+            # The throttle store can block on its file lock, so it is hit
+            # from a worker thread; it does not use the database connection.
+            await sync_to_async(check_throttles, thread_sensitive=False)(request)
+            response = await view(request, *args, **kwargs)
+        except Exception as exc:
+            response = handle_exception(request, exc)
+        response['Allow'] = 'GET, HEAD'
+        return response
+
+    wrapper.async_api = True
+    wrapper.csrf_exempt = True
+    return wrapper
+
+async def authenticate(request, authentication):
+    # Batched sub-requests arrive already authenticated.
+    if getattr(request._request, '_force_auth_user', None) is not None:
+        request.user, request.auth = request._request._force_auth_user, request._request._force_auth_token
+        return
+    result = await authentication.aauthenticate(request._request)
+    if result is None:
+        exc = exceptions.NotAuthenticated()
+        exc.auth_header = authentication.authenticate_header(request)
+        raise exc
+    request.user, request.auth = result
+
+def check_throttles(request):
+    for throttle in (AnonRateThrottle(), UserRateThrottle()):
+        if not throttle.allow_request(request, None):
+            raise exceptions.Throttled(throttle.wait())
+
+def handle_exception(request, exc):
+    response = api_settings.EXCEPTION_HANDLER(exc, {'request': request, 'view': None, 'args': (), 'kwargs': {}})
+    if response is None:
+        raise exc
+    headers = {name: value for name, value in response.items() if name.lower() != 'content-type'}
+    return ApiResponse(response.data, status=response.status_code, headers=headers)
+
+async def aconditional_response(request, etag, render):
+    """``conditional_response`` for async views, where ``render`` is a coroutine function."""
+    if etag_matches(request, etag):
+        return with_etag(ApiResponse(status=status.HTTP_304_NOT_MODIFIED), etag)
+    return with_etag(await render(), etag)
+
+def in_thread(func, *args, **kwargs):
+    """Run a blocking lookup on a worker thread with its own database connection.
+
+    The async ORM runs every query of a request on that request's one
+    thread, so lookups that do not depend on each other only overlap when
+    one of them goes through here. The connection is outside any transaction
+    the request holds, so ASYNC_VIEWS_PARALLEL_QUERIES turns this off for
+    tests that run inside one.
+    """
+    if not settings.ASYNC_VIEWS_PARALLEL_QUERIES:
+        return sync_to_async(func)(*args, **kwargs)
+
+    def run():
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)()
+
+async def paginate(paginator, queryset, request):
+    """``paginator.paginate_queryset`` with its query off the event loop."""
+    return await sync_to_async(paginator.paginate_queryset)(queryset, request)
+
+async def paginate_pages(paginator, queryset, request):
+    """PageNumberPagination with the count and the page fetched at the same time."""
+    page_size = paginator.get_page_size(request)
+    django_paginator = paginator.django_paginator_class(queryset, page_size)
+    number = request.query_params.get(paginator.page_query_param) or 1
+    invalid = exceptions.NotFound(paginator.invalid_page_message.format(page_number=number, message=''))
+    if number in paginator.last_page_strings:
+        number = await sync_to_async(lambda: django_paginator.num_pages)()
+    try:
+        number = int(number)
+    except (TypeError, ValueError):
+        raise invalid
+    if number < 1:
+        raise invalid
+
+    bottom = (number - 1) * page_size
+    count, items = await asyncio.gather(queryset.acount(), in_thread(list, queryset[bottom:bottom + page_size]))
+    # Seed Paginator.count so the page links do not count again.
+    django_paginator.count = count
+    if number > django_paginator.num_pages:
+        raise invalid
+    paginator.request = request
+    paginator.page = Page(items, number, django_paginator)
+    return items
@@ -1,4 +1,94 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+class UserCache:
+    """Bounded LRU of authenticated users, local to this worker process.
+
+    Entries expire after AUTH_USER_CACHE_TTL seconds, which bounds how long
+    other workers can keep serving a user changed elsewhere. Invalidations
+    are stamped with a generation number so a lookup that started before the
+    change cannot store the stale row it read.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.generation = 0
+        self.floor = 0
+        self.hits = 0
+        self.misses = 0
+
+    def version(self):
+        with self.lock:
+            return self.generation
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self.entries.move_to_end(user_id)
+            self.hits += 1
+            user = entry[1]
+        return copy.copy(user)
+
+    def put(self, user, version):
+        with self.lock:
+            if version < self.floor or self.versions.get(user.pk, 0) > version:
+                return
+            self.entries[user.pk] = (time.monotonic() + settings.AUTH_USER_CACHE_TTL, copy.copy(user))
+            self.entries.move_to_end(user.pk)
+            while len(self.entries) > settings.AUTH_USER_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+            self.generation += 1
+            self.versions[user_id] = self.generation
+            if len(self.versions) > settings.AUTH_USER_CACHE_SIZE:
+                self.versions.clear()
+                self.floor = self.generation
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.versions.clear()
+            self.floor = self.generation
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+user_cache = UserCache()
+
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+
+def forget_users(*pks):
+    """Drop cached users whose rows were changed by ``QuerySet.update()``, which sends no signals.
+
+    Once now and again after commit, so a lookup that read the old row in
+    between cannot keep it.
+    """
+    def run():
+        for pk in pks:
+            user_cache.invalidate(pk)
+    if pks:
+        run()
+        transaction.on_commit(run)
 
 class CookiesAuthentication(JWTAuthentication):
     def authenticate(self, request):
@@ -13,4 +103,44 @@ class CookiesAuthentication(JWTAuthentication):
             return None
 
         request.META['HTTP_AUTHORIZATION'] = f'Bearer {access_token}'
-        return (user, validated_token)
\ No newline at end of file
+        return (user, validated_token)
+
+    async def aauthenticate(self, request):
+        """``authenticate`` for async views; only a user cache miss leaves the event loop."""
+        access_token = request.COOKIES.get('access_token')
+        if not access_token:
+            return None
+
+        try:
+            validated_token = self.get_validated_token(access_token)
+            user = self.get_cached_user(validated_token)
+            if user is None:
+                version = user_cache.version()
+                user = await sync_to_async(super().get_user)(validated_token)
+                user_cache.put(user, version)
+        except Exception:
+            return None
+
+        request.META['HTTP_AUTHORIZATION'] = f'Bearer {access_token}'
+        return (user, validated_token)
+
+    def get_user(self, validated_token):
+        user = self.get_cached_user(validated_token)
+        if user is None:
+            version = user_cache.version()
+            user = super().get_user(validated_token)
+            user_cache.put(user, version)
+        return user
+
+    def get_cached_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        user = user_cache.get(user_id)
+        if user is not None and api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed("The user's password has been changed.", code="password_changed")
+        return user
@@ -0,0 +1,94 @@
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+class ResponseCache:
+    """Read-through cache for the viewer-independent parts of API responses.
+
+    Every entry is keyed by the generation of the object it was built from.
+    Writes bump the generation once they commit, so an entry built from old
+    rows is never read again and just ages out after RESPONSE_CACHE_TTL.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[settings.RESPONSE_CACHE_ALIAS]
+
+    def generations(self, scopes):
+        keys = {f'gen:{scope}': scope for scope in scopes}
+        found = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            # Restart a lost generation somewhere random, so entries written
+            # under its old values cannot come back.
+            for key in missing:
+                self.cache.add(key, random.getrandbits(48), timeout=None)
+            found.update(self.cache.get_many(missing))
+        return {scope: found.get(key, 0) for key, scope in keys.items()}
+
+    def fetch(self, kind, pks, build, namespace=''):
+        """Return ``{pk: value}`` for ``pks``, calling ``build(missing_pks)`` for the misses.
+
+        ``build`` returns a dict and may leave out objects that no longer exist.
+        """
+        if not settings.RESPONSE_CACHE_TTL:
+            return build(list(pks))
+        gens = self.generations(f'{kind}:{pk}' for pk in pks)
+        keys = {f'{kind}:{namespace}:{pk}:{gens[f"{kind}:{pk}"]}': pk for pk in pks}
+        values = {keys[key]: value for key, value in self.cache.get_many(keys).items()}
+        missing = [pk for pk in keys.values() if pk not in values]
+        self.count(len(values), len(missing))
+        if missing:
+            built = build(missing)
+            self.cache.set_many(
+                {key: built[pk] for key, pk in keys.items() if pk in built},
+                settings.RESPONSE_CACHE_TTL,
+            )
+            values.update(built)
+        return values
+
+    def get_or_set(self, key, build, timeout):
+        value = self.cache.get(key)
+        self.count(value is not None, value is None)
+        if value is None:
+            value = build()
+            self.cache.set(key, value, timeout)
+        return value
+
+    def bump(self, kind, *pks):
+        # Once now, so this request reads its own write, and again after
+        # commit, so a reader that saw the old rows between the two cannot
+        # have cached them under the final generation.
+        def run():
+            for pk in pks:
+                try:
+                    self.cache.incr(f'gen:{kind}:{pk}')
+                except ValueError:
+                    # Nothing was cached under the old generation.
+                    pass
+        if pks:
+            run()
+            transaction.on_commit(run)
+
+    def count(self, hits, misses):
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self):
+        with self.lock:
+            hits, misses = self.hits, self.misses
+        return {'hits': hits, 'misses': misses, 'hit_ratio': hits / (hits + misses) if hits + misses else 0.0}
+
+response_cache = ResponseCache()
+
+def bump(model, *pks):
+    response_cache.bump(model._meta.model_name, *pks)
@@ -0,0 +1,45 @@
+import hashlib
+from functools import partial
+
+from django.utils.cache import parse_etags, patch_vary_headers
+from rest_framework import status
+from rest_framework.response import Response
+
+def make_etag(*parts):
+    digest = hashlib.sha1(':'.join(map(str, parts)).encode()).hexdigest()[:24]
+    return f'W/"{digest}"'
+
+def etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    tags = parse_etags(header)
+    return '*' in tags or etag.removeprefix('W/') in {tag.removeprefix('W/') for tag in tags}
+
+def with_etag(response, etag):
+    if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ['Cookie'])
+    return response
+
+def conditional_response(request, etag, render):
+    """Answer 304 when the client already holds ``etag``, otherwise call ``render``."""
+    if etag_matches(request, etag):
+        return with_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+    return with_etag(render(), etag)
+
+class ConditionalListMixin:
+    """Serves a ListAPIView page conditionally on the ETag from ``get_etag``.
+
+    A view that returns None from ``get_etag`` is served as usual, without one.
+    """
+
+    def get_etag(self, request):
+        return None
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        if etag is None:
+            return super().list(request, *args, **kwargs)
+        return conditional_response(request, etag, partial(super().list, request, *args, **kwargs))
@@ -0,0 +1,137 @@
+from django.db import transaction, IntegrityError
+from django.db.models import F, OuterRef
+
+from .authenticate import forget_users
+from .caching import bump
+from .graph import Follow, forget
+from .models import MyUser, Post, Comment, count_subquery
+
+PostLike = Post.likes.through
+CommentLike = Comment.likes.through
+
+def adjust(model, pk, **deltas):
+    model.objects.filter(pk=pk).update(**{field: F(field) + delta for field, delta in deltas.items()})
+    if 'version' in deltas:
+        bump(model, pk)
+        if model is Post:
+            bump_post_lists(Post.objects.filter(pk=pk))
+    if model is MyUser:
+        forget_users(pk)
+
+def bump_post_lists(posts):
+    """Move the posts_version of the authors of ``posts``, so their post lists revalidate."""
+    MyUser.objects.filter(pk__in=posts.values('user_id')).update(posts_version=F('posts_version') + 1)
+
+def link(through, **row):
+    try:
+        with transaction.atomic():
+            through.objects.create(**row)
+    except IntegrityError:
+        return False
+    return True
+
+def unlink(through, **row):
+    deleted, _ = through.objects.filter(**row).delete()
+    return deleted > 0
+
+def like_post(post, user):
+    with transaction.atomic():
+        if not link(PostLike, post=post, myuser=user):
+            return False
+        adjust(Post, post.pk, like_count=1, version=1)
+    return True
+
+def unlike_post(post, user):
+    with transaction.atomic():
+        if not unlink(PostLike, post=post, myuser=user):
+            return False
+        adjust(Post, post.pk, like_count=-1, version=1)
+    return True
+
+def like_comment(comment, user):
+    with transaction.atomic():
+        if not link(CommentLike, comment=comment, myuser=user):
+            return False
+        adjust(Comment, comment.pk, like_count=1)
+        adjust(Post, comment.post_id, version=1)
+    return True
+
+def unlike_comment(comment, user):
+    with transaction.atomic():
+        if not unlink(CommentLike, comment=comment, myuser=user):
+            return False
+        adjust(Comment, comment.pk, like_count=-1)
+        adjust(Post, comment.post_id, version=1)
+    return True
+
+def follow(target, follower):
+    with transaction.atomic():
+        if not link(Follow, from_myuser=target, to_myuser=follower):
+            return False
+        adjust(MyUser, target.pk, follower_count=1, version=1)
+        adjust(MyUser, follower.pk, following_count=1, version=1)
+    forget(follower, target)
+    return True
+
+def follow_many(target, follower_ids):
+    """Make every id in ``follower_ids`` follow ``target``, returning the ids that were new."""
+    with transaction.atomic():
+        existing = set(
+            Follow.objects.filter(from_myuser=target, to_myuser__in=follower_ids)
+            .values_list('to_myuser', flat=True)
+        )
+        added = [pk for pk in dict.fromkeys(follower_ids) if pk not in existing]
+        if not added:
+            return added
+        Follow.objects.bulk_create(
+            [Follow(from_myuser_id=target.pk, to_myuser_id=pk) for pk in added],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        adjust(MyUser, target.pk, follower_count=len(added), version=1)
+        MyUser.objects.filter(pk__in=added).update(following_count=F('following_count') + 1, version=F('version') + 1)
+        bump(MyUser, *added)
+        forget_users(*added)
+    return added
+
+def unfollow(target, follower):
+    with transaction.atomic():
+        if not unlink(Follow, from_myuser=target, to_myuser=follower):
+            return False
+        adjust(MyUser, target.pk, follower_count=-1, version=1)
+        adjust(MyUser, follower.pk, following_count=-1, version=1)
+    forget(follower, target)
+    return True
+
+def touch_commented_posts(user):
+    """Bump every post ``user`` has commented on, so its comment thread revalidates after a profile change."""
+    pks = list(Post.objects.filter(comments__user=user).values_list('pk', flat=True).distinct())
+    Post.objects.filter(pk__in=pks).update(version=F('version') + 1)
+    bump(Post, *pks)
+    bump_post_lists(Post.objects.filter(pk__in=pks))
+    return pks
+
+def recount_posts(queryset):
+    bump(Post, *queryset.values_list('pk', flat=True))
+    bump_post_lists(queryset)
+    return queryset.update(
+        like_count=count_subquery(PostLike.objects.filter(post=OuterRef('pk')), 'post'),
+        comment_count=count_subquery(Comment.objects.filter(post=OuterRef('pk')), 'post'),
+        version=F('version') + 1,
+    )
+
+def recount_comments(queryset):
+    return queryset.update(
+        like_count=count_subquery(CommentLike.objects.filter(comment=OuterRef('pk')), 'comment'),
+    )
+
+def recount_users(queryset):
+    pks = list(queryset.values_list('pk', flat=True))
+    bump(MyUser, *pks)
+    forget_users(*pks)
+    return queryset.update(
+        post_count=count_subquery(Post.objects.filter(user=OuterRef('pk')), 'user'),
+        follower_count=count_subquery(Follow.objects.filter(from_myuser=OuterRef('pk')), 'from_myuser'),
+        following_count=count_subquery(Follow.objects.filter(to_myuser=OuterRef('pk')), 'to_myuser'),
+        version=F('version') + 1,
+    )
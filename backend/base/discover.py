@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Post, Comment, DiscoverRank
+
+# The old score was 100 * likes + 100 * commenters - age in minutes. The age
+# term shifts every post by the same amount, so adding the creation time in
+# minutes instead gives the same order and a score that does not drift.
+def discover_score(like_count, commenter_count, created_at):
+    return 100.0 * like_count + 100.0 * commenter_count + created_at.timestamp() / 60.0
+
+def window_start():
+    return timezone.now() - timezone.timedelta(days=settings.DISCOVER_WINDOW_DAYS)
+
+def rank_new_post(post):
+    DiscoverRank.objects.create(
+        post=post,
+        score=discover_score(0, 0, post.created_at),
+        created_at=post.created_at,
+    )
+
+def mark_dirty(*post_ids):
+    DiscoverRank.objects.filter(post_id__in=post_ids, dirty=False).update(dirty=True)
+
+def commenter_counts():
+    commenters = (
+        Comment.objects.filter(post=OuterRef('pk'))
+        .order_by().values('post')
+        .annotate(n=Count('user', distinct=True)).values('n')
+    )
+    return Coalesce(Subquery(commenters, output_field=IntegerField()), Value(0))
+
+def rescore(posts):
+    ranks = [
+        DiscoverRank(
+            post_id=post.pk,
+            score=discover_score(post.like_count, post.commenter_count, post.created_at),
+            created_at=post.created_at,
+        )
+        for post in posts.annotate(commenter_count=commenter_counts())
+    ]
+    DiscoverRank.objects.bulk_create(
+        ranks,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['post'],
+        update_fields=['score', 'created_at'],
+    )
+    return len(ranks)
+
+def refresh(batch_size=1000):
+    DiscoverRank.objects.filter(created_at__lt=window_start()).delete()
+    refreshed = 0
+    while True:
+        ids = list(DiscoverRank.objects.filter(dirty=True).values_list('post_id', flat=True)[:batch_size])
+        if not ids:
+            return refreshed
+        DiscoverRank.objects.filter(pk__in=ids).update(dirty=False)
+        refreshed += rescore(Post.objects.filter(pk__in=ids))
+
+def rebuild(batch_size=1000):
+    DiscoverRank.objects.filter(created_at__lt=window_start()).delete()
+    rebuilt = 0
+    last_id = 0
+    while True:
+        ids = list(
+            Post.objects.filter(created_at__gte=window_start(), pk__gt=last_id)
+            .order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return rebuilt
+        rebuilt += rescore(Post.objects.filter(pk__in=ids))
+        last_id = ids[-1]
+
+def ranked_posts():
+    # Both sort keys come from DiscoverRank, so discoverrank_order_idx can
+    # drive the scan; its created_at mirrors the post's.
+    return Post.objects.filter(discover_rank__isnull=False).annotate(
+        score=F('discover_rank__score'),
+        ranked_at=F('discover_rank__created_at'),
+    )
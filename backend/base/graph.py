@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import MyUser
+
+Follow = MyUser.followers.through
+
+class FollowCache:
+    """Per-worker LRU of follow edges known to exist.
+
+    Only positive answers are kept. A missing edge is re-checked every time,
+    so accepting a follow request takes effect everywhere at once. A removed
+    edge can be served from another worker's cache for up to
+    FOLLOW_GRAPH_CACHE_TTL seconds.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def present(self, follower_id, target_ids):
+        now = time.monotonic()
+        found = set()
+        with self.lock:
+            for target_id in target_ids:
+                expires = self.entries.get((follower_id, target_id))
+                if expires is not None and expires > now:
+                    self.entries.move_to_end((follower_id, target_id))
+                    found.add(target_id)
+        return found
+
+    def add(self, follower_id, target_ids):
+        if not settings.FOLLOW_GRAPH_CACHE_SIZE:
+            return
+        expires = time.monotonic() + settings.FOLLOW_GRAPH_CACHE_TTL
+        with self.lock:
+            for target_id in target_ids:
+                self.entries[(follower_id, target_id)] = expires
+                self.entries.move_to_end((follower_id, target_id))
+            while len(self.entries) > settings.FOLLOW_GRAPH_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def discard(self, follower_id, target_ids):
+        with self.lock:
+            for target_id in target_ids:
+                self.entries.pop((follower_id, target_id), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+follow_cache = FollowCache()
+
+def followed_ids(follower_id, target_ids):
+    target_ids = set(target_ids)
+    found = follow_cache.present(follower_id, target_ids)
+    missing = target_ids - found
+    if missing:
+        fetched = set(
+            Follow.objects.filter(to_myuser=follower_id, from_myuser__in=missing)
+            .values_list('from_myuser', flat=True)
+        )
+        follow_cache.add(follower_id, fetched)
+        found |= fetched
+    return found
+
+def memo_for(user):
+    # Lives on the request's user instance, so it is dropped with the request.
+    memo = getattr(user, '_following_memo', None)
+    if memo is None:
+        memo = user._following_memo = {}
+    return memo
+
+def forget(follower, target):
+    memo_for(follower).pop(target.pk, None)
+    follow_cache.discard(follower.pk, [target.pk])
+
+def following_set(follower, target_ids):
+    """Return the subset of ``target_ids`` that ``follower`` follows."""
+    memo = memo_for(follower)
+    missing = {pk for pk in target_ids if pk not in memo}
+    if missing:
+        found = followed_ids(follower.pk, missing)
+        memo.update((pk, pk in found) for pk in missing)
+    return {pk for pk in target_ids if memo[pk]}
+
+def is_following(follower, target):
+    memo = memo_for(follower)
+    if target.pk not in memo:
+        memo[target.pk] = bool(follow_cache.present(follower.pk, [target.pk])) or (
+            Follow.objects.filter(to_myuser=follower.pk, from_myuser=target.pk).exists()
+        )
+        if memo[target.pk]:
+            follow_cache.add(follower.pk, [target.pk])
+    return memo[target.pk]
+
+def can_view(viewer, owner):
+    if not owner.private or viewer.pk == owner.pk:
+        return True
+    return viewer.is_authenticated and is_following(viewer, owner)
+
+async def ais_following(follower, target):
+    memo = memo_for(follower)
+    if target.pk not in memo:
+        memo[target.pk] = bool(follow_cache.present(follower.pk, [target.pk])) or (
+            await Follow.objects.filter(to_myuser=follower.pk, from_myuser=target.pk).aexists()
+        )
+        if memo[target.pk]:
+            follow_cache.add(follower.pk, [target.pk])
+    return memo[target.pk]
+
+async def acan_view(viewer, owner):
+    if not owner.private or viewer.pk == owner.pk:
+        return True
+    return viewer.is_authenticated and await ais_following(viewer, owner)
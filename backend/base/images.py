@@ -0,0 +1,140 @@
+import io
+import os
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .authenticate import forget_users
+from .caching import bump
+from .counters import bump_post_lists
+from .media import register_media
+from .models import MyUser, Post, ImageJob
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# label, longest edge in pixels, square crop
+VARIANTS = {
+    ImageJob.KIND_PROFILE: [('avatar_48', 48, True), ('avatar_160', 160, True), ('full', 640, False)],
+    ImageJob.KIND_POST: [('feed', 720, False), ('full', 1440, False)],
+}
+
+FORMATS = [
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+]
+
+FIELDS = {
+    ImageJob.KIND_PROFILE: (MyUser, 'profile_picture', 'profile_picture_variants'),
+    ImageJob.KIND_POST: (Post, 'image', 'image_variants'),
+}
+
+def variant_name(source, label, ext):
+    directory, filename = os.path.split(source)
+    stem = os.path.splitext(filename)[0]
+    return f"{directory}/variants/{stem}_{label}.{ext}"
+
+def render(image, size, square):
+    if square:
+        return ImageOps.fit(image, (size, size), Image.LANCZOS)
+    resized = image.copy()
+    resized.thumbnail((size, size * 2), Image.LANCZOS)
+    return resized
+
+def encodable(image, fmt):
+    if fmt == 'JPEG' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        return background
+    return image
+
+def generate(kind, source):
+    with default_storage.open(source) as f:
+        image = ImageOps.exif_transpose(Image.open(f))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.getbands() else 'RGB')
+
+    sizes = {}
+    for label, size, square in VARIANTS[kind]:
+        rendered = render(image, size, square)
+        entry = {'width': rendered.width, 'height': rendered.height}
+        for ext, fmt, options in FORMATS:
+            buffer = io.BytesIO()
+            encodable(rendered, fmt).save(buffer, fmt, **options)
+            name = variant_name(source, label, ext)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            entry[ext] = default_storage.save(name, ContentFile(buffer.getvalue()))
+        sizes[label] = entry
+    return {'source': source, 'sizes': sizes}
+
+def enqueue_image(kind, obj):
+    _, field, _ = FIELDS[kind]
+    source = getattr(obj, field).name
+    if not source:
+        return None
+    job = ImageJob.objects.create(kind=kind, object_id=obj.pk, source=source)
+    if settings.IMAGE_JOBS_EAGER:
+        with transaction.atomic():
+            process([job])
+    return job
+
+def apply(job):
+    model, field, variants_field = FIELDS[job.kind]
+    current = model.objects.filter(pk=job.object_id, **{field: job.source})
+    owner_id = current.values_list('pk' if job.kind == ImageJob.KIND_PROFILE else 'user_id', flat=True).first()
+    if owner_id is None:
+        return
+    variants = generate(job.kind, job.source)
+    register_media(owner_id, *(entry[ext] for entry in variants['sizes'].values() for ext, _, _ in FORMATS))
+    current.update(**{variants_field: variants, 'version': F('version') + 1})
+    bump(model, job.object_id)
+    if model is MyUser:
+        forget_users(job.object_id)
+    else:
+        bump_post_lists(current)
+
+def process(jobs, max_attempts=3):
+    done, retry = [], []
+    for job in jobs:
+        try:
+            with transaction.atomic():
+                apply(job)
+            done.append(job.pk)
+        except Exception as e:
+            logger.exception("Image job %s failed", job.pk)
+            job.attempts += 1
+            job.last_error = str(e)
+            job.failed = job.attempts >= max_attempts
+            job.run_after = timezone.now() + timezone.timedelta(seconds=2 ** job.attempts)
+            retry.append(job)
+    ImageJob.objects.filter(pk__in=done).delete()
+    ImageJob.objects.bulk_update(retry, ['attempts', 'last_error', 'failed', 'run_after'])
+
+def run_batch(batch_size=20, max_attempts=3):
+    with transaction.atomic():
+        jobs = ImageJob.objects.filter(failed=False, run_after__lte=timezone.now()).order_by('run_after')
+        if connection.features.has_select_for_update_skip_locked:
+            jobs = jobs.select_for_update(skip_locked=True)
+        jobs = list(jobs[:batch_size])
+        if jobs:
+            process(jobs, max_attempts)
+    return len(jobs)
+
+def variant_urls(variants, image, request=None):
+    if not image or variants.get('source') != image.name:
+        return {}
+    urls = {}
+    for label, entry in variants['sizes'].items():
+        urls[label] = {'width': entry['width'], 'height': entry['height']}
+        for ext, _, _ in FORMATS:
+            url = default_storage.url(entry[ext])
+            urls[label][ext] = request.build_absolute_uri(url) if request else url
+    return urls
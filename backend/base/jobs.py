@@ -0,0 +1,204 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .graph import followed_ids
+from .models import MyUser, Notification, NotificationActor, NotificationJob
+from .stream import publish_notifications, publish_unread
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+def enqueue_many(kind, payloads):
+    jobs = NotificationJob.objects.bulk_create(
+        [NotificationJob(kind=kind, payload=payload) for payload in payloads],
+        batch_size=1000,
+    )
+    if settings.NOTIFICATION_JOBS_EAGER and jobs:
+        with transaction.atomic():
+            process(jobs)
+    return jobs
+
+def enqueue(kind, **payload):
+    return enqueue_many(kind, [payload])[0]
+
+def notification_payload(recipient_id, actor_id, verb, target_post_id=None):
+    return {'recipient': recipient_id, 'actor': actor_id, 'verb': verb, 'target_post_id': target_post_id}
+
+def enqueue_notification(recipient, actor, verb, target_post_id=None):
+    return enqueue(NotificationJob.KIND_NOTIFY, **notification_payload(recipient.pk, actor.pk, verb, target_post_id))
+
+def enqueue_notifications(payloads):
+    return enqueue_many(NotificationJob.KIND_NOTIFY, payloads)
+
+def enqueue_mentions(text, actor, is_post, post_id):
+    usernames = sorted(set(part[1:] for part in text.split() if part.startswith('@')))
+    if not usernames:
+        return None
+    return enqueue(
+        NotificationJob.KIND_MENTIONS,
+        usernames=usernames,
+        actor=actor.pk,
+        is_post=is_post,
+        post_id=int(post_id),
+    )
+
+def cancel_notification(recipient, actor, verb, target_post_id=None):
+    NotificationJob.objects.filter(
+        kind=NotificationJob.KIND_NOTIFY,
+        failed=False,
+        payload__recipient=recipient.pk,
+        payload__actor=actor.pk,
+        payload__verb=verb,
+        payload__target_post_id=target_post_id,
+    ).delete()
+
+def group_key(recipient_id, verb, target_post_id, moment):
+    bucket = int(moment.timestamp()) // (settings.NOTIFICATION_BUCKET_HOURS * 3600)
+    return f"{verb}:{recipient_id}:{target_post_id or ''}:{bucket}"
+
+def recent_actor_ids(notification_id):
+    return list(
+        NotificationActor.objects.filter(notification_id=notification_id)
+        .order_by('-id').values_list('actor_id', flat=True)[:Notification.RECENT_ACTORS]
+    )
+
+def aggregate(job):
+    """Add the job's actor to its group's notification, returning the notification's id if it changed."""
+    p = job.payload
+    if MyUser.objects.filter(pk__in={p['recipient'], p['actor']}).count() < len({p['recipient'], p['actor']}):
+        return None
+    key = group_key(p['recipient'], p['verb'], p['target_post_id'], job.created_at)
+    notification = Notification.objects.select_for_update().filter(group_key=key).first()
+    if notification is None:
+        notification = Notification.objects.create(
+            recipient_id=p['recipient'],
+            actor_id=p['actor'],
+            verb=p['verb'],
+            target_post_id=p['target_post_id'],
+            group_key=key,
+            actor_count=0,
+        )
+    _, created = NotificationActor.objects.get_or_create(notification=notification, actor_id=p['actor'])
+    if not created:
+        return None
+    recent = [p['actor']] + [a for a in notification.recent_actors if a != p['actor']]
+    Notification.objects.filter(pk=notification.pk).update(
+        actor_id=p['actor'],
+        actor_count=F('actor_count') + 1,
+        recent_actors=recent[:Notification.RECENT_ACTORS],
+        read=False,
+    )
+    return notification.pk
+
+def retract_notification(recipient, actor, verb, target_post_id=None):
+    with transaction.atomic():
+        link = (
+            NotificationActor.objects.filter(
+                actor=actor,
+                notification__recipient=recipient,
+                notification__verb=verb,
+                notification__target_post_id=target_post_id,
+            )
+            .order_by('-id').first()
+        )
+        if link is None:
+            return
+        notification = Notification.objects.select_for_update().get(pk=link.notification_id)
+        link.delete()
+        if notification.actor_count <= 1:
+            notification.delete()
+            return
+        recent = recent_actor_ids(notification.pk)
+        Notification.objects.filter(pk=notification.pk).update(
+            actor_id=recent[0],
+            actor_count=F('actor_count') - 1,
+            recent_actors=recent,
+        )
+
+# Builders return the notifications to create and the ids of grouped ones they updated.
+
+def build_notify(job):
+    p = job.payload
+    if p['verb'] in Notification.AGGREGATED_VERBS:
+        notification_id = aggregate(job)
+        return [], [notification_id] if notification_id is not None else []
+    return [Notification(
+        recipient_id=p['recipient'],
+        actor_id=p['actor'],
+        verb=p['verb'],
+        target_post_id=p['target_post_id'],
+        idempotency_key=f"{job.key.hex}:{p['recipient']}",
+    )], []
+
+def build_mentions(job):
+    p = job.payload
+    mentioned = (
+        MyUser.objects.filter(username__in=p['usernames'], notify_mention=True)
+        .exclude(pk=p['actor'])
+        .values_list('pk', 'private')
+    )
+    allowed = followed_ids(p['actor'], [pk for pk, private in mentioned if private])
+    verb = Notification.VERB_MENTION_POST if p['is_post'] else Notification.VERB_MENTION_COMMENT
+    return [
+        Notification(
+            recipient_id=pk,
+            actor_id=p['actor'],
+            verb=verb,
+            target_post_id=p['post_id'],
+            idempotency_key=f"{job.key.hex}:{pk}",
+        )
+        for pk, private in mentioned
+        if not private or pk in allowed
+    ], []
+
+BUILDERS = {
+    NotificationJob.KIND_NOTIFY: build_notify,
+    NotificationJob.KIND_MENTIONS: build_mentions,
+}
+
+def process(jobs, max_attempts=5):
+    notifications, changed, done, retry = [], [], [], []
+    for job in jobs:
+        try:
+            with transaction.atomic():
+                new, updated = BUILDERS[job.kind](job)
+            notifications += new
+            changed += updated
+            done.append(job.pk)
+        except Exception as e:
+            logger.exception("Notification job %s failed", job.key)
+            job.attempts += 1
+            job.last_error = str(e)
+            job.failed = job.attempts >= max_attempts
+            job.run_after = timezone.now() + timezone.timedelta(seconds=2 ** job.attempts)
+            retry.append(job)
+
+    user_ids = {n.recipient_id for n in notifications} | {n.actor_id for n in notifications}
+    existing = set(MyUser.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+    created = [n for n in notifications if n.recipient_id in existing and n.actor_id in existing]
+    Notification.objects.bulk_create(created, batch_size=1000, ignore_conflicts=True)
+    # ignore_conflicts leaves the primary keys unset.
+    changed += Notification.objects.filter(idempotency_key__in=[n.idempotency_key for n in created]).values_list('pk', flat=True)
+    NotificationJob.objects.filter(pk__in=done).delete()
+    NotificationJob.objects.bulk_update(retry, ['attempts', 'last_error', 'failed', 'run_after'])
+
+    recipients = {n.recipient_id for n in notifications if n.recipient_id in existing}
+    recipients |= {job.payload['recipient'] for job in jobs if job.pk in done and job.kind == NotificationJob.KIND_NOTIFY}
+    if recipients:
+        def publish():
+            publish_notifications(changed)
+            publish_unread(sorted(recipients))
+        transaction.on_commit(publish)
+
+def run_batch(batch_size=500, max_attempts=5):
+    with transaction.atomic():
+        jobs = NotificationJob.objects.filter(failed=False, run_after__lte=timezone.now()).order_by('run_after')
+        if connection.features.has_select_for_update_skip_locked:
+            jobs = jobs.select_for_update(skip_locked=True)
+        jobs = list(jobs[:batch_size])
+        if jobs:
+            process(jobs, max_attempts)
+    return len(jobs)
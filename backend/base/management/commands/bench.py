@@ -0,0 +1,170 @@
+import json
+import os
+import platform
+import random
+import statistics
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from base.models import MyUser, Post
+
+class Command(BaseCommand):
+    help = "Time the main API endpoints through the test client and compare them with a stored baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help="Timed requests per endpoint.")
+        parser.add_argument('--warmup', type=int, default=5, help="Untimed requests per endpoint first.")
+        parser.add_argument('--viewers', type=int, default=20, help="Distinct users the requests are spread over.")
+        parser.add_argument('--prefix', default='bench', help="Username prefix used by seed_bench.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', nargs='*', help="Run only these endpoints.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--baseline', help="Compare against a JSON file written by an earlier run.")
+        parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed p95 slowdown before a regression is reported.")
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        # Lets the test client's 'testserver' host past ALLOWED_HOSTS.
+        setup_test_environment()
+        self.rng = random.Random(options['seed'])
+        users = MyUser.objects.filter(username__startswith=options['prefix'], private=False)
+        viewer_ids = list(users.filter(following_count__gt=0).order_by('pk').values_list('pk', flat=True))
+        if not viewer_ids:
+            raise CommandError("No benchmark users found; run seed_bench first.")
+        viewers = list(MyUser.objects.filter(pk__in=self.rng.sample(viewer_ids, min(options['viewers'], len(viewer_ids)))))
+        self.clients = []
+        for viewer in viewers:
+            client = APIClient()
+            client.cookies['access_token'] = str(RefreshToken.for_user(viewer).access_token)
+            client.username = viewer.username
+            self.clients.append(client)
+        self.usernames = list(users.order_by('-follower_count').values_list('username', flat=True)[:200])
+        self.post_ids = list(Post.objects.filter(user__private=False).order_by('-like_count').values_list('pk', flat=True)[:200])
+
+        endpoints = {
+            # The URLs the client sends, comment previews included.
+            'feed': lambda c: c.get('/api/feed/?comments=2'),
+            'discover': lambda c: c.get('/api/discover/?comments=2'),
+            'search_users': lambda c: c.get('/api/search-users/', {'q': self.rng.choice(self.usernames)[:4]}),
+            'user_profile': lambda c: c.get(f'/api/user/{self.rng.choice(self.usernames)}/'),
+            'user_posts': lambda c: c.get(f'/api/posts/{self.rng.choice(self.usernames)}/?comments=2'),
+            'notifications': lambda c: c.get('/api/notifications/'),
+            'toggle_like': self.toggle_like,
+            'toggle_follow': self.toggle_follow,
+        }
+        if options['only']:
+            unknown = set(options['only']) - set(endpoints)
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+            endpoints = {name: call for name, call in endpoints.items() if name in options['only']}
+
+        # Requests still pass the GCRA check, against a store of their own and
+        # with limits no run reaches, so earlier runs cannot turn them into 429s.
+        with tempfile.TemporaryDirectory() as tmp, override_settings(
+            THROTTLE_STORE='base.throttling.SQLiteStore',
+            THROTTLE_DB_PATH=os.path.join(tmp, 'throttle.sqlite3'),
+            REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'anon': '1000000/s', 'user': '1000000/s'}},
+        ):
+            results = {}
+            for name, call in endpoints.items():
+                results[name] = self.run(call, options)
+                self.stdout.write(self.format_row(name, results[name]))
+
+        report = {
+            'meta': {
+                'at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'users': MyUser.objects.count(),
+                'posts': Post.objects.count(),
+                'iterations': options['iterations'],
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+        if options['baseline']:
+            self.compare(results, options)
+        failed = [name for name, result in results.items() if result['errors']]
+        if failed:
+            raise CommandError(f"Requests failed, so the timings are not comparable: {', '.join(failed)}")
+
+    # Writes go in pairs that undo each other, so repeated runs see the same
+    # data; each sample times the pair.
+    def toggle_like(self, client):
+        post_id = self.rng.choice(self.post_ids)
+        client.post('/api/like/', {'id': post_id}, format='json')
+        return client.post('/api/like/', {'id': post_id}, format='json')
+
+    def toggle_follow(self, client):
+        username = self.rng.choice([name for name in self.usernames if name != client.username])
+        client.post('/api/follow/', {'username': username}, format='json')
+        return client.post('/api/follow/', {'username': username}, format='json')
+
+    def run(self, call, options):
+        for _ in range(options['warmup']):
+            call(self.rng.choice(self.clients))
+        latencies, queries, errors = [], [], 0
+        for i in range(options['iterations']):
+            client = self.clients[i % len(self.clients)]
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = call(client)
+                latencies.append((time.perf_counter() - start) * 1000)
+            queries.append(len(ctx.captured_queries))
+            errors += response.status_code >= 400
+        return {
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'mean_ms': round(statistics.fmean(latencies), 3),
+            'queries_p50': percentile(queries, 50),
+            'queries_max': max(queries),
+            'errors': errors,
+        }
+
+    def format_row(self, name, result):
+        return (
+            f"{name:18} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+            f"queries {result['queries_p50']:g}/{result['queries_max']}  errors {result['errors']}"
+        )
+
+    def compare(self, results, options):
+        with open(options['baseline']) as f:
+            baseline = json.load(f)['results']
+        regressions = []
+        self.stdout.write(f"\nAgainst {options['baseline']}:")
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                self.stdout.write(f"{name:18} no baseline")
+                continue
+            change = result['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0.0
+            query_change = result['queries_max'] - before['queries_max']
+            line = f"{name:18} p95 {change:+7.1%}  queries {query_change:+d}"
+            if change > options['tolerance'] or query_change > 0:
+                regressions.append(name)
+                line += "  REGRESSION"
+            self.stdout.write(line)
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"Regressed: {', '.join(regressions)}")
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    position = (len(ordered) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
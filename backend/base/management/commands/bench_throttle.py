@@ -0,0 +1,45 @@
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from rest_framework import throttling
+
+from base import throttling as gcra
+
+class Command(BaseCommand):
+    help = "Compare the per-request cost of DRF's cache-backed UserRateThrottle with the GCRA stores."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--rate', default='1000/hour')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            backends = [
+                ('drf-locmem', throttling.UserRateThrottle, None),
+                ('gcra-local', gcra.UserRateThrottle, gcra.LocalStore()),
+                ('gcra-sqlite', gcra.UserRateThrottle, gcra.SQLiteStore(os.path.join(directory, 'throttle.sqlite3'))),
+            ]
+            for name, throttle_class, store in backends:
+                per_check = self.run(throttle_class, store, options)
+                self.stdout.write(f"{name:12} {per_check:8.1f} us/check")
+
+    def run(self, throttle_class, store, options):
+        gcra._store = store
+        throttle_class.cache.clear()
+        throttle_class.rate = options['rate']
+        requests = [
+            SimpleNamespace(user=SimpleNamespace(is_authenticated=True, pk=i), META={})
+            for i in range(options['users'])
+        ]
+        try:
+            start = time.perf_counter()
+            for i in range(options['requests']):
+                throttle_class().allow_request(requests[i % len(requests)], None)
+            return (time.perf_counter() - start) / options['requests'] * 1e6
+        finally:
+            del throttle_class.rate
+            gcra._store = None
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from base.models import MyUser
+from base.timeline import rebuild
+
+class Command(BaseCommand):
+    help = "Rebuild the home timeline table for every user (or the given usernames)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*')
+
+    def handle(self, *args, **options):
+        users = MyUser.objects.order_by('pk')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+
+        built = 0
+        for user in users.iterator(chunk_size=500):
+            rebuild(user)
+            built += 1
+        self.stdout.write(f"Rebuilt {built} timelines")
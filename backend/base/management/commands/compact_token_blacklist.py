@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from base.tokens import compact_blacklist
+
+class Command(BaseCommand):
+    help = "Delete expired outstanding and blacklisted refresh tokens in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--interval', type=float, default=0, help="Repeat every N seconds instead of exiting.")
+
+    def handle(self, *args, **options):
+        while True:
+            removed = compact_blacklist(options['batch_size'])
+            self.stdout.write(f"Removed {removed} expired tokens")
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from base.images import run_batch
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = "Drain the image job queue, writing resized WebP/JPEG variants of uploaded pictures."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument('--max-attempts', type=int, default=3)
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                processed = run_batch(options['batch_size'], options['max_attempts'])
+            except Exception:
+                logger.exception("Image batch failed")
+                processed = 0
+            if processed:
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from base.media import backfill
+
+class Command(BaseCommand):
+    help = "Record existing uploads and their variants in the media registry. Safe to run more than once."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        found = backfill(options['batch_size'])
+        self.stdout.write(f"Indexed {found} media files")
@@ -0,0 +1,313 @@
+import asyncio
+import json
+import os
+import platform
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from base.models import MyUser, Post
+from .bench import percentile
+
+# What each server mode runs, and the settings it runs with.
+SERVERS = {
+    'wsgi': ('gunicorn', {'ASYNC_VIEWS': '0'}),
+    'asgi': ('uvicorn', {'ASYNC_VIEWS': '0'}),
+    'asgi-async': ('uvicorn', {'ASYNC_VIEWS': '1'}),
+}
+
+class Command(BaseCommand):
+    help = (
+        "Start the app under gunicorn (WSGI) and uvicorn (ASGI, with and without the async views) "
+        "and compare requests/sec, latency and memory at increasing concurrency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', nargs='+', choices=list(SERVERS), default=list(SERVERS))
+        parser.add_argument('--concurrency', nargs='+', type=int, default=[10, 100, 500], help="Open connections per run.")
+        parser.add_argument('--duration', type=float, default=15.0, help="Seconds of load per run.")
+        parser.add_argument('--warmup', type=float, default=3.0, help="Seconds of untimed load before each server's first run.")
+        parser.add_argument('--workers', type=int, default=2, help="Server processes.")
+        parser.add_argument('--threads', type=int, default=1, help="Threads per gunicorn worker; above 1 uses gthread.")
+        parser.add_argument('--endpoints', nargs='+', choices=['feed', 'discover', 'post', 'profile', 'search', 'notifications'],
+                            default=['feed', 'discover', 'post', 'profile', 'search', 'notifications'])
+        parser.add_argument('--viewers', type=int, default=200, help="Distinct users the requests are spread over.")
+        parser.add_argument('--prefix', default='bench', help="Username prefix used by seed_bench.")
+        parser.add_argument('--port', type=int, default=8790)
+        parser.add_argument('--timeout', type=float, default=30.0, help="Seconds before a request counts as failed.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        if not sys.platform.startswith('linux'):
+            raise CommandError("Memory is read from /proc, so this only runs on Linux.")
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        requests = self.build_requests()
+
+        results = []
+        for name in options['servers']:
+            with Server(name, options) as server:
+                self.stdout.write(f"{name}: {server.describe()}")
+                asyncio.run(self.load(server, requests, options['warmup'], 1))
+                for concurrency in options['concurrency']:
+                    result = {'server': name, 'concurrency': concurrency, **asyncio.run(self.measure(server, requests, concurrency))}
+                    results.append(result)
+                    self.stdout.write(self.format_row(result))
+
+        if options['output']:
+            report = {
+                'meta': {
+                    'at': timezone.now().isoformat(),
+                    'database': connection.vendor,
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'cpus': os.cpu_count(),
+                    'workers': options['workers'],
+                    'threads': options['threads'],
+                    'duration': options['duration'],
+                    'endpoints': options['endpoints'],
+                },
+                'results': results,
+            }
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+
+    def build_requests(self):
+        options = self.options
+        users = MyUser.objects.filter(username__startswith=options['prefix'], private=False)
+        viewer_ids = list(users.filter(following_count__gt=0).order_by('pk').values_list('pk', flat=True))
+        if not viewer_ids:
+            raise CommandError("No benchmark users found; run seed_bench first.")
+        viewers = MyUser.objects.filter(pk__in=self.rng.sample(viewer_ids, min(options['viewers'], len(viewer_ids))))
+        tokens = [str(RefreshToken.for_user(viewer).access_token) for viewer in viewers]
+        usernames = list(users.order_by('-follower_count').values_list('username', flat=True)[:200])
+        post_ids = list(Post.objects.filter(user__private=False).order_by('-like_count').values_list('pk', flat=True)[:200])
+
+        paths = {
+            'feed': lambda: '/api/feed/?comments=2',
+            'discover': lambda: '/api/discover/?comments=2',
+            'post': lambda: f'/api/post/{self.rng.choice(post_ids)}/',
+            'profile': lambda: f'/api/user/{self.rng.choice(usernames)}/',
+            'search': lambda: f'/api/search-users/?q={self.rng.choice(usernames)[:4]}',
+            'notifications': lambda: '/api/notifications/',
+        }
+        # A fixed pool of requests, so every server sees the same mix.
+        return [
+            (paths[self.rng.choice(options['endpoints'])](), self.rng.choice(tokens))
+            for _ in range(2000)
+        ]
+
+    async def load(self, server, requests, duration, concurrency):
+        deadline = time.monotonic() + duration
+        latencies, statuses, failures = [], {}, [0]
+        clients = [
+            asyncio.create_task(self.client(server.port, requests, deadline, latencies, statuses, failures))
+            for _ in range(concurrency)
+        ]
+        await asyncio.gather(*clients)
+        return latencies, statuses, failures[0]
+
+    async def measure(self, server, requests, concurrency):
+        sampler = asyncio.create_task(server.sample_memory())
+        start = time.monotonic()
+        latencies, statuses, failures = await self.load(server, requests, self.options['duration'], concurrency)
+        elapsed = time.monotonic() - start
+        sampler.cancel()
+        pss, threads = server.memory_peak()
+        ok = statuses.get(200, 0) + statuses.get(304, 0)
+        return {
+            'requests_per_second': round(ok / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50), 2) if latencies else None,
+            'p95_ms': round(percentile(latencies, 95), 2) if latencies else None,
+            'p99_ms': round(percentile(latencies, 99), 2) if latencies else None,
+            'mean_ms': round(statistics.fmean(latencies), 2) if latencies else None,
+            'statuses': {str(code): count for code, count in sorted(statuses.items())},
+            'failures': failures,
+            'peak_memory_mb': round(pss / 1024, 1),
+            'peak_threads': threads,
+        }
+
+    async def client(self, port, requests, deadline, latencies, statuses, failures):
+        stream = None
+        while time.monotonic() < deadline:
+            path, token = self.rng.choice(requests)
+            message = (
+                f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n"
+                f"Cookie: access_token={token}\r\nAccept: application/json\r\n\r\n"
+            ).encode()
+            start = time.perf_counter()
+            try:
+                if stream is None:
+                    stream = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), self.options['timeout'])
+                code, keep_alive = await asyncio.wait_for(exchange(*stream, message), self.options['timeout'])
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                failures[0] += 1
+                keep_alive = False
+            else:
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[code] = statuses.get(code, 0) + 1
+            if not keep_alive and stream is not None:
+                stream[1].close()
+                stream = None
+        if stream is not None:
+            stream[1].close()
+
+    def format_row(self, result):
+        errors = sum(count for code, count in result['statuses'].items() if code not in ('200', '304')) + result['failures']
+        return (
+            f"  {result['server']:10} c={result['concurrency']:<5} {result['requests_per_second']:8.1f} req/s  "
+            f"p50 {result['p50_ms'] or 0:8.1f} ms  p95 {result['p95_ms'] or 0:8.1f} ms  p99 {result['p99_ms'] or 0:8.1f} ms  "
+            f"mem {result['peak_memory_mb']:7.1f} MB  threads {result['peak_threads']:4}  errors {errors}"
+        )
+
+async def exchange(reader, writer, message):
+    """Send one request and read the whole response; returns the status and whether the connection stays open."""
+    writer.write(message)
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise asyncio.IncompleteReadError(b'', None)
+    code = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip().lower()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()
+        return code, False
+    return code, headers.get('connection') != 'close'
+
+class Server:
+    """One server mode running in its own process group, with memory read from /proc."""
+
+    def __init__(self, name, options):
+        self.name = name
+        self.options = options
+        self.port = options['port']
+        self.process = None
+        self.peak_pss = 0
+        self.peak_threads = 0
+
+    def command(self):
+        kind, _ = SERVERS[self.name]
+        workers, threads = str(self.options['workers']), self.options['threads']
+        bind = f'127.0.0.1:{self.port}'
+        if kind == 'gunicorn':
+            command = [sys.executable, '-m', 'gunicorn', 'backend.wsgi:application', '--bind', bind, '--workers', workers]
+            if threads > 1:
+                command += ['--worker-class', 'gthread', '--threads', str(threads)]
+            return command
+        return [
+            sys.executable, '-m', 'uvicorn', 'backend.asgi:application', '--host', '127.0.0.1',
+            '--port', str(self.port), '--workers', workers, '--no-access-log', '--log-level', 'warning',
+        ]
+
+    def describe(self):
+        return ' '.join(self.command()[2:])
+
+    def __enter__(self):
+        env = {**os.environ, **SERVERS[self.name][1], 'SERVER_TIMING': '0'}
+        env['DJANGO_ALLOWED_HOSTS'] = ','.join(filter(None, [env.get('DJANGO_ALLOWED_HOSTS'), '127.0.0.1']))
+        self.process = subprocess.Popen(
+            self.command(), cwd=settings.BASE_DIR, env=env, start_new_session=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError(f"{self.name} exited: {self.process.stderr.read().decode()[-2000:]}")
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.stop()
+        raise CommandError(f"{self.name} did not start listening on port {self.port}")
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stop(self):
+        if self.process.poll() is None:
+            os.killpg(self.process.pid, signal.SIGTERM)
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                os.killpg(self.process.pid, signal.SIGKILL)
+                self.process.wait()
+
+    async def sample_memory(self):
+        self.peak_pss = self.peak_threads = 0
+        while True:
+            pss = threads = 0
+            for pid in process_tree(self.process.pid):
+                usage = process_usage(pid)
+                pss += usage[0]
+                threads += usage[1]
+            self.peak_pss = max(self.peak_pss, pss)
+            self.peak_threads = max(self.peak_threads, threads)
+            await asyncio.sleep(0.25)
+
+    def memory_peak(self):
+        return self.peak_pss, self.peak_threads
+
+def process_tree(root):
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    tree, stack = [], [root]
+    while stack:
+        pid = stack.pop()
+        tree.append(pid)
+        stack.extend(children.get(pid, []))
+    return tree
+
+def process_usage(pid):
+    """``(kB, threads)`` for one process; PSS, so pages the workers share with the master count once."""
+    memory = threads = 0
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    memory = int(line.split()[1])
+                elif line.startswith('Threads:'):
+                    threads = int(line.split()[1])
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    memory = int(line.split()[1])
+                    break
+    except (OSError, ValueError):
+        pass
+    return memory, threads
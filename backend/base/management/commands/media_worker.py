@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from base.media import run_batch
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = "Delete media files queued for removal, such as those left behind by deleted accounts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--max-attempts', type=int, default=5)
+        parser.add_argument('--interval', type=float, default=10.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                processed = run_batch(options['batch_size'], options['max_attempts'])
+            except Exception:
+                logger.exception("Media batch failed")
+                processed = 0
+            if processed:
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,48 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from base.jobs import run_batch
+from base.stream import LocalBackend, prune_stream_events
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = "Drain the notification job queue, creating notifications in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--max-attempts', type=int, default=5)
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty.")
+        parser.add_argument('--prune-interval', type=float, default=30.0,
+                            help="Seconds between deletions of stream events no stream will read again.")
+
+    def handle(self, *args, **options):
+        if issubclass(import_string(settings.NOTIFICATION_STREAM_BACKEND), LocalBackend):
+            raise CommandError(
+                "LocalBackend only reaches streams in this process, so nothing the worker creates would be pushed; "
+                "set NOTIFICATION_STREAM_BACKEND to base.stream.DatabaseBackend."
+            )
+        pruned_at = 0
+        while True:
+            try:
+                processed = run_batch(options['batch_size'], options['max_attempts'])
+            except Exception:
+                logger.exception("Notification batch failed")
+                processed = 0
+            if time.monotonic() - pruned_at >= options['prune_interval']:
+                try:
+                    prune_stream_events()
+                except Exception:
+                    logger.exception("Pruning stream events failed")
+                pruned_at = time.monotonic()
+            if processed:
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from base.counters import recount_posts, recount_comments, recount_users
+from base.models import MyUser, Post, Comment
+
+class Command(BaseCommand):
+    help = "Recompute the stored like/comment/post/follower counters from the source tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model, recount in (
+            (MyUser, recount_users),
+            (Post, recount_posts),
+            (Comment, recount_comments),
+        ):
+            updated = 0
+            last_id = 0
+            while True:
+                ids = list(
+                    model.objects.filter(pk__gt=last_id)
+                    .order_by('pk')
+                    .values_list('pk', flat=True)[:batch_size]
+                )
+                if not ids:
+                    break
+                updated += recount(model.objects.filter(pk__gte=ids[0], pk__lte=ids[-1]))
+                last_id = ids[-1]
+            self.stdout.write(f"{model.__name__}: recounted {updated} rows")
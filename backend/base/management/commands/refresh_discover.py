@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from base.discover import refresh, rebuild
+
+class Command(BaseCommand):
+    help = "Rescore Discover posts whose likes or comments changed and drop posts outside the window."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Rescore every post in the window.")
+        parser.add_argument('--interval', type=float, default=0, help="Keep running, refreshing every N seconds.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if options['rebuild']:
+            self.stdout.write(f"Rebuilt {rebuild(batch_size)} ranks")
+
+        while True:
+            refreshed = refresh(batch_size)
+            if refreshed:
+                self.stdout.write(f"Refreshed {refreshed} ranks")
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
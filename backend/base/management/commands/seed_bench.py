@@ -0,0 +1,231 @@
+import itertools
+import random
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from base.counters import CommentLike, PostLike
+from base.graph import Follow
+from base.jobs import group_key
+from base.models import MyUser, Post, Comment, FollowRequest, Notification, NotificationActor, TimelineEntry
+
+WORDS = (
+    'toki', 'pona', 'jan', 'lipu', 'sina', 'mi', 'moku', 'tomo', 'suli', 'lili',
+    'musi', 'pali', 'lukin', 'kama', 'tawa', 'sona', 'olin', 'suno', 'mun', 'telo',
+)
+
+class Command(BaseCommand):
+    help = "Fill the database with a synthetic social graph for benchmarking."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--follows', type=float, default=20, help="Mean accounts followed per user.")
+        parser.add_argument('--posts', type=float, default=5, help="Mean posts per user.")
+        parser.add_argument('--likes', type=float, default=8, help="Mean likes per post.")
+        parser.add_argument('--comments', type=float, default=1.5, help="Mean comments per post.")
+        parser.add_argument('--private', type=float, default=0.1, help="Share of private accounts.")
+        parser.add_argument('--mentions', type=float, default=0.1, help="Share of posts and comments mentioning someone.")
+        parser.add_argument('--alpha', type=float, default=1.0, help="Zipf exponent of account popularity.")
+        parser.add_argument('--days', type=int, default=settings.DISCOVER_WINDOW_DAYS)
+        parser.add_argument('--prefix', default='bench')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--flush', action='store_true', help="Delete earlier users with the same prefix first.")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+
+        if options['flush']:
+            deleted, _ = MyUser.objects.filter(username__startswith=options['prefix']).delete()
+            self.stdout.write(f"Deleted {deleted} rows from an earlier run")
+
+        self.create_users()
+        # Popularity rank is independent of signup order, so the most
+        # followed accounts are spread across the id range.
+        ranked = self.user_ids[:]
+        self.rng.shuffle(ranked)
+        self.ranked = ranked
+        self.cum_weights = list(itertools.accumulate(1 / (rank + 1) ** options['alpha'] for rank in range(len(ranked))))
+
+        self.create_follows()
+        self.create_content()
+
+        call_command('recount', batch_size=5000, stdout=self.stdout)
+        call_command('refresh_discover', rebuild=True, stdout=self.stdout)
+
+    def popular(self, k):
+        return self.rng.choices(self.ranked, cum_weights=self.cum_weights, k=k)
+
+    def count(self, mean):
+        return int(self.rng.expovariate(1 / mean)) if mean > 0 else 0
+
+    def text(self, max_words):
+        words = self.rng.choices(WORDS, k=self.rng.randint(3, max_words))
+        if self.rng.random() < self.options['mentions']:
+            words.insert(self.rng.randrange(len(words) + 1), '@' + self.usernames[self.popular(1)[0]])
+        return ' '.join(words)
+
+    def mentions(self, text, actor_id, verb, post_id, created_at):
+        return [
+            (Notification(
+                recipient_id=self.user_ids_by_name[word[1:]], actor_id=actor_id, verb=verb,
+                target_post_id=post_id, read=self.rng.random() < 0.7,
+            ), created_at)
+            for word in text.split()
+            if word.startswith('@') and self.user_ids_by_name.get(word[1:], actor_id) != actor_id
+        ]
+
+    def backdate(self, model, rows):
+        """Insert ``(obj, created_at)`` pairs; auto_now_add stamps them on insert, so the times go in afterwards."""
+        objs = model.objects.bulk_create([obj for obj, _ in rows], batch_size=self.batch_size)
+        for obj, (_, created_at) in zip(objs, rows):
+            obj.created_at = created_at
+        model.objects.bulk_update(objs, ['created_at'], batch_size=self.batch_size)
+        return objs
+
+    def moment_after(self, start):
+        return start + (self.now - start) * self.rng.random()
+
+    def aggregated(self, verb, actions):
+        """Grouped notifications for ``(recipient_id, actor_id, post_id, moment)`` actions, as jobs.aggregate leaves them."""
+        groups = {}
+        for recipient_id, actor_id, post_id, moment in sorted(actions, key=lambda action: action[3]):
+            key = group_key(recipient_id, verb, post_id, moment)
+            groups.setdefault(key, (recipient_id, post_id, []))[2].append((actor_id, moment))
+        notifications = self.backdate(Notification, [
+            (Notification(
+                recipient_id=recipient_id, actor_id=actors[-1][0], verb=verb, target_post_id=post_id,
+                group_key=key, actor_count=len(actors), read=self.rng.random() < 0.7,
+                recent_actors=[actor_id for actor_id, _ in reversed(actors[-Notification.RECENT_ACTORS:])],
+            ), actors[0][1])
+            for key, (recipient_id, post_id, actors) in groups.items()
+        ])
+        NotificationActor.objects.bulk_create([
+            NotificationActor(notification=notification, actor_id=actor_id)
+            for notification, (_, _, actors) in zip(notifications, groups.values())
+            for actor_id, _ in actors
+        ], batch_size=self.batch_size)
+        return notifications
+
+    def fan_out(self, posts):
+        """Timeline rows for a batch of posts, as the post views would have written them."""
+        followers = {}
+        author_ids = {post.user_id for post in posts}
+        for author_id, follower_id in Follow.objects.filter(from_myuser__in=author_ids).values_list('from_myuser', 'to_myuser'):
+            followers.setdefault(author_id, []).append(follower_id)
+        entries = []
+        for post in posts:
+            owners = followers.get(post.user_id, [])
+            if len(owners) >= settings.TIMELINE_FANOUT_LIMIT:
+                owners = []
+            entries += [TimelineEntry(owner_id=owner_id, post_id=post.pk, created_at=post.created_at) for owner_id in [post.user_id, *owners]]
+        TimelineEntry.objects.bulk_create(entries, batch_size=self.batch_size, ignore_conflicts=True)
+
+    def create_users(self):
+        prefix, total = self.options['prefix'], self.options['users']
+        password = make_password('bench')
+        self.user_ids, self.usernames, self.user_ids_by_name, self.private = [], {}, {}, set()
+        for start in range(0, total, self.batch_size):
+            users = MyUser.objects.bulk_create([
+                MyUser(
+                    username=f'{prefix}{i}',
+                    email=f'{prefix}{i}@bench.invalid',
+                    first_name=' '.join(self.rng.choices(WORDS, k=2)),
+                    password=password,
+                    private=self.rng.random() < self.options['private'],
+                )
+                for i in range(start, min(start + self.batch_size, total))
+            ])
+            for user in users:
+                self.user_ids.append(user.pk)
+                self.usernames[user.pk] = user.username
+                self.user_ids_by_name[user.username] = user.pk
+                if user.private:
+                    self.private.add(user.pk)
+        self.stdout.write(f"Created {total} users, {len(self.private)} private")
+
+    def create_follows(self):
+        edges = requests = 0
+        rows, pending, follows = [], [], []
+        start = self.now - timezone.timedelta(days=self.options['days'])
+        for follower_id in self.user_ids:
+            targets = set(self.popular(self.count(self.options['follows']))) - {follower_id}
+            for target_id in targets:
+                # Some attempts on private accounts are still waiting for an answer.
+                if target_id in self.private and self.rng.random() < 0.2:
+                    pending.append(FollowRequest(requester_id=follower_id, target_id=target_id))
+                else:
+                    rows.append(Follow(from_myuser_id=target_id, to_myuser_id=follower_id))
+                    follows.append((target_id, follower_id, None, self.moment_after(start)))
+            if len(rows) >= self.batch_size:
+                edges += self.flush(Follow, rows)
+            if len(pending) >= self.batch_size:
+                requests += self.flush(FollowRequest, pending)
+        edges += self.flush(Follow, rows)
+        requests += self.flush(FollowRequest, pending)
+        notifications = self.aggregated(Notification.VERB_FOLLOW, follows)
+        self.stdout.write(
+            f"Created {edges} follows, {requests} pending follow requests and {len(notifications)} follow notifications"
+        )
+
+    def flush(self, model, rows):
+        count = len(rows)
+        if rows:
+            model.objects.bulk_create(rows, batch_size=self.batch_size, ignore_conflicts=True)
+            rows.clear()
+        return count
+
+    def create_content(self):
+        totals = dict.fromkeys(('posts', 'likes', 'comments', 'notifications'), 0)
+        window = self.options['days'] * 86400
+        step = max(self.batch_size // 4, 1)
+        for start in range(0, len(self.user_ids), step):
+            with transaction.atomic():
+                posts = self.backdate(Post, [
+                    (Post(user_id=author_id, text=self.text(25)),
+                     self.now - timezone.timedelta(seconds=self.rng.uniform(0, window)))
+                    for author_id in self.user_ids[start:start + step]
+                    for _ in range(self.count(self.options['posts']))
+                ])
+
+                self.fan_out(posts)
+
+                # Like notifications are grouped the way the notification
+                # worker groups them; comments notify no one but the mentioned.
+                likes, liked, comments, notifications = [], [], [], []
+                for post in posts:
+                    notifications += self.mentions(post.text, post.user_id, Notification.VERB_MENTION_POST, post.pk, post.created_at)
+                    for liker_id in set(self.popular(self.count(self.options['likes']))):
+                        likes.append(PostLike(post_id=post.pk, myuser_id=liker_id))
+                        liked.append((post.user_id, liker_id, post.pk, self.moment_after(post.created_at)))
+                    for commenter_id in self.popular(self.count(self.options['comments'])):
+                        text = self.text(12)
+                        created_at = self.moment_after(post.created_at)
+                        comments.append((Comment(post_id=post.pk, user_id=commenter_id, text=text), created_at))
+                        notifications += self.mentions(text, commenter_id, Notification.VERB_MENTION_COMMENT, post.pk, created_at)
+
+                PostLike.objects.bulk_create(likes, batch_size=self.batch_size, ignore_conflicts=True)
+                comments = self.backdate(Comment, comments)
+                comment_likes = [
+                    CommentLike(comment_id=comment.pk, myuser_id=liker_id)
+                    for comment in comments
+                    for liker_id in set(self.popular(self.count(self.options['likes'] / 4)))
+                ]
+                CommentLike.objects.bulk_create(comment_likes, batch_size=self.batch_size, ignore_conflicts=True)
+                self.backdate(Notification, notifications)
+                grouped = self.aggregated(Notification.VERB_LIKE, liked)
+
+            totals['posts'] += len(posts)
+            totals['likes'] += len(likes)
+            totals['comments'] += len(comments)
+            totals['notifications'] += len(notifications) + len(grouped)
+        self.stdout.write(
+            "Created {posts} posts, {likes} likes, {comments} comments and {notifications} notifications".format(**totals)
+        )
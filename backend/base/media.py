@@ -0,0 +1,94 @@
+import os
+import re
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import MyUser, MediaFile
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Matches names produced by profile_upload_path and post_upload_path, and the variants derived from them.
+OWNER_PATTERN = re.compile(r'^(?:profile|post)_(\d+)_')
+MEDIA_DIRS = ['profile_pictures', 'posts']
+
+def register_media(owner_id, *names):
+    names = [name for name in names if name]
+    if not names:
+        return
+    # An owner deleted while the file was being written gets it queued for removal straight away.
+    delete_after = None if MyUser.objects.filter(pk=owner_id).exists() else timezone.now()
+    MediaFile.objects.bulk_create(
+        [MediaFile(name=name, owner_id=owner_id, delete_after=delete_after) for name in names],
+        ignore_conflicts=True,
+    )
+
+def release_owner(owner_id):
+    MediaFile.objects.filter(owner_id=owner_id, delete_after__isnull=True).update(delete_after=timezone.now())
+    if settings.MEDIA_DELETE_EAGER:
+        with transaction.atomic():
+            process(list(MediaFile.objects.filter(owner_id=owner_id)))
+
+def process(files, max_attempts=5):
+    done, retry = [], []
+    for media in files:
+        try:
+            # Storage backends may keep their own rows; a failed delete must not poison the batch.
+            with transaction.atomic():
+                default_storage.delete(media.name)
+            done.append(media.pk)
+        except Exception:
+            logger.exception("Could not delete media file %s", media.name)
+            media.attempts += 1
+            media.delete_after = timezone.now() + timezone.timedelta(seconds=2 ** media.attempts)
+            retry.append(media)
+    MediaFile.objects.filter(pk__in=done).delete()
+    MediaFile.objects.bulk_update(retry, ['attempts', 'delete_after'])
+
+def run_batch(batch_size=200, max_attempts=5):
+    with transaction.atomic():
+        files = (
+            MediaFile.objects.filter(delete_after__lte=timezone.now(), attempts__lt=max_attempts)
+            .order_by('delete_after')
+        )
+        if connection.features.has_select_for_update_skip_locked:
+            files = files.select_for_update(skip_locked=True)
+        files = list(files[:batch_size])
+        if files:
+            process(files, max_attempts)
+    return len(files)
+
+def walk(directory):
+    if not default_storage.exists(directory):
+        return
+    subdirs, files = default_storage.listdir(directory)
+    for filename in files:
+        yield f"{directory}/{filename}"
+    for subdir in subdirs:
+        yield from walk(f"{directory}/{subdir}")
+
+def backfill(batch_size=1000):
+    """Register files already in storage, returning how many were found.
+
+    Files whose owner no longer exists are left over from earlier account
+    deletions and are queued for removal.
+    """
+    user_ids = set(MyUser.objects.values_list('pk', flat=True))
+    now = timezone.now()
+    pending, total = [], 0
+    for directory in MEDIA_DIRS:
+        for name in walk(directory):
+            match = OWNER_PATTERN.match(os.path.basename(name))
+            if not match:
+                continue
+            owner_id = int(match.group(1))
+            pending.append(MediaFile(name=name, owner_id=owner_id, delete_after=None if owner_id in user_ids else now))
+            if len(pending) >= batch_size:
+                total += len(MediaFile.objects.bulk_create(pending, ignore_conflicts=True))
+                pending = []
+    total += len(MediaFile.objects.bulk_create(pending, ignore_conflicts=True))
+    return total
@@ -0,0 +1,275 @@
+import contextvars
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .authenticate import user_cache
+from .caching import response_cache
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Wall time per request.', LATENCY_BUCKETS),
+    'http_request_db_seconds': ('Time spent in SQL per request.', LATENCY_BUCKETS),
+    'http_request_serialize_seconds': ('Time spent in serializers per request.', LATENCY_BUCKETS),
+    'http_request_queries': ('SQL queries per request.', QUERY_BUCKETS),
+}
+COUNTERS = {
+    'http_responses_total': 'Responses by status code.',
+    'auth_user_cache_hits_total': 'Authenticated user cache hits.',
+    'auth_user_cache_misses_total': 'Authenticated user cache misses.',
+    'response_cache_hits_total': 'Response cache hits.',
+    'response_cache_misses_total': 'Response cache misses.',
+}
+
+_timings = contextvars.ContextVar('timings', default=None)
+
+class Timings:
+    """What one request spent, fed by ``time_query`` and ``measure``."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.db = 0.0
+        self.queries = 0
+        self.phases = {}
+        self.active = set()
+
+    def add_query(self, spent):
+        # Async views can run a request's queries on several threads at once.
+        with self.lock:
+            self.db += spent
+            self.queries += 1
+
+    def header(self, total):
+        entries = [
+            f'total;dur={total * 1000:.1f}',
+            f'db;dur={self.db * 1000:.1f};desc="queries={self.queries}"',
+        ]
+        entries += [f'{phase};dur={spent * 1000:.1f}' for phase, spent in self.phases.items()]
+        return ', '.join(entries)
+
+def time_query(execute, sql, params, many, context):
+    """Execute wrapper on every connection; the request it counts for is found through the context."""
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add_query(time.perf_counter() - start)
+
+def install_query_timer(sender, connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+@contextmanager
+def measure(phase):
+    """Add the time spent in the block to ``phase`` of the current request; nested blocks count once."""
+    timings = _timings.get()
+    if timings is None or phase in timings.active:
+        yield
+        return
+    timings.active.add(phase)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.phases[phase] = timings.phases.get(phase, 0.0) + time.perf_counter() - start
+        timings.active.discard(phase)
+
+def alive(path):
+    """Whether the worker that wrote ``path`` is still running."""
+    try:
+        pid = int(os.path.basename(path).split('-', 1)[0])
+    except ValueError:
+        # Not written by a worker, e.g. from before files carried a start time.
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class Registry:
+    """Histograms and counters for this worker.
+
+    Each worker writes its totals to METRICS_DIR at most every
+    METRICS_FLUSH_INTERVAL seconds, in a file named after its PID and start
+    time, and the metrics endpoint sums every file in there. Files of
+    workers that have exited are removed when they are collected, so the
+    directory stays as large as the pool; Prometheus reads the drop in the
+    totals as a counter reset. The workers are expected to share a host.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.flushed_at = 0.0
+        self.pid = None
+        self.path = None
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        key = (name, labels)
+        with self.lock:
+            counts, total = self.histograms.get(key) or ([0] * (len(buckets) + 1), 0.0)
+            counts[bisect_left(buckets, value)] += 1
+            self.histograms[key] = (counts, total + value)
+
+    def inc(self, name, labels, value=1):
+        with self.lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+    def record(self, view, method, status, total, timings):
+        labels = (('view', view), ('method', method))
+        self.observe('http_request_duration_seconds', labels, total)
+        self.observe('http_request_db_seconds', labels, timings.db)
+        self.observe('http_request_serialize_seconds', labels, timings.phases.get('serialize', 0.0))
+        self.observe('http_request_queries', labels, timings.queries)
+        self.inc('http_responses_total', labels + (('code', str(status)),))
+
+    def snapshot(self):
+        with self.lock:
+            histograms = [[name, list(labels), counts, total] for (name, labels), (counts, total) in self.histograms.items()]
+            counters = [[name, list(labels), value] for (name, labels), value in self.counters.items()]
+        for prefix, stats in (('auth_user_cache', user_cache.stats()), ('response_cache', response_cache.stats())):
+            counters.append([f'{prefix}_hits_total', [], stats['hits']])
+            counters.append([f'{prefix}_misses_total', [], stats['misses']])
+        return {'histograms': histograms, 'counters': counters}
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        if not settings.METRICS_DIR or (not force and now - self.flushed_at < settings.METRICS_FLUSH_INTERVAL):
+            return
+        self.flushed_at = now
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        path = self.file()
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(f'{path}.tmp', path)
+
+    def file(self):
+        """This worker's file, named on first use after each fork."""
+        pid = os.getpid()
+        if pid != self.pid:
+            self.pid = pid
+            self.path = os.path.join(settings.METRICS_DIR, f'{pid}-{time.time_ns()}.json')
+            # An older file with this PID belongs to a worker that has exited.
+            for stale in glob.glob(os.path.join(settings.METRICS_DIR, f'{pid}-*.json')):
+                remove(stale)
+        return self.path
+
+    def collect(self):
+        """Totals across every worker that has written to METRICS_DIR, or this one alone."""
+        if not settings.METRICS_DIR:
+            return [self.snapshot()]
+        self.flush(force=True)
+        snapshots = []
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+            if not alive(path):
+                remove(path)
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+registry = Registry()
+
+def format_labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+def render_prometheus(snapshots):
+    histograms = {}
+    counters = {}
+    for snapshot in snapshots:
+        for name, labels, counts, total in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged_counts, merged_total = histograms.get(key) or ([0] * len(counts), 0.0)
+            histograms[key] = ([a + b for a, b in zip(merged_counts, counts)], merged_total + total)
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for (metric, labels), (counts, total) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{format_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {total}')
+            lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+    for name, help_text in COUNTERS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f'{name}{format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+class MetricsMiddleware:
+    """Times every request, adds a Server-Timing header and feeds the registry."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = Timings()
+        token = _timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timings = Timings()
+        token = _timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    def finish(self, request, response, timings, total):
+        match = request.resolver_match
+        registry.record(match.view_name if match else 'unmatched', request.method, response.status_code, total, timings)
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = timings.header(total)
+        registry.flush()
+        return response
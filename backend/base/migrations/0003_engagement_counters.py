@@ -0,0 +1,71 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:13
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(queryset, field):
+    counted = queryset.order_by().values(field).annotate(n=Count('*')).values('n')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def populate_counters(apps, schema_editor):
+    MyUser = apps.get_model('base', 'MyUser')
+    Post = apps.get_model('base', 'Post')
+    Comment = apps.get_model('base', 'Comment')
+    Follow = MyUser.followers.through
+
+    Post.objects.update(
+        like_count=count_subquery(Post.likes.through.objects.filter(post=OuterRef('pk')), 'post'),
+        comment_count=count_subquery(Comment.objects.filter(post=OuterRef('pk')), 'post'),
+    )
+    Comment.objects.update(
+        like_count=count_subquery(Comment.likes.through.objects.filter(comment=OuterRef('pk')), 'comment'),
+    )
+    MyUser.objects.update(
+        post_count=count_subquery(Post.objects.filter(user=OuterRef('pk')), 'user'),
+        follower_count=count_subquery(Follow.objects.filter(from_myuser=OuterRef('pk')), 'from_myuser'),
+        following_count=count_subquery(Follow.objects.filter(to_myuser=OuterRef('pk')), 'to_myuser'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0002_remove_notification_target_comment_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='like_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='myuser',
+            name='follower_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='myuser',
+            name='following_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='myuser',
+            name='post_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
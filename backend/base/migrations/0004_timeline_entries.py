@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0003_engagement_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='base.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', '-created_at'], name='base_timeli_owner_i_e4a139_idx')],
+                'unique_together': {('owner', 'post')},
+            },
+        ),
+    ]
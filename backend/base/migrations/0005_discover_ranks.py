@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0004_timeline_entries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiscoverRank',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='discover_rank', serialize=False, to='base.post')),
+                ('score', models.FloatField(db_index=True)),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('dirty', models.BooleanField(default=False)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('dirty', True)), fields=['dirty'], name='discoverrank_dirty_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:18
+
+from django.db import migrations, models
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for column in ('username', 'first_name'):
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS myuser_{column}_trgm_idx '
+            f'ON base_myuser USING gin (UPPER("{column}"::text) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in ('username', 'first_name'):
+        schema_editor.execute(f'DROP INDEX IF EXISTS myuser_{column}_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('base', '0005_discover_ranks'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='myuser',
+            index=models.Index(fields=['-follower_count', '-id'], name='myuser_popularity_idx'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
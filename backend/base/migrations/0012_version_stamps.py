@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0011_media_files'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myuser',
+            name='version',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='version',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
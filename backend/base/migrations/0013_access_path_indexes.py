@@ -0,0 +1,46 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0012_version_stamps'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='discoverrank',
+            name='score',
+            field=models.FloatField(),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created_at', '-id'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='discoverrank',
+            index=models.Index(fields=['-score', '-created_at'], name='discoverrank_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='followrequest',
+            index=models.Index(fields=['target', '-created_at'], name='followrequest_target_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', '-id'], name='notification_recipient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('read', False)), fields=['recipient'], name='notification_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationactor',
+            index=models.Index(fields=['actor', '-id'], name='notificationactor_actor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['user', '-created_at'], name='post_user_created_idx'),
+        ),
+    ]
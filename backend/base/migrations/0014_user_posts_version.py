@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0013_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myuser',
+            name='posts_version',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
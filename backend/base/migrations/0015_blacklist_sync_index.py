@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:52
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0014_user_posts_version'),
+        ('token_blacklist', '0012_alter_outstandingtoken_user'),
+    ]
+
+    # The blacklist filter syncs by (blacklisted_at, id); the table belongs to
+    # simplejwt, so the index is created here.
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX blacklisted_at_id_idx ON token_blacklist_blacklistedtoken (blacklisted_at, id)',
+            'DROP INDEX blacklisted_at_id_idx',
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0015_blacklist_sync_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchIndexVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
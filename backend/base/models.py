@@ -1,5 +1,7 @@
 import os, uuid
 from django.db import models
+from django.db.models import BooleanField, Count, Exists, F, IntegerField, OuterRef, Subquery, Value, Window
+from django.db.models.functions import Coalesce, RowNumber
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 
@@ -20,15 +22,27 @@ class MyUser(AbstractUser):
     email = models.EmailField(unique=True)
     bio = models.TextField(max_length=250, blank=True)
     profile_picture = models.ImageField(upload_to=profile_upload_path, blank=True, null=True)
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False)
     followers = models.ManyToManyField('self', symmetrical=False, related_name='following', blank=True)
     private = models.BooleanField(default=False)
 
+    post_count = models.IntegerField(default=0, editable=False)
+    follower_count = models.IntegerField(default=0, editable=False)
+    following_count = models.IntegerField(default=0, editable=False)
+    # Bumped by every write that changes the serialized profile; feeds conditional GETs.
+    version = models.IntegerField(default=0, editable=False)
+    # Bumped whenever one of the user's posts changes; validates their post list.
+    posts_version = models.IntegerField(default=0, editable=False)
+
     notify_follow = models.BooleanField(default=True)
     notify_like = models.BooleanField(default=True)
     notify_comment = models.BooleanField(default=True)
     notify_mention = models.BooleanField(default=True)
     notify_fr_accepted = models.BooleanField(default=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [models.Index(fields=['-follower_count', '-id'], name='myuser_popularity_idx')]
+
     def __str__(self):
         return self.username
 
@@ -43,17 +57,53 @@ class PendingRegistration(models.Model):
     def __str__(self):
         return f"PendingRegistration({self.username}, {self.email})"
 
+def count_subquery(queryset, field):
+    counted = queryset.order_by().values(field).annotate(n=Count('*')).values('n')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+class PostQuerySet(models.QuerySet):
+    def with_engagement(self, viewer):
+        if viewer is not None and viewer.is_authenticated:
+            likes = Post.likes.through.objects.filter(post=OuterRef('pk'), myuser=viewer)
+            is_liked = Exists(likes)
+        else:
+            is_liked = Value(False, output_field=BooleanField())
+        return self.select_related('user').annotate(is_liked=is_liked)
+
 class Post(models.Model):
     user = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='posts')
     image = models.ImageField(upload_to=post_upload_path, blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     text = models.TextField(max_length=1000, blank=False)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     likes = models.ManyToManyField(MyUser, related_name='liked_posts', blank=True)
     edited = models.BooleanField(default=False)
 
+    like_count = models.IntegerField(default=0, editable=False)
+    comment_count = models.IntegerField(default=0, editable=False)
+    version = models.IntegerField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['user', '-created_at'], name='post_user_created_idx')]
+
     def __str__(self):
         return f"{self.user.username}'s post"
 
+class CommentQuerySet(models.QuerySet):
+    def with_engagement(self, viewer):
+        if viewer is not None and viewer.is_authenticated:
+            likes = Comment.likes.through.objects.filter(comment=OuterRef('pk'), myuser=viewer)
+            is_liked = Exists(likes)
+        else:
+            is_liked = Value(False, output_field=BooleanField())
+        return self.select_related('user').annotate(is_liked=is_liked)
+
+    def latest_per_post(self, post_ids, limit):
+        rank = Window(RowNumber(), partition_by=[F('post_id')], order_by=[F('created_at').desc(), F('id').desc()])
+        return self.filter(post_id__in=post_ids).annotate(rank=rank).filter(rank__lte=limit).order_by('post_id', 'rank')
+
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     user = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='comments')
@@ -62,9 +112,43 @@ class Comment(models.Model):
     likes = models.ManyToManyField(MyUser, related_name='liked_comments', blank=True)
     edited = models.BooleanField(default=False)
 
+    like_count = models.IntegerField(default=0, editable=False)
+
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['post', '-created_at', '-id'], name='comment_post_created_idx')]
+
     def __str__(self):
         return f"{self.user.username}'s comment on post/{self.post.id}"
 
+class DiscoverRank(models.Model):
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='discover_rank')
+    score = models.FloatField()
+    created_at = models.DateTimeField(db_index=True)
+    dirty = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', '-created_at'], name='discoverrank_order_idx'),
+            models.Index(fields=['dirty'], condition=models.Q(dirty=True), name='discoverrank_dirty_idx'),
+        ]
+
+    def __str__(self):
+        return f"DiscoverRank(post={self.post_id} score={self.score})"
+
+class TimelineEntry(models.Model):
+    owner = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('owner', 'post')
+        indexes = [models.Index(fields=['owner', '-created_at'])]
+
+    def __str__(self):
+        return f"TimelineEntry(owner={self.owner_id} post={self.post_id})"
+
 class FollowRequest(models.Model):
     requester = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='sent_follow_requests')
     target = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='received_follow_requests')
@@ -72,6 +156,7 @@ class FollowRequest(models.Model):
 
     class Meta:
         unique_together = ('requester', 'target')
+        indexes = [models.Index(fields=['target', '-created_at'], name='followrequest_target_idx')]
 
     def __str__(self):
         return f"FollowRequest(from={self.requester.username} to={self.target.username})"
@@ -99,6 +184,119 @@ class Notification(models.Model):
     target_post_id = models.IntegerField(null=True, blank=True)
     read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+
+    AGGREGATED_VERBS = (VERB_FOLLOW, VERB_LIKE)
+    RECENT_ACTORS = 3
+
+    group_key = models.CharField(max_length=100, unique=True, null=True, blank=True, editable=False)
+    actor_count = models.IntegerField(default=1)
+    recent_actors = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', '-id'], name='notification_recipient_idx'),
+            models.Index(fields=['recipient'], condition=models.Q(read=False), name='notification_unread_idx'),
+        ]
+
+    def __str__(self):
+        return f"Notification({self.actor.username} {self.verb} → {self.recipient.username})"
+
+class NotificationActor(models.Model):
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='actor_links')
+    actor = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='notification_links')
+
+    class Meta:
+        unique_together = ('notification', 'actor')
+        indexes = [models.Index(fields=['actor', '-id'], name='notificationactor_actor_idx')]
+
+    def __str__(self):
+        return f"NotificationActor(notification={self.notification_id} actor={self.actor_id})"
+
+class StreamEvent(models.Model):
+    recipient = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='stream_events')
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"StreamEvent({self.recipient_id} {self.payload})"
+
+class ImageJob(models.Model):
+    KIND_POST    = 'post'
+    KIND_PROFILE = 'profile'
+
+    KIND_CHOICES = [
+        (KIND_POST,    'Post image'),
+        (KIND_PROFILE, 'Profile picture'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    source = models.CharField(max_length=255)
+    attempts = models.IntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    failed = models.BooleanField(default=False)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run_after'], condition=models.Q(failed=False), name='imagejob_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"ImageJob({self.kind} {self.object_id} {self.source})"
+
+class MediaFile(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    # Not a foreign key: rows have to outlive the account so its files can be removed afterwards.
+    owner_id = models.BigIntegerField(db_index=True)
+    delete_after = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['delete_after'], condition=models.Q(delete_after__isnull=False), name='mediafile_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"MediaFile({self.owner_id} {self.name})"
+
+class NotificationJob(models.Model):
+    KIND_NOTIFY   = 'notify'
+    KIND_MENTIONS = 'mentions'
+
+    KIND_CHOICES = [
+        (KIND_NOTIFY,   'Notify'),
+        (KIND_MENTIONS, 'Mentions'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    payload = models.JSONField()
+    key = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    attempts = models.IntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    failed = models.BooleanField(default=False)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run_after'], condition=models.Q(failed=False), name='notificationjob_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"NotificationJob({self.kind} {self.key})"
+
+class SearchIndexVersion(models.Model):
+    """One row, bumped whenever a user's searchable fields change.
+
+    Each process's in-memory search index compares it with the version it
+    was built from, so changes made through other processes reach it.
+    """
+
+    version = models.BigIntegerField(default=0)
 
     def __str__(self):
-        return f"Notification({self.actor.username} {self.verb} → {self.recipient.username})"
\ No newline at end of file
+        return f"SearchIndexVersion({self.version})"
\ No newline at end of file
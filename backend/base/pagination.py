@@ -1,9 +1,19 @@
-from rest_framework.pagination import CursorPagination, PageNumberPagination
+from base64 import b64decode, b64encode
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 class PostCursorPagination(CursorPagination):
     page_size = 5
     ordering = ['-created_at']
 
+class FeedCursorPagination(CursorPagination):
+    page_size = 5
+    ordering = ['-feed_at']
+
 class CommentCursorPagination(CursorPagination):
     page_size = 10
     ordering = ['-created_at']
@@ -11,7 +21,7 @@ class CommentCursorPagination(CursorPagination):
 
 class DiscoverCursorPagination(CursorPagination):
     page_size = 5
-    ordering = ['-score', '-created_at']
+    ordering = ['-score', '-ranked_at']
 
 class FollowRequestPagination(CursorPagination):
     page_size = 10
@@ -20,4 +30,58 @@ class FollowRequestPagination(CursorPagination):
 class NotificationPagination(PageNumberPagination):
     page_size = 10
     ordering = ['-created_at']
-    max_page_size = 100
\ No newline at end of file
+    max_page_size = 100
+
+class PopularityKeysetPagination(BasePagination):
+    """Keyset pagination over users by stored (follower_count, id), most popular first.
+
+    Unlike CursorPagination it never falls back to an offset, so pages deep
+    inside a run of equal follower counts cost the same as the first.
+    """
+
+    page_size = 20
+    pinned_size = 20
+    cursor_query_param = 'cursor'
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            count, pk = b64decode(encoded.encode('ascii')).decode('ascii').split(':')
+            return int(count), int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound("Invalid cursor")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is not None:
+            count, pk = self.cursor
+            queryset = queryset.filter(Q(follower_count__lt=count) | Q(follower_count=count, pk__lt=pk))
+        page = list(queryset.order_by('-follower_count', '-id')[:self.page_size + 1])
+        self.next_position = None
+        if len(page) > self.page_size:
+            page = page[:self.page_size]
+            self.next_position = (page[-1].follower_count, page[-1].pk)
+        return page
+
+    def paginate_ranked(self, ranked, request):
+        """First page of an already ordered list of ``(follower_count, pk)`` pairs, as pks."""
+        self.request = request
+        self.cursor = None
+        page = ranked[:self.page_size + 1]
+        self.next_position = None
+        if len(page) > self.page_size:
+            page = page[:self.page_size]
+            self.next_position = page[-1]
+        return [pk for _, pk in page]
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        encoded = b64encode('{}:{}'.format(*self.next_position).encode('ascii')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
@@ -0,0 +1,178 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+STICKY_COOKIE = 'read_primary'
+
+class ReadState:
+    """Where one request's reads go: a replica until it writes, the primary after."""
+
+    def __init__(self, replicas=False):
+        self.replicas = replicas
+        self.wrote = False
+        self.alias = None
+
+    def alias_for_read(self):
+        if not self.replicas or self.wrote:
+            return DEFAULT_DB_ALIAS
+        # One replica per request, so its reads see a single point in time.
+        if self.alias is None:
+            healthy = replica_health.healthy()
+            self.alias = random.choice(healthy) if healthy else DEFAULT_DB_ALIAS
+        return self.alias
+
+_state = contextvars.ContextVar('read_state', default=None)
+
+@contextmanager
+def reading(replicas):
+    state = ReadState(replicas)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+class ReplicaHealth:
+    """Which replicas answer and keep up, rechecked every REPLICA_HEALTH_INTERVAL seconds."""
+
+    # Zero while the replica has replayed everything it received, so an idle
+    # primary does not look like lag; NULL when it is not a standby at all.
+    PG_LAG = """
+        SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.status = {}
+        self.checked_at = {}
+
+    def healthy(self):
+        now = time.monotonic()
+        due = []
+        with self.lock:
+            for alias in settings.DATABASE_REPLICAS:
+                if now - self.checked_at.get(alias, float('-inf')) >= settings.REPLICA_HEALTH_INTERVAL:
+                    self.checked_at[alias] = now
+                    due.append(alias)
+        for alias in due:
+            ok = self.check(alias)
+            with self.lock:
+                if ok and self.status.get(alias) is False:
+                    logger.warning("Replica %s is back", alias)
+                self.status[alias] = ok
+        with self.lock:
+            return [alias for alias in settings.DATABASE_REPLICAS if self.status.get(alias)]
+
+    def check(self, alias):
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                if connection.vendor != 'postgresql':
+                    cursor.execute('SELECT 1')
+                    return True
+                cursor.execute(self.PG_LAG)
+                lag = cursor.fetchone()[0]
+        except DatabaseError as exc:
+            logger.warning("Replica %s failed its health check, reading from the primary: %s", alias, exc)
+            connection.close()
+            return False
+        if lag is not None and lag > settings.REPLICA_MAX_LAG:
+            logger.warning("Replica %s is %.1fs behind, reading from the primary", alias, lag)
+            return False
+        return True
+
+    def reset(self):
+        with self.lock:
+            self.status.clear()
+            self.checked_at.clear()
+
+replica_health = ReplicaHealth()
+
+class ReplicaRouter:
+    """Reads go to a replica when the current request allows it; writes always go to the primary."""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        return state.alias_for_read() if state is not None else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+def replica_reads(view):
+    """Let a view that only reads use replicas even though it is not called with GET."""
+    view.replica_reads = True
+    return view
+
+class ReplicaMiddleware:
+    """Routes a request's reads to the replicas when it is safe to.
+
+    GETs and ``replica_reads`` views read from a replica. Once a user has
+    written, a short-lived cookie keeps their requests on the primary for
+    REPLICA_STICKY_SECONDS, longer than the replicas are allowed to lag, so
+    they read their own writes.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Django would otherwise run a sync process_view on a thread.
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        with reading(False) as state:
+            response = self.get_response(request)
+        return self.finish(request, response, state)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        with reading(False) as state:
+            response = await self.get_response(request)
+        return self.finish(request, response, state)
+
+    def finish(self, request, response, state):
+        # Only an actual write pins the user: a read-only POST such as a batch
+        # of GETs has nothing the replicas could be missing.
+        if state.wrote:
+            response.set_cookie(
+                STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, secure=True, samesite="None", path="/",
+            )
+        return response
+
+    def choose(self, request, view_func):
+        state = _state.get()
+        if state is not None and STICKY_COOKIE not in request.COOKIES:
+            state.replicas = request.method in SAFE_METHODS or getattr(view_func, 'replica_reads', False)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self.choose(request, view_func)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        self.choose(request, view_func)
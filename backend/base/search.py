@@ -0,0 +1,275 @@
+import heapq
+import itertools
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from .models import MyUser, SearchIndexVersion
+
+SHORT_QUERY_SCAN = 5000
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class PrefixMatches:
+    def __init__(self, ranges):
+        self.ranges = ranges
+
+    def __len__(self):
+        return sum(end - start for _, start, end in self.ranges)
+
+    def __iter__(self):
+        for sorted_list, start, end in self.ranges:
+            for i in range(start, end):
+                yield sorted_list[i][1]
+
+class TrigramIndex:
+    """In-process user search index for databases without pg_trgm.
+
+    Posting lists are append-only; entries left behind by edits and deletions
+    are filtered out when candidates are checked against ``users`` and dropped
+    on the next rebuild. Users added or removed while a rebuild reads the
+    table are kept in ``pending`` and replayed onto the new index when it is
+    swapped in.
+
+    Changes made in this process are applied in place. Those made in others
+    show up as a newer SearchIndexVersion, which starts a rebuild; searches
+    keep reading the previous index until it is swapped in.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = {}
+        self.grams = defaultdict(lambda: array('q'))
+        self.usernames = []
+        self.names = []
+        self.ranked = []
+        self.built_at = None
+        self.rebuilding = False
+        self.pending = None
+        self.version = None
+
+    @staticmethod
+    def rank_key(entry):
+        user_id, popularity = entry
+        return (-popularity, -user_id)
+
+    def build(self):
+        with self.lock:
+            self.pending = {}
+        try:
+            # Read before the rows, so a change committed in between is at
+            # worst rebuilt for again.
+            version = current_version()
+            users, grams = self.read()
+        except BaseException:
+            with self.lock:
+                self.pending = None
+            raise
+
+        usernames = sorted((username, user_id) for user_id, (username, _, _) in users.items())
+        names = sorted((name, user_id) for user_id, (_, name, _) in users.items() if name)
+        ranked = sorted(((user_id, pop) for user_id, (_, _, pop) in users.items()), key=self.rank_key)
+        with self.lock:
+            self.users, self.grams = users, grams
+            self.usernames, self.names, self.ranked = usernames, names, ranked
+            for user_id, entry in self.pending.items():
+                self.discard(user_id)
+                if entry is not None:
+                    self.insert(user_id, *entry)
+            self.pending = None
+            self.version = version
+            self.built_at = time.monotonic()
+
+    def read(self):
+        users = {}
+        grams = defaultdict(lambda: array('q'))
+        rows = MyUser.objects.values_list('pk', 'username', 'first_name', 'follower_count')
+        for user_id, username, first_name, popularity in rows.iterator(chunk_size=5000):
+            username, first_name = username.lower(), first_name.lower()
+            users[user_id] = (username, first_name, popularity)
+            for gram in trigrams(username) | trigrams(first_name):
+                grams[gram].append(user_id)
+        return users, grams
+
+    def rebuild_in_background(self):
+        try:
+            self.build()
+        finally:
+            self.rebuilding = False
+            connection.close()
+
+    def is_stale(self):
+        return (
+            self.built_at is None
+            or time.monotonic() - self.built_at > settings.USER_SEARCH_INDEX_TTL
+            or current_version() != self.version
+        )
+
+    def ensure_fresh(self):
+        """Start a rebuild if the index is missing or out of date.
+
+        The rebuild runs on a thread of its own unless
+        USER_SEARCH_INDEX_BACKGROUND is off, as it is for tests that run
+        inside a transaction.
+        """
+        if self.rebuilding or not self.is_stale():
+            return
+        if not settings.USER_SEARCH_INDEX_BACKGROUND:
+            self.build()
+            return
+        self.rebuilding = True
+        threading.Thread(target=self.rebuild_in_background, daemon=True).start()
+
+    def clear(self):
+        with self.lock:
+            self.built_at = self.version = None
+
+    def add(self, user):
+        entry = (user.username.lower(), user.first_name.lower(), user.follower_count)
+        with self.lock:
+            if self.pending is not None:
+                self.pending[user.pk] = entry
+            if self.built_at is not None:
+                self.discard(user.pk)
+                self.insert(user.pk, *entry)
+
+    def remove(self, user_id):
+        with self.lock:
+            if self.pending is not None:
+                self.pending[user_id] = None
+            if self.built_at is not None:
+                self.discard(user_id)
+
+    def insert(self, user_id, username, first_name, popularity):
+        self.users[user_id] = (username, first_name, popularity)
+        for gram in trigrams(username) | trigrams(first_name):
+            self.grams[gram].append(user_id)
+        insort(self.usernames, (username, user_id))
+        if first_name:
+            insort(self.names, (first_name, user_id))
+        insort(self.ranked, (user_id, popularity), key=self.rank_key)
+
+    def discard(self, user_id):
+        old = self.users.pop(user_id, None)
+        if old is None:
+            return
+        username, first_name, popularity = old
+        for sorted_list, key in (
+            (self.usernames, (username, user_id)),
+            (self.names, (first_name, user_id)),
+        ):
+            i = bisect_left(sorted_list, key)
+            if i < len(sorted_list) and sorted_list[i] == key:
+                del sorted_list[i]
+        i = bisect_left(self.ranked, self.rank_key((user_id, popularity)), key=self.rank_key)
+        if i < len(self.ranked) and self.ranked[i][0] == user_id:
+            del self.ranked[i]
+
+    def is_small(self, size):
+        return size * size < 2 * len(self.ranked)
+
+    def rank(self, candidates, matches, limit, exclude):
+        ids = {i for i in candidates if i in self.users and i not in exclude and matches(self.users[i])}
+        return heapq.nsmallest(limit, ids, key=lambda i: self.rank_key((i, self.users[i][2])))
+
+    def top(self, candidates, matches, limit, exclude=()):
+        """Return the ``limit`` most popular ids that satisfy ``matches``.
+
+        A small ``candidates`` list is ranked directly. A large one is cheaper
+        to satisfy by walking the global popularity order, so that is tried
+        first for a bounded number of steps before ranking the whole list.
+        Without candidates only the first ``SHORT_QUERY_SCAN`` users are
+        walked.
+        """
+        if candidates is not None and self.is_small(len(candidates)):
+            return self.rank(candidates, matches, limit, exclude)
+
+        if candidates is None:
+            budget = SHORT_QUERY_SCAN
+        else:
+            budget = 2 * limit * len(self.ranked) // max(len(candidates), 1)
+        found = []
+        for user_id, _ in itertools.islice(self.ranked, budget):
+            if user_id not in exclude and matches(self.users[user_id]):
+                found.append(user_id)
+                if len(found) == limit:
+                    return found
+        if candidates is None or budget >= len(self.ranked):
+            return found
+        return self.rank(candidates, matches, limit, exclude)
+
+    def prefix_candidates(self, query):
+        return PrefixMatches([
+            (sorted_list, bisect_left(sorted_list, (query,)), bisect_left(sorted_list, (query + '\uffff',)))
+            for sorted_list in (self.usernames, self.names)
+        ])
+
+    def contains_candidates(self, query):
+        if len(query) < 3:
+            return None
+        postings = sorted((self.grams.get(gram, ()) for gram in trigrams(query)), key=len)
+        if len(postings) == 1 or self.is_small(len(postings[0])):
+            return postings[0]
+        return set(postings[0]).intersection(postings[1])
+
+    def search(self, query, limit):
+        query = query.lower()
+        with self.lock:
+            ids = self.top(
+                self.prefix_candidates(query),
+                lambda u: u[0].startswith(query) or u[1].startswith(query),
+                limit,
+            )
+            if len(ids) < limit:
+                ids += self.top(
+                    self.contains_candidates(query),
+                    lambda u: query in u[0] or query in u[1],
+                    limit - len(ids),
+                    exclude=set(ids),
+                )
+        return ids
+
+user_index = TrigramIndex()
+
+def current_version():
+    return SearchIndexVersion.objects.values_list('version', flat=True).first() or 0
+
+def bump_version():
+    if not SearchIndexVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        SearchIndexVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+
+def uses_trigram_index():
+    return connection.vendor != 'postgresql'
+
+def search_users(query, limit):
+    if uses_trigram_index():
+        user_index.ensure_fresh()
+        # Until the first build is in, the query goes to the database.
+        if user_index.built_at is not None:
+            ids = user_index.search(query, limit)
+            users = MyUser.objects.in_bulk(ids)
+            return [users[i] for i in ids if i in users]
+
+    prefix = Q(username__istartswith=query) | Q(first_name__istartswith=query)
+    return list(
+        MyUser.objects.filter(Q(username__icontains=query) | Q(first_name__icontains=query))
+        .annotate(prefix_rank=Case(When(prefix, then=Value(0)), default=Value(1), output_field=IntegerField()))
+        .order_by('prefix_rank', '-follower_count', '-id')[:limit]
+    )
+
+def index_user(user):
+    if uses_trigram_index():
+        user_index.add(user)
+        bump_version()
+
+def unindex_user(user_id):
+    if uses_trigram_index():
+        user_index.remove(user_id)
+        bump_version()
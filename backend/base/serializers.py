@@ -1,7 +1,16 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 
+from .images import variant_urls
+from .metrics import measure
 from .models import MyUser, Post, Comment, Notification, FollowRequest
+from .tokens import FilteredRefreshToken
+
+class TimedSerializerMixin:
+    def to_representation(self, instance):
+        with measure('serialize'):
+            return super().to_representation(instance)
 
 class UserRegisterSerializer(serializers.ModelSerializer):
     class Meta:
@@ -32,11 +41,9 @@ class PasswordResetConfirmSerializer(serializers.Serializer):
         validate_password(value)
         return value
 
-class MyUserSerializer(serializers.ModelSerializer):
+class MyUserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     email = serializers.EmailField(read_only=True)
-    post_count = serializers.SerializerMethodField()
-    follower_count = serializers.SerializerMethodField()
-    following_count = serializers.SerializerMethodField()
+    profile_picture_variants = serializers.SerializerMethodField()
 
     def get_email(self, obj):
         request = self.context.get('request')
@@ -44,54 +51,55 @@ class MyUserSerializer(serializers.ModelSerializer):
             return obj.email
         return None
 
-    def get_post_count(self, obj):
-        return obj.posts.count()
-
-    def get_follower_count(self, obj):
-        return obj.followers.count()
-
-    def get_following_count(self, obj):
-        return obj.following.count()
+    def get_profile_picture_variants(self, obj):
+        return variant_urls(obj.profile_picture_variants, obj.profile_picture, self.context.get('request'))
 
     class Meta:
         model = MyUser
         fields = [
             'email', 'username', 'first_name', 'bio', 'profile_picture',
-            'post_count', 'follower_count', 'following_count',
+            'profile_picture_variants', 'post_count', 'follower_count', 'following_count',
         ]
         read_only_fields = [
             'email', 'post_count', 'follower_count', 'following_count',
         ]
 
-class BasicUserSerializer(serializers.ModelSerializer):
+class BasicUserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    profile_picture_variants = serializers.SerializerMethodField()
+
+    def get_profile_picture_variants(self, obj):
+        return variant_urls(obj.profile_picture_variants, obj.profile_picture, self.context.get('request'))
+
     class Meta:
         model = MyUser
-        fields = ['username', 'first_name', 'profile_picture']
+        fields = ['username', 'first_name', 'profile_picture', 'profile_picture_variants']
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     is_mine = serializers.SerializerMethodField()
     username = serializers.CharField(source='user.username', read_only=True)
     name = serializers.CharField(source='user.first_name', read_only=True)
     profile_picture = serializers.ImageField(source='user.profile_picture', read_only=True)
-    like_count = serializers.SerializerMethodField()
+    profile_picture_variants = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
-    comment_count = serializers.SerializerMethodField()
     formatted_date = serializers.SerializerMethodField()
     is_edited = serializers.SerializerMethodField()
 
     def get_is_mine(self, obj):
         request = self.context.get('request')
-        return bool(request and request.user.is_authenticated and obj.user == request.user)
+        return bool(request and request.user.is_authenticated and obj.user_id == request.user.pk)
+
+    def get_profile_picture_variants(self, obj):
+        return variant_urls(obj.user.profile_picture_variants, obj.user.profile_picture, self.context.get('request'))
 
-    def get_like_count(self, obj):
-        return obj.likes.count()
+    def get_image_variants(self, obj):
+        return variant_urls(obj.image_variants, obj.image, self.context.get('request'))
 
     def get_is_liked(self, obj):
+        if hasattr(obj, 'is_liked'):
+            return obj.is_liked
         request = self.context.get('request')
-        return bool(request and request.user.is_authenticated and request.user in obj.likes.all())
-
-    def get_comment_count(self, obj):
-        return obj.comments.count()
+        return bool(request and request.user.is_authenticated and obj.likes.filter(pk=request.user.pk).exists())
 
     def get_formatted_date(self, obj):
         return obj.created_at.strftime("%d/%m/%Y %H:%M")
@@ -99,35 +107,40 @@ class PostSerializer(serializers.ModelSerializer):
     def get_is_edited(self, obj):
         return obj.edited
 
+    def to_representation(self, obj):
+        data = super().to_representation(obj)
+        previews = self.context.get('comment_previews')
+        if previews is not None:
+            data['latest_comments'] = CommentSerializer(previews.get(obj.pk, []), many=True, context=self.context).data
+        return data
+
     class Meta:
         model = Post
         fields = [
-            'id', 'is_mine', 'username', 'name', 'profile_picture',
-            'image', 'text', 'created_at', 'formatted_date',
+            'id', 'is_mine', 'username', 'name', 'profile_picture', 'profile_picture_variants',
+            'image', 'image_variants', 'text', 'created_at', 'formatted_date',
             'like_count', 'is_liked', 'comment_count', 'is_edited',
         ]
         read_only_fields = fields.copy()
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     is_mine = serializers.SerializerMethodField()
     username = serializers.CharField(source='user.username', read_only=True)
     name = serializers.CharField(source='user.first_name', read_only=True)
     profile_picture = serializers.ImageField(source='user.profile_picture', read_only=True)
-    like_count = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
     formatted_date = serializers.SerializerMethodField()
     is_edited = serializers.SerializerMethodField()
 
     def get_is_mine(self, obj):
         request = self.context.get('request')
-        return bool(request and request.user.is_authenticated and obj.user == request.user)
-
-    def get_like_count(self, obj):
-        return obj.likes.count()
+        return bool(request and request.user.is_authenticated and obj.user_id == request.user.pk)
 
     def get_is_liked(self, obj):
+        if hasattr(obj, 'is_liked'):
+            return obj.is_liked
         request = self.context.get('request')
-        return bool(request and request.user.is_authenticated and request.user in obj.likes.all())
+        return bool(request and request.user.is_authenticated and obj.likes.filter(pk=request.user.pk).exists())
 
     def get_formatted_date(self, obj):
         return obj.created_at.strftime("%d/%m/%Y %H:%M")
@@ -144,7 +157,7 @@ class CommentSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = fields.copy()
 
-class FollowRequestSerializer(serializers.ModelSerializer):
+class FollowRequestSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     requester = BasicUserSerializer(read_only=True)
 
     class Meta:
@@ -152,13 +165,26 @@ class FollowRequestSerializer(serializers.ModelSerializer):
         fields = ['id', 'requester', 'created_at']
         read_only_fields = ['id', 'requester', 'created_at']
 
-class NotificationSerializer(serializers.ModelSerializer):
+class NotificationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     actor = BasicUserSerializer(read_only=True)
     target_post_id = serializers.IntegerField(read_only=True)
+    recent_actors = serializers.SerializerMethodField()
+
+    def get_recent_actors(self, obj):
+        actors = self.context.get('actors', {})
+        users = [actors[i] for i in obj.recent_actors if i in actors]
+        return BasicUserSerializer(users, many=True, context=self.context).data
 
     class Meta:
         model = Notification
         fields = [
             'id', 'actor', 'verb', 'target_post_id', 'read', 'created_at',
+            'actor_count', 'recent_actors',
         ]
-        read_only_fields = ['id', 'actor', 'verb', 'target_post_id', 'created_at']
\ No newline at end of file
+        read_only_fields = [
+            'id', 'actor', 'verb', 'target_post_id', 'created_at',
+            'actor_count', 'recent_actors',
+        ]
+
+class FilteredTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = FilteredRefreshToken
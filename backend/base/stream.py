@@ -0,0 +1,166 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.models import Count
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import MyUser, Notification, StreamEvent
+from .serializers import NotificationSerializer
+
+class LocalBackend:
+    """Delivers events to subscribers in this process only."""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def publish(self, user_id, event):
+        self.broker.dispatch(user_id, event)
+
+    def ensure_running(self, loop):
+        pass
+
+class DatabaseBackend:
+    """Relays events between processes through the StreamEvent table.
+
+    Every process with subscribers polls for new rows once per
+    NOTIFICATION_STREAM_POLL_INTERVAL. Ids are handed out before commit, so
+    each poll re-reads the rows created in the last
+    NOTIFICATION_STREAM_OVERLAP seconds and skips those it already
+    delivered. notification_worker deletes rows past
+    NOTIFICATION_STREAM_RETENTION.
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.tasks = {}
+
+    def publish(self, user_id, event):
+        StreamEvent.objects.create(recipient_id=user_id, payload=event)
+
+    def ensure_running(self, loop):
+        task = self.tasks.get(loop)
+        if task is None or task.done():
+            self.tasks[loop] = loop.create_task(self.poll())
+
+    async def poll(self):
+        overlap = timezone.timedelta(seconds=settings.NOTIFICATION_STREAM_OVERLAP)
+        since = timezone.now()
+        seen = {pk async for pk in StreamEvent.objects.filter(created_at__gte=since - overlap).values_list('id', flat=True)}
+        while self.broker.subscribers:
+            await asyncio.sleep(settings.NOTIFICATION_STREAM_POLL_INTERVAL)
+            # Each window lies inside the one before it, so the ids read last
+            # time are all that is needed to tell what was delivered.
+            polled_at = timezone.now()
+            rows = StreamEvent.objects.filter(created_at__gte=since - overlap).order_by('id').values_list('id', 'recipient_id', 'payload')
+            delivered = set()
+            async for event_id, user_id, payload in rows:
+                delivered.add(event_id)
+                if event_id not in seen:
+                    self.broker.dispatch(user_id, payload)
+            seen, since = delivered, polled_at
+
+class Broker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+        self.backend = None
+
+    def get_backend(self):
+        if self.backend is None:
+            self.backend = import_string(settings.NOTIFICATION_STREAM_BACKEND)(self)
+        return self.backend
+
+    def subscribe(self, user_id):
+        loop = asyncio.get_running_loop()
+        subscription = (loop, asyncio.Queue(maxsize=100))
+        with self.lock:
+            self.subscribers[user_id].add(subscription)
+        self.get_backend().ensure_running(loop)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self.lock:
+            self.subscribers[user_id].discard(subscription)
+            if not self.subscribers[user_id]:
+                del self.subscribers[user_id]
+
+    def dispatch(self, user_id, event):
+        with self.lock:
+            subscriptions = list(self.subscribers.get(user_id, ()))
+        for loop, queue in subscriptions:
+            loop.call_soon_threadsafe(self.offer, queue, event)
+
+    @staticmethod
+    def offer(queue, event):
+        if not queue.full():
+            queue.put_nowait(event)
+
+    def publish(self, user_id, event):
+        self.get_backend().publish(user_id, event)
+
+broker = Broker()
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    if setting == 'NOTIFICATION_STREAM_BACKEND':
+        broker.backend = None
+
+def prune_stream_events():
+    """Delete relayed events no poll will read again, returning how many were removed."""
+    cutoff = timezone.now() - timezone.timedelta(seconds=settings.NOTIFICATION_STREAM_RETENTION)
+    removed, _ = StreamEvent.objects.filter(created_at__lt=cutoff).delete()
+    return removed
+
+def publish_notifications(notification_ids):
+    """Tell each recipient's streams about new notifications and groups that gained an actor."""
+    for pk, recipient_id in Notification.objects.filter(pk__in=notification_ids).values_list('pk', 'recipient_id'):
+        broker.publish(recipient_id, {'type': 'notification', 'id': pk})
+
+def publish_unread(user_ids):
+    counts = dict(
+        Notification.objects.filter(recipient__in=user_ids, read=False)
+        .values('recipient').annotate(n=Count('id')).values_list('recipient', 'n')
+    )
+    for user_id in user_ids:
+        broker.publish(user_id, {'type': 'unread', 'unread_count': counts.get(user_id, 0)})
+
+def format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+async def render_notification(request, user_id, notification_id):
+    """The notification as /api/notifications/ lists it, or None once it has been retracted.
+
+    Only the id crosses processes; serializing here builds the picture URLs
+    against the stream's own request.
+    """
+    notification = await Notification.objects.select_related('actor').filter(pk=notification_id, recipient_id=user_id).afirst()
+    if notification is None:
+        return None
+    actors = await MyUser.objects.ain_bulk(notification.recent_actors)
+    return NotificationSerializer(notification, context={'request': request, 'actors': actors}).data
+
+async def event_stream(request, user_id):
+    loop, queue = broker.subscribe(user_id)
+    try:
+        unread = await Notification.objects.filter(recipient_id=user_id, read=False).acount()
+        yield format_event({'type': 'unread', 'unread_count': unread})
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), settings.NOTIFICATION_STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if event['type'] == 'notification':
+                notification = await render_notification(request, user_id, event['id'])
+                if notification is None:
+                    continue
+                event = {'type': 'notification', 'notification': notification}
+            yield format_event(event)
+    finally:
+        broker.unsubscribe(user_id, (loop, queue))
@@ -0,0 +1,1224 @@
+import asyncio
+import importlib
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from PIL import Image
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.db.models import Count
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from base import images, media
+from base import urls as base_urls
+from base.authenticate import user_cache
+from base.conditional import ConditionalListMixin
+from base.caching import response_cache
+from base.counters import follow, follow_many
+from base.discover import rank_new_post
+from base.graph import follow_cache, following_set, is_following
+from base.jobs import (
+    BUILDERS, enqueue_mentions, enqueue_notification, process, recent_actor_ids, retract_notification, run_batch,
+)
+from base.metrics import registry
+from base.models import (
+    Comment, DiscoverRank, FollowRequest, ImageJob, MediaFile, MyUser, Notification, NotificationJob, Post,
+    StreamEvent, TimelineEntry,
+)
+from base.routing import STICKY_COOKIE, replica_health
+from base.stream import Broker, DatabaseBackend, event_stream, publish_unread
+from base.search import TrigramIndex, bump_version, search_users, user_index
+from base.throttling import LocalStore, SQLiteStore
+from base.views import AsyncFeed, CommentListView
+from base.tokens import BlacklistFilter
+
+# Tables big enough that reading all of them, or sorting what was read, on a
+# hot path is a bug.
+HOT_TABLES = (
+    'base_post', 'base_comment', 'base_followrequest', 'base_notification',
+    'base_notificationactor', 'base_discoverrank',
+)
+
+class AccessPathPlanTests(TestCase):
+    """Each hot path is answered from an index, without a scan or a sort.
+
+    The plans are read from the database the tests run on; SQLite and
+    PostgreSQL are checked, other backends skip.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_bench', users=300, prefix='plan', stdout=StringIO())
+        cls.user = MyUser.objects.filter(username__startswith='plan', private=False).order_by('-follower_count').first()
+        cls.private = MyUser.objects.get(pk=(
+            FollowRequest.objects.values('target').annotate(n=Count('id')).order_by('-n').values_list('target', flat=True)[0]
+        ))
+        cls.post_id = Comment.objects.values('post').annotate(n=Count('id')).order_by('-n').values_list('post', flat=True)[0]
+
+    def setUp(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest(f"No plan checks for {connection.vendor}")
+        cache.clear()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.cookies['access_token'] = str(RefreshToken.for_user(user).access_token)
+        return client
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                return '\n'.join(row[-1] for row in cursor.fetchall())
+            # Make the planner show what it would do at scale rather than
+            # what is cheapest on a few hundred rows.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            cursor.execute(f'EXPLAIN {sql}')
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def problems(self, sql, plan):
+        tables = '|'.join(HOT_TABLES)
+        if connection.vendor == 'sqlite':
+            # Walking an index in order is how a LIMITed top-N is answered,
+            # so that only counts as a scan when nothing stops it early.
+            limited = re.search(r'\bLIMIT \d+', sql)
+            return [
+                line for line in plan.splitlines()
+                if 'USE TEMP B-TREE' in line
+                or (re.search(rf'SCAN (?:{tables})\b', line) and not (limited and 'USING' in line))
+            ]
+        return re.findall(rf'Seq Scan on (?:{tables})\b.*|\bSort\b.*', plan)
+
+    def assertIndexed(self, queries):
+        checked = 0
+        for query in queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT') or not any(f'"{table}"' in sql for table in HOT_TABLES):
+                continue
+            plan = self.explain(sql)
+            checked += 1
+            self.assertEqual(self.problems(sql, plan), [], f"{sql}\n\n{plan}")
+        self.assertGreater(checked, 0, "No query touched a hot table")
+
+    def get(self, user, path):
+        client = self.client_for(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(path)
+        self.assertEqual(response.status_code, 200, response.content)
+        return ctx.captured_queries
+
+    def test_user_posts(self):
+        self.assertIndexed(self.get(self.user, f'/api/posts/{self.user.username}/'))
+
+    def test_comments(self):
+        self.assertIndexed(self.get(self.user, f'/api/comments/{self.post_id}/'))
+
+    def test_follow_requests(self):
+        self.assertIndexed(self.get(self.private, '/api/follow-requests/'))
+
+    def test_notifications(self):
+        recipient = Notification.objects.values('recipient').annotate(n=Count('id')).order_by('-n').values_list('recipient', flat=True)[0]
+        self.assertIndexed(self.get(MyUser.objects.get(pk=recipient), '/api/notifications/'))
+
+    def test_discover(self):
+        self.assertIndexed(self.get(self.user, '/api/discover/'))
+
+    def test_unread_count(self):
+        with CaptureQueriesContext(connection) as ctx:
+            publish_unread([self.user.pk])
+        self.assertIndexed(ctx.captured_queries)
+
+    def test_retract_notification(self):
+        post = Post.objects.filter(user=self.user).first()
+        actor = MyUser.objects.filter(username__startswith='plan').exclude(pk=self.user.pk).first()
+        enqueue_notification(self.user, actor, Notification.VERB_LIKE, post.pk)
+        run_batch()
+        with CaptureQueriesContext(connection) as ctx:
+            retract_notification(self.user, actor, Notification.VERB_LIKE, post.pk)
+        self.assertIndexed(ctx.captured_queries)
+
+def rates(**limits):
+    """REST_FRAMEWORK with only the given throttle rates in force."""
+    return {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'anon': None, 'user': None, **limits}}
+
+@override_settings(THROTTLE_STORE='base.throttling.LocalStore', USER_SEARCH_INDEX_BACKGROUND=False)
+class ApiTestCase(TestCase):
+    """Throttle state lives in this process and starts empty for each class, so reruns do not hit the limits.
+
+    The per-worker caches are emptied before each test, as primary keys are reused after a rollback.
+    """
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        follow_cache.clear()
+        user_index.clear()
+
+    @staticmethod
+    def make_user(username, **fields):
+        return MyUser.objects.create(username=username, email=f'{username}@example.com', **fields)
+
+    @staticmethod
+    def client_for(user):
+        client = APIClient()
+        client.cookies['access_token'] = str(RefreshToken.for_user(user).access_token)
+        return client
+
+class ThrottleTests(ApiTestCase):
+    @override_settings(THROTTLE_STORE='base.throttling.LocalStore', REST_FRAMEWORK=rates(user='3/minute'))
+    def test_user_limit(self):
+        client = self.client_for(self.make_user('alice'))
+        codes = [client.get('/api/authenticated/').status_code for _ in range(4)]
+        self.assertEqual(codes, [200, 200, 200, 429])
+        self.assertGreater(int(client.get('/api/authenticated/')['Retry-After']), 0)
+
+    @override_settings(THROTTLE_STORE='base.throttling.LocalStore', REST_FRAMEWORK=rates(user='2/minute'))
+    def test_limit_is_per_user(self):
+        alice, bob = self.client_for(self.make_user('alice')), self.client_for(self.make_user('bob'))
+        for _ in range(2):
+            self.assertEqual(alice.get('/api/authenticated/').status_code, 200)
+        self.assertEqual(alice.get('/api/authenticated/').status_code, 429)
+        self.assertEqual(bob.get('/api/authenticated/').status_code, 200)
+
+    @override_settings(THROTTLE_STORE='base.throttling.LocalStore', REST_FRAMEWORK=rates(anon='2/minute'))
+    def test_anon_limit(self):
+        codes = [APIClient().get('/api/username-exists/', {'username': 'x'}).status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+
+    def test_sqlite_store_is_shared_between_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'throttle.sqlite3')
+            first, second = SQLiteStore(path), SQLiteStore(path)
+            self.assertEqual(first.hit('user_1', 2, 60), 0)
+            self.assertEqual(second.hit('user_1', 2, 60), 0)
+            self.assertGreater(first.hit('user_1', 2, 60), 0)
+            self.assertGreater(second.hit('user_1', 2, 60), 0)
+            self.assertEqual(second.hit('user_2', 2, 60), 0)
+
+class UserCacheTests(ApiTestCase):
+    """Counter writes bypass the model signals but must still drop the cached user."""
+
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob = self.make_user('alice'), self.make_user('bob')
+        self.client = self.client_for(self.alice)
+        # Cache alice as she is now.
+        self.assertEqual(self.client.get('/api/authenticated/').json()['following_count'], 0)
+
+    def authenticated(self):
+        return self.client.get('/api/authenticated/').json()
+
+    def test_follow(self):
+        self.client.post('/api/follow/', {'username': 'bob'}, format='json')
+        self.assertEqual(self.authenticated()['following_count'], 1)
+        self.assertEqual(self.client_for(self.bob).get('/api/authenticated/').json()['follower_count'], 1)
+        self.client.post('/api/follow/', {'username': 'bob'}, format='json')
+        self.assertEqual(self.authenticated()['following_count'], 0)
+
+    def test_post(self):
+        response = self.client.post('/api/create-post/', {'text': 'toki'}, format='json')
+        self.assertEqual(self.authenticated()['post_count'], 1)
+        self.client.delete(f"/api/delete-post/{response.json()['id']}/")
+        self.assertEqual(self.authenticated()['post_count'], 0)
+
+    def test_recount(self):
+        # Written around the counters, as drift would be.
+        Post.objects.create(user=self.alice, text='toki')
+        call_command('recount', stdout=StringIO())
+        self.assertEqual(self.authenticated()['post_count'], 1)
+
+class NotificationStreamTests(ApiTestCase):
+    @override_settings(NOTIFICATION_STREAM_BACKEND='base.stream.LocalBackend')
+    def test_worker_refuses_local_backend(self):
+        with self.assertRaises(CommandError):
+            call_command('notification_worker', once=True)
+
+    def test_worker_runs_with_database_backend(self):
+        call_command('notification_worker', once=True)
+
+    def test_wsgi_is_refused(self):
+        response = self.client_for(self.make_user('alice')).get('/api/notifications/stream/')
+        self.assertEqual(response.status_code, 503)
+
+    def test_asgi_authenticates(self):
+        response = async_to_sync(AsyncClient().get)('/api/notifications/stream/')
+        self.assertEqual(response.status_code, 401)
+
+    def receive(self, user, count, action):
+        """The first ``count`` events ``user``'s stream sends after its opening unread count, with ``action`` run in between."""
+        request = RequestFactory().get('/api/notifications/stream/')
+
+        def act():
+            with self.captureOnCommitCallbacks(execute=True):
+                action()
+
+        async def run():
+            stream = event_stream(request, user.pk)
+            try:
+                opening = await anext(stream)
+                await sync_to_async(act)()
+                return opening, [await anext(stream) for _ in range(count)]
+            finally:
+                await stream.aclose()
+        return async_to_sync(run)()
+
+    @override_settings(NOTIFICATION_STREAM_BACKEND='base.stream.LocalBackend')
+    def test_new_notifications_are_pushed(self):
+        alice, bob, carol = self.make_user('alice'), self.make_user('bob'), self.make_user('carol')
+        post = Post.objects.create(user=alice, text='toki')
+
+        def like():
+            enqueue_notification(alice, bob, Notification.VERB_LIKE, post.pk)
+            enqueue_notification(alice, carol, Notification.VERB_LIKE, post.pk)
+            run_batch()
+
+        opening, events = self.receive(alice, 2, like)
+        self.assertIn('"unread_count": 0', opening)
+        notification, unread = events
+        self.assertTrue(notification.startswith('event: notification\n'))
+        self.assertIn('"verb": "like"', notification)
+        self.assertIn(f'"target_post_id": {post.pk}', notification)
+        self.assertIn('"actor_count": 2', notification)
+        self.assertIn('"username": "carol"', notification)
+        self.assertTrue(unread.startswith('event: unread\n'))
+        self.assertIn('"unread_count": 1', unread)
+
+    @override_settings(NOTIFICATION_STREAM_BACKEND='base.stream.LocalBackend')
+    def test_created_notifications_are_pushed(self):
+        alice, bob = self.make_user('alice'), self.make_user('bob')
+        post = Post.objects.create(user=alice, text='toki')
+
+        def comment():
+            enqueue_notification(alice, bob, Notification.VERB_COMMENT, post.pk)
+            run_batch()
+
+        _, (notification, unread) = self.receive(alice, 2, comment)
+        self.assertIn('"verb": "comment"', notification)
+        self.assertIn('"username": "bob"', notification)
+        self.assertIn('"unread_count": 1', unread)
+
+    @override_settings(NOTIFICATION_STREAM_POLL_INTERVAL=0.01)
+    def test_database_backend_reads_late_commits(self):
+        alice = self.make_user('alice')
+        relay = Broker()
+        relay.backend = DatabaseBackend(relay)
+        create = sync_to_async(StreamEvent.objects.create)
+
+        async def run():
+            loop, queue = relay.subscribe(alice.pk)
+            try:
+                await asyncio.sleep(0.05)
+                await create(id=10, recipient=alice, payload={'n': 1})
+                first = await asyncio.wait_for(queue.get(), 5)
+                # Committed after row 10 was read, with an id handed out before it.
+                await create(id=5, recipient=alice, payload={'n': 2})
+                second = await asyncio.wait_for(queue.get(), 5)
+                await asyncio.sleep(0.05)
+                return first, second, queue.qsize()
+            finally:
+                relay.unsubscribe(alice.pk, (loop, queue))
+                await relay.backend.tasks[loop]
+        self.assertEqual(async_to_sync(run)(), ({'n': 1}, {'n': 2}, 0))
+
+    def test_worker_prunes_old_stream_events(self):
+        alice = self.make_user('alice')
+        old, new = (StreamEvent.objects.create(recipient=alice, payload={}) for _ in range(2))
+        StreamEvent.objects.filter(pk=old.pk).update(
+            created_at=timezone.now() - timezone.timedelta(seconds=settings.NOTIFICATION_STREAM_RETENTION + 1)
+        )
+        call_command('notification_worker', once=True)
+        self.assertEqual(list(StreamEvent.objects.values_list('pk', flat=True)), [new.pk])
+
+# A second SQLite database standing in for a replica. Registered at import so
+# the test runner creates and migrates it with the default one.
+REPLICA = 'test_replica'
+connections.settings.setdefault(REPLICA, connections.configure_settings({
+    'default': connections.settings['default'],
+    REPLICA: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(tempfile.gettempdir(), 'test_replica.sqlite3')},
+})[REPLICA])
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class ReplicaRoutingTests(ApiTestCase):
+    """Routing against a replica that never catches up.
+
+    Alice's row differs between the primary and the replica, so her bio shows
+    which one a read used.
+    """
+
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        super().setUp()
+        replica_health.reset()
+        self.alice = self.make_user('alice', bio='primary')
+        replica = MyUser.objects.get(pk=self.alice.pk)
+        replica.bio = 'replica'
+        replica.save(using=REPLICA, force_insert=True)
+        self.client = self.client_for(self.alice)
+
+    def bio(self):
+        user_cache.clear()
+        response = self.client.get('/api/authenticated/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['bio']
+
+    def test_get_reads_from_replica(self):
+        self.assertEqual(self.bio(), 'replica')
+        self.assertNotIn(STICKY_COOKIE, self.client.cookies)
+
+    def test_write_sticks_to_primary(self):
+        response = self.client.post('/api/create-post/', {'text': 'toki'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertFalse(Post.objects.using(REPLICA).exists())
+        self.assertEqual(self.bio(), 'primary')
+
+    def test_sticky_cookie_expires(self):
+        self.client.post('/api/create-post/', {'text': 'toki'}, format='json')
+        del self.client.cookies[STICKY_COOKIE]
+        self.assertEqual(self.bio(), 'replica')
+
+    def test_read_only_post_does_not_stick(self):
+        response = self.client.post('/api/batch/', {'requests': ['/authenticated/']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['responses'][0]['body']['bio'], 'replica')
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_failing_replica_is_skipped(self):
+        with mock.patch.object(replica_health, 'check', return_value=False):
+            self.assertEqual(self.bio(), 'primary')
+
+class CommentPreviewTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob = self.make_user('alice'), self.make_user('bob')
+        self.client = self.client_for(self.alice)
+        self.client.post('/api/follow/', {'username': 'bob'}, format='json')
+        bob = self.client_for(self.bob)
+        self.posts = [bob.post('/api/create-post/', {'text': f'toki {i}'}, format='json').json()['id'] for i in range(3)]
+        for post_id in self.posts:
+            for i in range(3):
+                Comment.objects.create(post_id=post_id, user=self.bob, text=f'pona {i}')
+
+    def previews(self, path):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        previews = {post['id']: [c['text'] for c in post.get('latest_comments', [])] for post in response.json()['results']}
+        return previews, len(ctx.captured_queries)
+
+    def test_lists_inline_newest_comments(self):
+        for path in ('/api/feed/?comments=2', '/api/posts/bob/?comments=2'):
+            previews, _ = self.previews(path)
+            self.assertEqual(previews, {post_id: ['pona 2', 'pona 1'] for post_id in self.posts}, path)
+
+    def test_previews_cost_one_query_per_page(self):
+        # The first request also loads alice into the user cache.
+        self.previews('/api/posts/bob/?comments=1')
+        _, without = self.previews('/api/posts/bob/')
+        _, three = self.previews('/api/posts/bob/?comments=1')
+        Comment.objects.filter(post_id__in=self.posts[1:]).delete()
+        cache.clear()
+        _, one = self.previews('/api/posts/bob/?comments=1')
+        self.assertEqual(three, without + 1)
+        self.assertEqual(one, three)
+
+    def test_not_inlined_unless_asked(self):
+        response = self.client.get('/api/posts/bob/')
+        self.assertNotIn('latest_comments', response.json()['results'][0])
+
+class QueryCountTests(ApiTestCase):
+    """The lists the client reads cost the same number of queries however many posts, likes and comments they show."""
+
+    paths = ('/api/feed/?comments=2', '/api/discover/?comments=2', '/api/posts/a0/?comments=2')
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = self.make_user('viewer')
+        self.client = self.client_for(self.viewer)
+
+    def build(self, n):
+        """``n`` authors the viewer follows, each with ``n`` posts that every author likes and comments on."""
+        MyUser.objects.exclude(pk=self.viewer.pk).delete()
+        authors = [self.make_user(f'a{i}') for i in range(n)]
+        for author in authors:
+            follow(author, self.viewer)
+        for _ in range(n):
+            for author in authors:
+                post = Post.objects.create(user=author, text='toki')
+                rank_new_post(post)
+                post.likes.add(*authors)
+                Comment.objects.bulk_create(Comment(post=post, user=commenter, text='pona') for commenter in authors)
+        call_command('build_timelines', stdout=StringIO())
+
+    def get(self, path):
+        # Cold, so every lookup the page needs is counted.
+        cache.clear()
+        user_cache.clear()
+        follow_cache.clear()
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['results']
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        self.build(1)
+        counts = {}
+        for path in self.paths:
+            with CaptureQueriesContext(connection) as ctx:
+                self.get(path)
+            counts[path] = len(ctx.captured_queries)
+        self.build(4)
+        for path in self.paths:
+            with self.subTest(path=path), self.assertNumQueries(counts[path]):
+                results = self.get(path)
+            self.assertGreater(len(results), 1)
+            self.assertTrue(all(len(post['latest_comments']) == 2 for post in results))
+
+class ConditionalGetTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob = self.make_user('alice', first_name='Alice'), self.make_user('bob')
+        self.post = Post.objects.create(user=self.bob, text='toki')
+        Comment.objects.create(post=self.post, user=self.alice, text='pona')
+        self.client = self.client_for(self.bob)
+
+    def revalidate(self, path, etag):
+        return self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+
+    def edit_alice(self, **fields):
+        response = self.client_for(self.alice).patch('/api/edit-user/', fields, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_comments_follow_commenter_profile(self):
+        path = f'/api/comments/{self.post.pk}/'
+        etag = self.client.get(path)['ETag']
+        self.edit_alice(bio='jan pona')
+        self.assertEqual(self.revalidate(path, etag).status_code, 304)
+        self.edit_alice(first_name='Alisa')
+        response = self.revalidate(path, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['name'], 'Alisa')
+
+    def test_posts_follow_post_changes_without_scanning(self):
+        path = '/api/posts/bob/'
+        with CaptureQueriesContext(connection) as queries:
+            etag = self.client.get(path)['ETag']
+        self.assertFalse([q for q in queries.captured_queries if 'SUM(' in q['sql'].upper()])
+        self.assertEqual(self.revalidate(path, etag).status_code, 304)
+        response = self.client_for(self.alice).post('/api/like/', {'id': self.post.pk}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        response = self.revalidate(path, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['like_count'], 1)
+
+    def test_views_without_an_etag_are_served_plainly(self):
+        path = f'/api/comments/{self.post.pk}/'
+        with mock.patch.object(CommentListView, 'get_etag', ConditionalListMixin.get_etag):
+            response = self.revalidate(path, '*')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertEqual(response.json()['results'][0]['text'], 'pona')
+
+class ImageJobTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        bob = self.make_user('bob')
+        self.posts = []
+        for n in range(2):
+            buffer = BytesIO()
+            Image.new('RGB', (32, 32)).save(buffer, 'PNG')
+            name = default_storage.save(f'posts/post_{bob.pk}_{n}.png', ContentFile(buffer.getvalue()))
+            self.posts.append(Post.objects.create(user=bob, text='sitelen', image=name))
+            ImageJob.objects.create(kind=ImageJob.KIND_POST, object_id=self.posts[-1].pk, source=name)
+
+    def test_failed_job_leaves_nothing_behind(self):
+        broken, fine = self.posts
+        bump = images.bump
+
+        def fail_for_broken(model, *pks):
+            if pks == (broken.pk,):
+                raise RuntimeError('boom')
+            bump(model, *pks)
+
+        with mock.patch('base.images.bump', side_effect=fail_for_broken), self.assertLogs('base.images', 'ERROR'):
+            self.assertEqual(images.run_batch(), 2)
+        job = ImageJob.objects.get()
+        self.assertEqual((job.object_id, job.attempts), (broken.pk, 1))
+        broken.refresh_from_db()
+        self.assertEqual((broken.version, broken.image_variants), (0, {}))
+        self.assertFalse(MediaFile.objects.filter(name=images.variant_name(broken.image.name, 'feed', 'webp')).exists())
+        self.assertTrue(MediaFile.objects.filter(name=images.variant_name(fine.image.name, 'feed', 'webp')).exists())
+        fine.refresh_from_db()
+        self.assertEqual((fine.version, fine.image_variants['source']), (1, fine.image.name))
+
+class MediaDeletionTests(ApiTestCase):
+    def test_failed_delete_leaves_nothing_behind(self):
+        bob = self.make_user('bob')
+        media.register_media(bob.pk, 'posts/post_1_a.png', 'posts/post_1_b.png')
+        MediaFile.objects.update(delete_after=timezone.now())
+
+        def delete(name):
+            # A storage backend that keeps its own index and fails after writing to it.
+            if name.endswith('a.png'):
+                MediaFile.objects.create(name=f'{name}.lock', owner_id=bob.pk)
+                raise OSError('busy')
+
+        with mock.patch.object(default_storage, 'delete', side_effect=delete), self.assertLogs('base.media', 'ERROR'):
+            self.assertEqual(media.run_batch(), 2)
+        self.assertEqual(list(MediaFile.objects.values_list('name', 'attempts')), [('posts/post_1_a.png', 1)])
+
+class MetricsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(metrics_dir.cleanup)
+        self.enterContext(override_settings(METRICS_DIR=metrics_dir.name))
+        self.addCleanup(setattr, registry, 'pid', None)
+        registry.pid = None
+
+    def files(self):
+        return sorted(os.listdir(settings.METRICS_DIR))
+
+    def test_files_of_exited_workers_are_pruned(self):
+        worker = subprocess.Popen([sys.executable, '-c', ''])
+        worker.wait()
+        for name in (f'{worker.pid}-1.json', f'{os.getpid()}-1.json', '1234.json'):
+            with open(os.path.join(settings.METRICS_DIR, name), 'w') as f:
+                json.dump({'histograms': [], 'counters': [['http_responses_total', [], 5]]}, f)
+        snapshots = registry.collect()
+        self.assertEqual(self.files(), [os.path.basename(registry.path)])
+        self.assertEqual(len(snapshots), 1)
+
+# Batch threads open their own connections, which only see committed rows.
+@override_settings(THROTTLE_STORE='base.throttling.LocalStore', SERVER_TIMING=True, BATCH_MAX_WORKERS=2)
+class ParallelBatchTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+
+    def test_parallel_batch_counts_its_queries(self):
+        bob = ApiTestCase.make_user('bob')
+        post = Post.objects.create(user=bob, text='toki')
+        client = ApiTestCase.client_for(bob)
+        paths = ['/posts/bob/', f'/comments/{post.pk}/']
+
+        def queries(parallel):
+            client.get('/api/authenticated/')
+            response = client.post('/api/batch/', {'requests': paths, 'parallel': parallel}, format='json')
+            self.assertEqual([r['status'] for r in response.json()['responses']], [200, 200])
+            return int(re.search(r'queries=(\d+)', response['Server-Timing']).group(1))
+
+        self.assertEqual(queries(True), queries(False))
+
+class BlacklistFilterTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user('alice')
+        self.filter = BlacklistFilter()
+
+    def blacklist(self, **fields):
+        """Blacklist a fresh refresh token the way another worker would, returning its JTI."""
+        token = RefreshToken.for_user(self.user)
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=token['jti']), **fields)
+        return token['jti']
+
+    def test_negatives_are_never_stale(self):
+        self.filter.might_contain('unknown')
+        # Another worker blacklists a token right after this one synced.
+        jti = self.blacklist()
+        with self.assertNumQueries(1):
+            self.assertTrue(self.filter.might_contain(jti))
+        with self.assertNumQueries(0):
+            self.assertTrue(self.filter.might_contain(jti))
+
+    def test_sync_rereads_the_overlap(self):
+        self.filter.might_contain('unknown')
+        late = self.blacklist()
+        # Committed after the sync, but stamped before it.
+        BlacklistedToken.objects.filter(token__jti=late).update(blacklisted_at=self.filter.synced_to - timezone.timedelta(seconds=1))
+        self.assertTrue(self.filter.might_contain(late))
+
+@override_settings(TIMELINE_FANOUT_LIMIT=2)
+class TimelineTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol = (self.make_user(name) for name in ('alice', 'bob', 'carol'))
+        for follower in (self.alice, self.carol):
+            self.client_for(follower).post('/api/follow/', {'username': 'bob'}, format='json')
+        self.post = Post.objects.create(user=self.bob, text='mute')
+
+    def feed(self, user):
+        return [post['id'] for post in self.client_for(user).get('/api/feed/').json()['results']]
+
+    def test_posts_stay_when_author_drops_under_fan_out_limit(self):
+        self.assertEqual(self.feed(self.alice), [self.post.pk])
+        self.client_for(self.carol).post('/api/follow/', {'username': 'bob'}, format='json')
+        self.assertEqual(self.feed(self.alice), [self.post.pk])
+
+    def test_posts_stay_when_a_follower_deletes_their_account(self):
+        self.client_for(self.carol).delete('/api/delete-user/')
+        self.assertEqual(self.feed(self.alice), [self.post.pk])
+
+class TrigramIndexTests(ApiTestCase):
+    def test_changes_during_rebuild_survive_the_swap(self):
+        index = TrigramIndex()
+        old = self.make_user('jan_sewi')
+        index.build()
+        read = index.read
+
+        def read_then_change():
+            rows = read()
+            # Another request commits while the rows are being indexed.
+            index.add(self.make_user('jan_lili'))
+            index.remove(old.pk)
+            return rows
+
+        with mock.patch.object(index, 'read', side_effect=read_then_change):
+            index.build()
+        self.assertEqual([MyUser.objects.get(pk=pk).username for pk in index.search('jan', 10)], ['jan_lili'])
+
+    def test_changes_from_other_processes_are_picked_up(self):
+        self.make_user('jan_sewi')
+        self.assertEqual([user.username for user in search_users('jan', 10)], ['jan_sewi'])
+        # Another process adds a user and bumps the version.
+        self.make_user('jan_lili', follower_count=1)
+        bump_version()
+        self.assertEqual([user.username for user in search_users('jan', 10)], ['jan_lili', 'jan_sewi'])
+
+    @override_settings(USER_SEARCH_INDEX_BACKGROUND=True)
+    def test_database_answers_until_the_first_build(self):
+        self.make_user('jan_sewi')
+        self.addCleanup(setattr, user_index, 'rebuilding', False)
+        with mock.patch('base.search.threading.Thread') as thread:
+            self.assertEqual([user.username for user in search_users('jan', 10)], ['jan_sewi'])
+        thread.return_value.start.assert_called_once()
+        self.assertIsNone(user_index.built_at)
+
+class CounterTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob = self.make_user('alice'), self.make_user('bob')
+        self.post = Post.objects.create(user=self.bob, text='toki')
+        self.comment = Comment.objects.create(post=self.post, user=self.bob, text='pona')
+        call_command('recount', stdout=StringIO())
+
+    def counters(self):
+        return (
+            list(MyUser.objects.order_by('pk').values_list('post_count', 'follower_count', 'following_count')),
+            list(Post.objects.order_by('pk').values_list('like_count', 'comment_count')),
+            list(Comment.objects.order_by('pk').values_list('like_count')),
+        )
+
+    def test_writes_keep_counters_exact(self):
+        client = self.client_for(self.alice)
+        for path, data in (
+            ('/api/like/', {'id': self.post.pk}),
+            ('/api/like-comment/', {'id': self.comment.pk}),
+            ('/api/follow/', {'username': 'bob'}),
+            ('/api/create-comment/', {'post_id': self.post.pk, 'text': 'sina'}),
+            ('/api/create-post/', {'text': 'mi'}),
+        ):
+            response = client.post(path, data, format='json')
+            self.assertLess(response.status_code, 300, response.content)
+        self.assertEqual(self.counters(), ([(1, 0, 1), (1, 1, 0)], [(1, 2), (0, 0)], [(1,), (0,)]))
+        before = self.counters()
+        call_command('recount', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.counters(), before)
+
+    def test_recount_repairs_drift(self):
+        before = self.counters()
+        MyUser.objects.update(follower_count=7, post_count=7)
+        Post.objects.update(like_count=7)
+        Comment.objects.update(like_count=7)
+        call_command('recount', stdout=StringIO())
+        self.assertEqual(self.counters(), before)
+
+    def test_cached_profile_follows_counters(self):
+        client = self.client_for(self.alice)
+        self.assertEqual(client.get('/api/user/bob/').json()['follower_count'], 0)
+        client.post('/api/follow/', {'username': 'bob'}, format='json')
+        self.assertEqual(client.get('/api/user/bob/').json()['follower_count'], 1)
+        # A drifted count that made it into the cache is replaced by the recount.
+        MyUser.objects.filter(pk=self.bob.pk).update(follower_count=5)
+        cache.clear()
+        self.assertEqual(client.get('/api/user/bob/').json()['follower_count'], 5)
+        call_command('recount', stdout=StringIO())
+        self.assertEqual(client.get('/api/user/bob/').json()['follower_count'], 1)
+
+class DiscoverTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.bob = self.make_user('bob')
+        self.fans = [self.make_user(f'fan{n}') for n in range(3)]
+        self.posts = [Post.objects.create(user=self.bob, text=f'{n}') for n in range(8)]
+        call_command('refresh_discover', rebuild=True, stdout=StringIO())
+        self.client = self.client_for(self.fans[0])
+
+    def ids(self, page):
+        return [post['id'] for post in page['results']]
+
+    def test_pages_do_not_drift_before_a_refresh(self):
+        first = self.client.get('/api/discover/').json()
+        old = self.posts[0]
+        for fan in self.fans:
+            self.client_for(fan).post('/api/like/', {'id': old.pk}, format='json')
+        second = self.client.get(first['next']).json()
+        self.assertEqual(self.ids(first) + self.ids(second), [post.pk for post in reversed(self.posts)])
+
+    def test_refresh_rescores_changed_posts_only(self):
+        old = self.posts[0]
+        for fan in self.fans:
+            self.client_for(fan).post('/api/like/', {'id': old.pk}, format='json')
+        self.assertEqual(list(DiscoverRank.objects.filter(dirty=True).values_list('post', flat=True)), [old.pk])
+        out = StringIO()
+        call_command('refresh_discover', stdout=out)
+        self.assertIn('Refreshed 1 ranks', out.getvalue())
+        cache.clear()
+        self.assertEqual(self.ids(self.client.get('/api/discover/').json())[0], old.pk)
+
+    def test_posts_leave_with_the_window(self):
+        aged = timezone.now() - timezone.timedelta(days=settings.DISCOVER_WINDOW_DAYS + 1)
+        Post.objects.filter(pk=self.posts[0].pk).update(created_at=aged)
+        DiscoverRank.objects.filter(post=self.posts[0]).update(created_at=aged)
+        call_command('refresh_discover', stdout=StringIO())
+        self.assertFalse(DiscoverRank.objects.filter(post=self.posts[0]).exists())
+
+    def test_comment_previews_read_the_cached_page(self):
+        newest = self.posts[-1]
+        Comment.objects.create(post=newest, user=self.fans[1], text='pona')
+        self.client.get('/api/discover/?comments=2')
+        hits = response_cache.stats()['hits']
+        page = self.client.get('/api/discover/?comments=2').json()
+        self.assertGreater(response_cache.stats()['hits'], hits)
+        self.assertEqual(self.ids(page), [post.pk for post in reversed(self.posts)][:len(page['results'])])
+        self.assertEqual([c['text'] for c in page['results'][0]['latest_comments']], ['pona'])
+        self.assertEqual(page['results'][1]['latest_comments'], [])
+
+class NotificationJobTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob = self.make_user('alice'), self.make_user('bob')
+        self.post = Post.objects.create(user=self.bob, text='toki')
+
+    def drain(self):
+        call_command('notification_worker', once=True, stdout=StringIO())
+
+    def test_writes_only_enqueue(self):
+        response = self.client_for(self.alice).post('/api/like/', {'id': self.post.pk}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(NotificationJob.objects.count(), 1)
+        self.drain()
+        self.assertFalse(NotificationJob.objects.exists())
+        self.assertEqual(
+            list(Notification.objects.values_list('recipient', 'actor', 'verb')),
+            [(self.bob.pk, self.alice.pk, Notification.VERB_LIKE)],
+        )
+
+    def test_reprocessing_is_idempotent(self):
+        job = enqueue_notification(self.bob, self.alice, Notification.VERB_COMMENT, self.post.pk)
+        with transaction.atomic():
+            process([job])
+        with transaction.atomic():
+            process([job])
+        self.assertEqual(Notification.objects.count(), 1)
+
+    def test_failed_jobs_back_off_then_give_up(self):
+        job = enqueue_notification(self.bob, self.alice, Notification.VERB_COMMENT, self.post.pk)
+        with mock.patch.dict(BUILDERS, {NotificationJob.KIND_NOTIFY: mock.Mock(side_effect=RuntimeError('boom'))}), \
+                self.assertLogs('base.jobs', 'ERROR'):
+            self.assertEqual(run_batch(max_attempts=2), 1)
+            job.refresh_from_db()
+            self.assertEqual((job.attempts, job.failed), (1, False))
+            self.assertGreater(job.run_after, timezone.now())
+            NotificationJob.objects.update(run_after=timezone.now())
+            run_batch(max_attempts=2)
+        job.refresh_from_db()
+        self.assertEqual((job.attempts, job.failed, job.last_error), (2, True, 'boom'))
+        self.assertEqual(run_batch(), 0)
+
+    def test_mentions_respect_privacy_and_preferences(self):
+        self.make_user('carol', private=True)
+        self.make_user('dan', notify_mention=False)
+        enqueue_mentions('@bob @carol @dan @nobody @alice', self.alice, True, self.post.pk)
+        self.drain()
+        self.assertEqual(list(Notification.objects.values_list('recipient', 'verb')), [(self.bob.pk, Notification.VERB_MENTION_POST)])
+
+class NotificationAggregationTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.bob = self.make_user('bob')
+        self.fans = [self.make_user(f'fan{n}') for n in range(3)]
+        self.post = Post.objects.create(user=self.bob, text='toki')
+
+    def toggle_like(self, *users):
+        for user in users:
+            self.client_for(user).post('/api/like/', {'id': self.post.pk}, format='json')
+        run_batch()
+
+    def test_likes_share_one_row(self):
+        self.toggle_like(*self.fans)
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 3)
+        self.assertEqual(notification.actor_id, self.fans[2].pk)
+        self.assertEqual(notification.recent_actors, [fan.pk for fan in reversed(self.fans)])
+        results = self.client_for(self.bob).get('/api/notifications/').json()['results']
+        self.assertEqual(len(results), 1)
+
+    def test_unlike_retracts_the_actor(self):
+        self.toggle_like(*self.fans)
+        self.toggle_like(self.fans[2])
+        notification = Notification.objects.get()
+        self.assertEqual((notification.actor_count, notification.actor_id), (2, self.fans[1].pk))
+        self.assertEqual(notification.recent_actors, [self.fans[1].pk, self.fans[0].pk])
+        self.toggle_like(self.fans[0], self.fans[1])
+        self.assertFalse(Notification.objects.exists())
+
+    def test_unlike_before_the_worker_cancels_the_job(self):
+        client = self.client_for(self.fans[0])
+        client.post('/api/like/', {'id': self.post.pk}, format='json')
+        self.assertEqual(NotificationJob.objects.count(), 1)
+        client.post('/api/like/', {'id': self.post.pk}, format='json')
+        self.assertEqual(NotificationJob.objects.count(), 0)
+        run_batch()
+        self.assertFalse(Notification.objects.exists())
+
+    def test_relike_counts_once(self):
+        self.toggle_like(self.fans[0])
+        self.toggle_like(self.fans[0])
+        self.toggle_like(self.fans[0])
+        self.assertEqual(Notification.objects.get().actor_count, 1)
+
+    def test_seeded_groups_have_the_worker_shape(self):
+        call_command('seed_bench', users=200, prefix='agg', stdout=StringIO())
+        self.assertFalse(Notification.objects.filter(verb=Notification.VERB_COMMENT).exists())
+        grouped = Notification.objects.filter(verb__in=Notification.AGGREGATED_VERBS).annotate(links=Count('actor_links'))
+        self.assertTrue(grouped.filter(verb=Notification.VERB_LIKE).exists())
+        self.assertTrue(grouped.filter(verb=Notification.VERB_FOLLOW).exists())
+        for notification in grouped:
+            self.assertIsNotNone(notification.group_key)
+            self.assertEqual(notification.actor_count, notification.links)
+            self.assertEqual(notification.recent_actors, recent_actor_ids(notification.pk))
+            self.assertEqual(notification.actor_id, notification.recent_actors[0])
+
+class FollowRequestBulkTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = self.make_user('owner', private=True)
+        self.post = Post.objects.create(user=self.owner, text='toki')
+        self.client = self.client_for(self.owner)
+
+    def request_from(self, count, prefix='fan'):
+        fans = [self.make_user(f'{prefix}{n}') for n in range(count)]
+        return fans, [FollowRequest.objects.create(requester=fan, target=self.owner).pk for fan in fans]
+
+    def accept_all(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/follow-requests/accept-all/', format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['accepted'], len(queries)
+
+    def test_accept_all_is_set_based(self):
+        self.request_from(2, 'few')
+        accepted, few = self.accept_all()
+        self.assertEqual(accepted, 2)
+        fans, _ = self.request_from(20)
+        accepted, many = self.accept_all()
+        self.assertEqual(accepted, 20)
+        self.assertEqual(many, few)
+
+        self.owner.refresh_from_db()
+        self.assertEqual(self.owner.follower_count, 22)
+        self.assertFalse(FollowRequest.objects.exists())
+        self.assertTrue(all(is_following(fan, self.owner) for fan in fans))
+        self.assertEqual(TimelineEntry.objects.filter(owner__in=fans, post=self.post).count(), 20)
+        run_batch()
+        self.assertEqual(Notification.objects.filter(verb=Notification.VERB_FR_ACCEPTED).count(), 22)
+        self.assertEqual(Notification.objects.get(recipient=self.owner, verb=Notification.VERB_FOLLOW).actor_count, 22)
+
+    def test_accept_and_reject_by_id(self):
+        fans, ids = self.request_from(4)
+        _, others = self.request_from(1, 'other')
+        stranger = self.make_user('stranger', private=True)
+        theirs = FollowRequest.objects.create(requester=fans[0], target=stranger)
+
+        response = self.client.post('/api/follow-requests/accept/', {'ids': ids[:2] + [theirs.pk]}, format='json')
+        self.assertEqual(response.json()['accepted'], 2)
+        response = self.client.post('/api/follow-requests/reject/', {'ids': ids[2:] + [theirs.pk]}, format='json')
+        self.assertEqual(response.json()['rejected'], 2)
+        self.assertEqual(set(FollowRequest.objects.values_list('pk', flat=True)), {*others, theirs.pk})
+        self.assertEqual([is_following(fan, self.owner) for fan in fans], [True, True, False, False])
+
+    def test_rejects_bad_input(self):
+        self.assertEqual(self.client.post('/api/follow-requests/accept/', {'ids': 'all'}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/follow-requests/reject/', {'ids': ['1']}, format='json').status_code, 400)
+        public = self.client_for(self.make_user('public'))
+        self.assertEqual(public.post('/api/follow-requests/accept-all/', format='json').status_code, 403)
+
+class PrivateAccountTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = self.make_user('owner', private=True)
+        self.fan, self.stranger = self.make_user('fan'), self.make_user('stranger')
+        follow(self.owner, self.fan)
+        self.post = Post.objects.create(user=self.owner, text='sewi')
+        self.paths = [f'/api/post/{self.post.pk}/', '/api/posts/owner/', '/api/followers/owner/', '/api/following/owner/']
+
+    def statuses(self, user):
+        client = self.client_for(user)
+        return [client.get(path).status_code for path in self.paths]
+
+    def test_only_followers_and_the_owner_get_in(self):
+        self.assertEqual(self.statuses(self.owner), [200] * 4)
+        self.assertEqual(self.statuses(self.fan), [200] * 4)
+        self.assertEqual(self.statuses(self.stranger), [403] * 4)
+        profile = self.client_for(self.stranger).get('/api/user/owner/').json()
+        self.assertFalse(profile['is_following'])
+
+    def test_unfollow_revokes_access_at_once(self):
+        self.assertEqual(self.statuses(self.fan), [200] * 4)
+        self.client_for(self.fan).post('/api/follow/', {'username': 'owner'}, format='json')
+        self.assertEqual(self.statuses(self.fan), [403] * 4)
+
+    def test_check_does_not_load_followers(self):
+        path = f'/api/post/{self.post.pk}/'
+        client = self.client_for(self.fan)
+        client.get(path)
+        follow_cache.clear()
+        cache.clear()
+        with CaptureQueriesContext(connection) as few:
+            client.get(path)
+        follow_many(self.owner, [self.make_user(f'more{n}').pk for n in range(30)])
+        follow_cache.clear()
+        cache.clear()
+        with CaptureQueriesContext(connection) as many:
+            client.get(path)
+        self.assertEqual(len(many), len(few))
+
+    def test_following_set_is_one_query(self):
+        others = [self.make_user(f'other{n}', private=True) for n in range(5)]
+        for other in others[:2]:
+            follow(other, self.fan)
+        follow_cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(following_set(self.fan, [other.pk for other in others]), {others[0].pk, others[1].pk})
+        with self.assertNumQueries(0):
+            self.assertTrue(is_following(self.fan, others[0]))
+
+class UserListPaginationTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.star, self.viewer = self.make_user('star'), self.make_user('viewer')
+        self.fans = [self.make_user(f'fan{n:02}') for n in range(45)]
+        follow_many(self.star, [fan.pk for fan in self.fans] + [self.viewer.pk])
+        for fan in self.fans[40:43]:
+            follow(fan, self.viewer)
+        # Equal counts leave the whole order to the id tiebreak.
+        MyUser.objects.filter(pk__in=[fan.pk for fan in self.fans]).update(follower_count=0)
+        self.client = self.client_for(self.viewer)
+
+    def walk(self, path, between_pages=None):
+        usernames = []
+        while path:
+            page = self.client.get(path).json()
+            usernames += [user['username'] for user in page['results']]
+            path = page['next']
+            if between_pages:
+                between_pages()
+                between_pages = None
+        return usernames
+
+    def test_viewer_and_mutuals_lead_and_nobody_repeats(self):
+        usernames = self.walk('/api/followers/star/')
+        self.assertEqual(usernames[0], 'viewer')
+        self.assertEqual(set(usernames[1:4]), {'fan40', 'fan41', 'fan42'})
+        self.assertEqual(sorted(usernames), sorted(['viewer'] + [fan.username for fan in self.fans]))
+
+    def test_pages_hold_still_while_the_list_changes(self):
+        def newcomer():
+            follow(self.star, self.make_user('newcomer', follower_count=100))
+
+        usernames = self.walk('/api/followers/star/', between_pages=newcomer)
+        self.assertEqual(sorted(usernames), sorted(['viewer'] + [fan.username for fan in self.fans]))
+
+    def test_likers_are_paged(self):
+        post = Post.objects.create(user=self.star, text='toki')
+        post.likes.add(*self.fans[:25])
+        usernames = self.walk(f'/api/likers/{post.pk}/')
+        self.assertEqual(sorted(usernames), sorted(fan.username for fan in self.fans[:25]))
+
+    def test_bad_cursor_is_not_found(self):
+        self.assertEqual(self.client.get('/api/followers/star/?cursor=zz').status_code, 404)
+
+class ResponseCacheTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob = self.make_user('alice'), self.make_user('bob', first_name='Bob')
+        self.post = Post.objects.create(user=self.bob, text='toki')
+        self.path = f'/api/post/{self.post.pk}/'
+        self.alice_client, self.bob_client = self.client_for(self.alice), self.client_for(self.bob)
+
+    def test_repeat_reads_hit_the_cache(self):
+        self.alice_client.get('/api/authenticated/')
+        with CaptureQueriesContext(connection) as cold:
+            first = self.alice_client.get(self.path).json()
+        hits = response_cache.stats()['hits']
+        with CaptureQueriesContext(connection) as warm:
+            second = self.alice_client.get(self.path).json()
+        self.assertEqual(second, first)
+        self.assertGreater(response_cache.stats()['hits'], hits)
+        self.assertLess(len(warm), len(cold))
+
+    def test_viewer_fields_are_overlaid(self):
+        self.alice_client.post('/api/like/', {'id': self.post.pk}, format='json')
+        alice = self.alice_client.get(self.path).json()
+        bob = self.bob_client.get(self.path).json()
+        self.assertEqual((alice['is_liked'], alice['is_mine']), (True, False))
+        self.assertEqual((bob['is_liked'], bob['is_mine']), (False, True))
+        self.assertEqual(alice['like_count'], bob['like_count'])
+
+    def test_writes_invalidate(self):
+        self.alice_client.get(self.path)
+        self.alice_client.get('/api/user/bob/')
+        self.bob_client.patch('/api/edit-user/', {'first_name': 'Robert'}, format='multipart')
+        self.assertEqual(self.alice_client.get(self.path).json()['name'], 'Robert')
+        self.assertEqual(self.alice_client.get('/api/user/bob/').json()['first_name'], 'Robert')
+        self.alice_client.post('/api/like/', {'id': self.post.pk}, format='json')
+        self.assertEqual([u['username'] for u in self.bob_client.get(f'/api/likers/{self.post.pk}/').json()['results']], ['alice'])
+        self.bob_client.delete(f'/api/delete-post/{self.post.pk}/')
+        self.assertEqual(self.alice_client.get(self.path).status_code, 404)
+
+class BatchTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob = self.make_user('alice'), self.make_user('bob')
+        Post.objects.create(user=self.bob, text='toki')
+        self.client = self.client_for(self.alice)
+
+    def batch(self, paths, **extra):
+        return self.client.post('/api/batch/', {'requests': paths, **extra}, format='json')
+
+    def test_bodies_match_single_requests(self):
+        single = [self.client.get('/api/user/bob/').json(), self.client.get('/api/posts/bob/').json()]
+        responses = self.batch(['/user/bob/', 'http://testserver/api/posts/bob/']).json()['responses']
+        self.assertEqual([r['status'] for r in responses], [200, 200])
+        self.assertEqual([r['body'] for r in responses], single)
+
+    def test_routes_that_cannot_be_batched(self):
+        responses = self.batch(['/nope/', '/like/', '/notifications/stream/', '/batch/']).json()['responses']
+        self.assertEqual([r['status'] for r in responses], [404, 400, 400, 400])
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.batch('/user/bob/').status_code, 400)
+        self.assertEqual(self.batch([]).status_code, 400)
+        self.assertEqual(self.batch(['/user/bob/'] * (settings.BATCH_MAX_REQUESTS + 1)).status_code, 400)
+        self.assertEqual(APIClient().post('/api/batch/', {'requests': ['/user/bob/']}, format='json').status_code, 401)
+
+    @override_settings(THROTTLE_STORE='base.throttling.LocalStore', REST_FRAMEWORK=rates(user='1/minute'))
+    def test_one_throttle_decision(self):
+        response = self.batch(['/user/bob/', '/posts/bob/', '/followers/bob/'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in response.json()['responses']], [200, 200, 200])
+        self.assertEqual(self.batch(['/user/bob/']).status_code, 429)
+
+# The async views run independent queries on other threads, which need committed rows.
+@override_settings(THROTTLE_STORE='base.throttling.LocalStore', USER_SEARCH_INDEX_BACKGROUND=False)
+class AsyncViewTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        follow_cache.clear()
+        user_index.clear()
+        self.alice, self.bob = ApiTestCase.make_user('alice'), ApiTestCase.make_user('bob')
+        self.carol = ApiTestCase.make_user('carol', private=True)
+        follow(self.bob, self.alice)
+        self.posts = [Post.objects.create(user=user, text='toki') for user in (self.bob, self.carol, self.alice)]
+        for post in self.posts:
+            rank_new_post(post)
+            Comment.objects.create(post=post, user=self.bob, text='pona')
+        call_command('build_timelines', stdout=StringIO())
+        enqueue_notification(self.alice, self.bob, Notification.VERB_FOLLOW)
+        run_batch()
+        self.paths = [
+            '/api/feed/', '/api/feed/?comments=2', '/api/discover/', '/api/discover/?comments=1',
+            f'/api/post/{self.posts[0].pk}/', f'/api/post/{self.posts[1].pk}/', '/api/post/999999/',
+            '/api/user/bob/', '/api/user/carol/', '/api/user/nobody/',
+            '/api/search-users/?q=bo', '/api/notifications/', '/api/notifications/?page=9',
+        ]
+
+    def use_async_views(self):
+        def reload_urls():
+            importlib.reload(base_urls)
+            importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+            clear_url_caches()
+
+        with override_settings(ASYNC_VIEWS=True):
+            reload_urls()
+        self.addCleanup(reload_urls)
+
+    def test_async_views_are_wired(self):
+        self.use_async_views()
+        self.assertIs(resolve('/api/feed/').func, AsyncFeed)
+
+    def test_async_views_answer_like_sync_ones(self):
+        token = str(RefreshToken.for_user(self.alice).access_token)
+        sync_client = APIClient()
+        sync_client.cookies['access_token'] = token
+        expected = []
+        for path in self.paths:
+            cache.clear()
+            response = sync_client.get(path)
+            expected.append((path, response.status_code, response.json(), response.get('ETag')))
+
+        self.use_async_views()
+        async_client = AsyncClient()
+        async_client.cookies['access_token'] = token
+        for path, code, body, etag in expected:
+            cache.clear()
+            response = async_to_sync(async_client.get)(path)
+            self.assertEqual((response.status_code, response.json(), response.get('ETag')), (code, body, etag), path)
+        path, _, _, etag = expected[4]
+        response = async_to_sync(async_client.get)(path, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(REST_FRAMEWORK=rates(user='1/minute'))
+    def test_throttles_run_off_the_event_loop(self):
+        hit = LocalStore.hit
+        on_loop = []
+
+        def recording_hit(store, *args):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(True)
+            except RuntimeError:
+                on_loop.append(False)
+            return hit(store, *args)
+
+        self.use_async_views()
+        client = AsyncClient()
+        client.cookies['access_token'] = str(RefreshToken.for_user(self.alice).access_token)
+        with mock.patch.object(LocalStore, 'hit', recording_hit):
+            statuses = [async_to_sync(client.get)('/api/feed/').status_code for _ in range(2)]
+        self.assertEqual(statuses, [200, 429])
+        self.assertEqual(on_loop, [False, False])
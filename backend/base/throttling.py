@@ -0,0 +1,119 @@
+import random
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework import throttling
+from rest_framework.settings import api_settings
+
+class LocalStore:
+    """GCRA state for this process only."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tats = {}
+
+    def hit(self, key, limit, period):
+        now = time.time()
+        interval = period / limit
+        with self.lock:
+            tat = max(self.tats.get(key, now), now) + interval
+            if tat - now > period:
+                return tat - now - period
+            self.tats[key] = tat
+            if random.random() < 0.001:
+                self.tats = {k: v for k, v in self.tats.items() if v > now}
+        return 0
+
+class SQLiteStore:
+    """GCRA state in a SQLite file shared by every worker on the host.
+
+    Each key holds only its theoretical arrival time, and a check is a single
+    upsert that advances it when the request is allowed.
+    """
+
+    UPSERT = """
+        INSERT INTO throttle (key, tat) VALUES (:key, :now + :interval)
+        ON CONFLICT (key) DO UPDATE SET tat = MAX(tat, :now) + :interval
+        WHERE MAX(tat, :now) + :interval - :now <= :period
+        RETURNING tat
+    """
+
+    def __init__(self, path=None):
+        self.path = path or settings.THROTTLE_DB_PATH
+        self.local = threading.local()
+
+    def connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("CREATE TABLE IF NOT EXISTS throttle (key TEXT PRIMARY KEY, tat REAL NOT NULL) WITHOUT ROWID")
+            self.local.conn = conn
+        return conn
+
+    def hit(self, key, limit, period):
+        conn = self.connect()
+        now = time.time()
+        params = {'key': key, 'now': now, 'interval': period / limit, 'period': period}
+        if conn.execute(self.UPSERT, params).fetchone() is not None:
+            if random.random() < 0.001:
+                conn.execute("DELETE FROM throttle WHERE tat < ?", (now,))
+            return 0
+        row = conn.execute("SELECT tat FROM throttle WHERE key = ?", (key,)).fetchone()
+        return max(row[0] + period / limit - now - period, 0) if row else 0
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = import_string(settings.THROTTLE_STORE)()
+    return _store
+
+@receiver(setting_changed)
+def reset_store(setting, **kwargs):
+    global _store
+    if setting in ('THROTTLE_STORE', 'THROTTLE_DB_PATH'):
+        _store = None
+
+class GCRAThrottleMixin:
+    """Replaces DRF's timestamp-list history with one GCRA check per request.
+
+    The limit allows the same burst as DRF's sliding window, but the state
+    stays constant-size per key.
+    """
+
+    wait_time = None
+
+    def get_rate(self):
+        # DRF binds the rates at import; read them per request so overridden settings apply.
+        self.THROTTLE_RATES = api_settings.DEFAULT_THROTTLE_RATES
+        return super().get_rate()
+
+    def allow_request(self, request, view):
+        # Sub-requests of /api/batch/ were counted once with the batch.
+        if self.rate is None or getattr(request, 'batched', False):
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        self.wait_time = get_store().hit(self.key, self.num_requests, self.duration)
+        return self.wait_time == 0
+
+    def wait(self):
+        return self.wait_time or None
+
+class AnonRateThrottle(GCRAThrottleMixin, throttling.AnonRateThrottle):
+    pass
+
+class UserRateThrottle(GCRAThrottleMixin, throttling.UserRateThrottle):
+    pass
@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.db.models import F, Q
+
+from .models import MyUser, Post, TimelineEntry
+
+def is_fanned_out(author):
+    return author.follower_count < settings.TIMELINE_FANOUT_LIMIT
+
+def insert_entries(owner_ids, posts):
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(owner_id=owner_id, post_id=post_id, created_at=created_at)
+            for owner_id in owner_ids
+            for post_id, created_at in posts
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+def fan_out(post):
+    owner_ids = [post.user_id]
+    if is_fanned_out(post.user):
+        owner_ids += list(post.user.followers.values_list('pk', flat=True))
+    insert_entries(owner_ids, [(post.pk, post.created_at)])
+
+def backfill(owner, author):
+    backfill_many([owner.pk], author)
+
+def backfill_many(owner_ids, author):
+    if not owner_ids or not is_fanned_out(author):
+        return
+    posts = author.posts.order_by('-created_at').values_list('pk', 'created_at')
+    insert_entries(owner_ids, list(posts[:settings.TIMELINE_BACKFILL_POSTS]))
+
+def pulled(author_ids):
+    """The authors among ``author_ids`` whose posts feeds pull rather than receive by fan-out."""
+    return list(
+        MyUser.objects.filter(pk__in=author_ids, follower_count__gte=settings.TIMELINE_FANOUT_LIMIT)
+        .values_list('pk', flat=True)
+    )
+
+def catch_up(author_ids, batch_size=1000):
+    """Fan out the recent posts of pulled authors that have dropped under the limit.
+
+    Feeds stop pulling an author as soon as the count drops, and only posts
+    from then on are fanned out, so the earlier ones would vanish from them.
+    """
+    for author in MyUser.objects.filter(pk__in=author_ids, follower_count__lt=settings.TIMELINE_FANOUT_LIMIT):
+        follower_ids = list(author.followers.values_list('pk', flat=True))
+        for start in range(0, len(follower_ids), batch_size):
+            backfill_many(follower_ids[start:start + batch_size], author)
+
+def trim(owner, author):
+    TimelineEntry.objects.filter(owner=owner, post__user=author).delete()
+
+def rebuild(owner):
+    TimelineEntry.objects.filter(owner=owner).delete()
+    posts = Post.objects.filter(
+        Q(user=owner)
+        | Q(user__followers=owner, user__follower_count__lt=settings.TIMELINE_FANOUT_LIMIT)
+    ).values_list('pk', 'created_at')
+    insert_entries([owner.pk], posts.iterator())
+
+def feed_for(user):
+    heavy_ids = list(
+        user.following.filter(follower_count__gte=settings.TIMELINE_FANOUT_LIMIT)
+        .values_list('pk', flat=True)
+    )
+    if not heavy_ids:
+        return (
+            Post.objects.filter(timeline_entries__owner=user)
+            .annotate(feed_at=F('timeline_entries__created_at'))
+        )
+
+    entries = TimelineEntry.objects.filter(owner=user).values('post_id')
+    return (
+        Post.objects.filter(Q(pk__in=entries) | Q(user_id__in=heavy_ids))
+        .annotate(feed_at=F('created_at'))
+    )
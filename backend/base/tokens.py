@@ -0,0 +1,111 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(capacity, 1024)
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        a, b = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((a + i * b) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+class BlacklistFilter:
+    """In-process filter over blacklisted refresh token JTIs.
+
+    A JTI the filter has not seen is only trusted to be clean after the rows
+    blacklisted since the last sync, by any worker, have been pulled in; that
+    is one range read on blacklisted_at, and the blacklist lookup itself only
+    runs for the rare positive. Each sync re-reads the last
+    TOKEN_BLACKLIST_SYNC_OVERLAP seconds, so a row that commits after a later
+    one, or under a worker with a slower clock, is not stepped over. The
+    filter is rebuilt from unexpired rows every TOKEN_BLACKLIST_FILTER_TTL
+    seconds or once it fills up.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.synced_to = None
+        self.built_at = 0
+
+    def rebuild(self):
+        synced_to = timezone.now()
+        rows = BlacklistedToken.objects.filter(token__expires_at__gt=synced_to)
+        bloom = BloomFilter(2 * rows.count())
+        for jti in rows.values_list('token__jti', flat=True).iterator(chunk_size=5000):
+            bloom.add(jti)
+        self.bloom, self.synced_to = bloom, synced_to
+        self.built_at = time.monotonic()
+
+    def sync(self):
+        synced_to = timezone.now()
+        since = self.synced_to - timezone.timedelta(seconds=settings.TOKEN_BLACKLIST_SYNC_OVERLAP)
+        for jti in BlacklistedToken.objects.filter(blacklisted_at__gte=since).values_list('token__jti', flat=True):
+            if jti not in self.bloom:
+                self.bloom.add(jti)
+        self.synced_to = synced_to
+
+    def might_contain(self, jti):
+        with self.lock:
+            if (
+                self.bloom is None
+                or time.monotonic() - self.built_at > settings.TOKEN_BLACKLIST_FILTER_TTL
+                or self.bloom.count > self.bloom.capacity
+            ):
+                self.rebuild()
+            if jti in self.bloom:
+                return True
+            self.sync()
+            return jti in self.bloom
+
+    def add(self, jti):
+        with self.lock:
+            if self.bloom is not None:
+                self.bloom.add(jti)
+
+blacklist_filter = BlacklistFilter()
+
+class FilteredRefreshToken(RefreshToken):
+    def check_blacklist(self):
+        if blacklist_filter.might_contain(self.payload[api_settings.JTI_CLAIM]):
+            super().check_blacklist()
+
+    def blacklist(self):
+        result = super().blacklist()
+        blacklist_filter.add(self.payload[api_settings.JTI_CLAIM])
+        return result
+
+def compact_blacklist(batch_size=5000):
+    """Delete expired outstanding tokens in chunks, returning how many were removed.
+
+    Blacklist rows go with them through the cascade.
+    """
+    removed = 0
+    expired = OutstandingToken.objects.filter(expires_at__lte=timezone.now()).order_by('id')
+    while True:
+        ids = list(expired.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return removed
+        OutstandingToken.objects.filter(id__in=ids).delete()
+        removed += len(ids)
@@ -19,7 +19,10 @@ from .views import (
     ToggleFollow,
     FollowRequestListView,
     RespondFollowRequest,
+    AcceptFollowRequests,
+    RejectFollowRequests,
     NotificationListView,
+    NotificationStream,
     MarkNotificationsRead,
     EditUser,
     DeleteUser,
@@ -38,8 +41,25 @@ from .views import (
     CommentLikers,
     FeedView,
     DiscoverView,
+    Batch,
+    Metrics,
+    AsyncSearchUsers,
+    AsyncGetUserProfile,
+    AsyncNotificationList,
+    AsyncGetPost,
+    AsyncFeed,
+    AsyncDiscover,
 )
 
+# Under ASGI the async views serve these reads without taking a thread for
+# the whole request; under WSGI they would each start an event loop.
+if settings.ASYNC_VIEWS:
+    search_users_view, user_profile_view, notifications_view = AsyncSearchUsers, AsyncGetUserProfile, AsyncNotificationList
+    post_view, feed_view, discover_view = AsyncGetPost, AsyncFeed, AsyncDiscover
+else:
+    search_users_view, user_profile_view, notifications_view = SearchUsers, GetUserProfile, NotificationListView.as_view()
+    post_view, feed_view, discover_view = GetPost, FeedView.as_view(), DiscoverView.as_view()
+
 urlpatterns = [
     path('token/', CustomTokenObtainPairView.as_view(), name='login'),
     path('token/refresh/', CustomTokenRefreshView.as_view(), name='refresh'),
@@ -51,19 +71,22 @@ urlpatterns = [
     path('register/', Register, name='register'),
     path('activate/<str:activation_key>/', ActivateAccount, name='activate_account'),
     path('logout/', Logout, name='logout'),
-    path('search-users/', SearchUsers, name='search_users'),
-    path('user/<str:username>/', GetUserProfile, name='get_user_profile'),
+    path('search-users/', search_users_view, name='search_users'),
+    path('user/<str:username>/', user_profile_view, name='get_user_profile'),
     path("followers/<str:username>/", Followers, name="followers"),
     path("following/<str:username>/", Following, name="following"),
     path('follow/', ToggleFollow, name='follow'),
     path('follow-requests/', FollowRequestListView.as_view(), name='follow_requests'),
     path('follow-requests/respond/<int:id>/', RespondFollowRequest, name='follow_request_respond'),
-    path('follow-requests/accept-all/', FollowRequestListView.as_view(), name='accept_all_follow_requests'),
-    path('notifications/', NotificationListView.as_view(), name='notifications'),
+    path('follow-requests/accept/', AcceptFollowRequests, name='accept_follow_requests'),
+    path('follow-requests/reject/', RejectFollowRequests, name='reject_follow_requests'),
+    path('follow-requests/accept-all/', AcceptFollowRequests, name='accept_all_follow_requests'),
+    path('notifications/', notifications_view, name='notifications'),
+    path('notifications/stream/', NotificationStream, name='notification_stream'),
     path('notifications/mark-read/', MarkNotificationsRead, name='mark_notifications_read'),
     path('edit-user/', EditUser, name='edit_user'),
     path('delete-user/', DeleteUser, name='delete_user'),
-    path('post/<int:id>/', GetPost, name='get_post'),
+    path('post/<int:id>/', post_view, name='get_post'),
     path('posts/<str:username>/', UserPostsView.as_view(), name='get_posts'),
     path('create-post/', CreatePost, name='create_post'),
     path('edit-post/<int:id>/', EditPost, name='edit_post'),
@@ -76,6 +99,8 @@ urlpatterns = [
     path('delete-comment/<int:id>/', DeleteComment, name='delete_comment'),
     path('like-comment/', ToggleCommentLike, name='comment_like'),
     path("comment-likers/<int:id>/", CommentLikers, name="comment_likers"),
-    path('feed/', FeedView.as_view(), name='feed'),
-    path('discover/', DiscoverView.as_view(), name='discover'),
+    path('feed/', feed_view, name='feed'),
+    path('discover/', discover_view, name='discover'),
+    path('batch/', Batch, name='batch'),
+    path('metrics/', Metrics, name='metrics'),
 ]
\ No newline at end of file
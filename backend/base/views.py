@@ -2,20 +2,22 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.exceptions import NotFound, PermissionDenied
 from rest_framework.generics import ListAPIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
-from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
+from rest_framework.views import APIView
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from django.conf import settings
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.password_validation import validate_password
 from django.contrib.auth.tokens import default_token_generator
 from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
 from django.core.mail import send_mail
-from django.db import connection, IntegrityError
-from django.db.models import Count, Q, F, ExpressionWrapper, FloatField
-from django.db.models.expressions import RawSQL
-from django.db.models.functions import Now, Extract
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Exists, OuterRef, Q, Value
+from django.http import HttpResponse, JsonResponse, QueryDict, StreamingHttpResponse
+from django.urls import Resolver404, resolve, reverse
 from django.utils import timezone
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
@@ -31,6 +33,7 @@ from .models import (
     Comment,
     FollowRequest,
     Notification,
+    ImageJob,
 )
 from .serializers import (
     PasswordResetRequestSerializer,
@@ -42,22 +45,89 @@ from .serializers import (
     CommentSerializer,
     FollowRequestSerializer,
     NotificationSerializer,
+    FilteredTokenRefreshSerializer,
 )
+from .counters import (
+    adjust,
+    like_post,
+    unlike_post,
+    like_comment,
+    unlike_comment,
+    follow,
+    follow_many,
+    unfollow,
+    recount_posts,
+    recount_comments,
+    recount_users,
+    touch_commented_posts,
+)
+from .jobs import (
+    enqueue_notification,
+    enqueue_notifications,
+    notification_payload,
+    enqueue_mentions,
+    cancel_notification,
+    retract_notification,
+)
+from .authenticate import CookiesAuthentication
+from .throttling import AnonRateThrottle, UserRateThrottle
+from .images import enqueue_image
+from .media import register_media, release_owner
+from .stream import (
+    event_stream,
+    publish_unread,
+)
+from .discover import (
+    rank_new_post,
+    mark_dirty,
+    ranked_posts,
+)
+from .search import (
+    search_users,
+    index_user,
+    unindex_user,
+)
+from .timeline import (
+    fan_out,
+    backfill,
+    backfill_many,
+    pulled,
+    catch_up,
+    trim,
+    feed_for,
+)
+from .graph import Follow, acan_view, ais_following, can_view, is_following
+from .caching import bump, response_cache
+from .metrics import registry, render_prometheus
+from .conditional import ConditionalListMixin, conditional_response, make_etag
+from .routing import replica_reads
+from .asyncapi import ApiResponse, aconditional_response, async_api_view, in_thread, paginate, paginate_pages
 from .pagination import (
     PostCursorPagination,
+    FeedCursorPagination,
+    PopularityKeysetPagination,
     CommentCursorPagination,
     DiscoverCursorPagination,
     FollowRequestPagination,
     NotificationPagination,
 )
 
+from asgiref.sync import async_to_sync, sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import asyncio
+import contextvars
+import copy
 import logging
-import os
 import uuid
 
 logger = logging.getLogger(__name__)
 
 def DeleteRecentNotification(recipient, actor, verb, target_post_id=None):
+    cancel_notification(recipient, actor, verb, target_post_id)
+    if verb in Notification.AGGREGATED_VERBS:
+        retract_notification(recipient, actor, verb, target_post_id)
+        return
     new_notification = Notification.objects.filter(
         recipient=recipient,
         actor=actor,
@@ -69,25 +139,11 @@ def DeleteRecentNotification(recipient, actor, verb, target_post_id=None):
         new_notification.delete()
 
 def CreateNotification(recipient, actor, verb, target_post_id=None):
-    return Notification.objects.create(
-        recipient=recipient,
-        actor=actor,
-        verb=verb,
-        target_post_id=target_post_id,
-    )
+    return enqueue_notification(recipient, actor, verb, target_post_id)
 
 def CheckForMentions(text, user, is_post, post_id):
     if '@' in text:
-        mentioned_usernames = set(part[1:] for part in text.split() if part.startswith('@'))
-        mentioned_users = MyUser.objects.filter(username__in=mentioned_usernames)
-        for mentioned_user in mentioned_users:
-            if mentioned_user != user and mentioned_user.notify_mention and (not mentioned_user.private or user in mentioned_user.followers.all()):
-                CreateNotification(
-                    mentioned_user,
-                    user,
-                    Notification.VERB_MENTION_POST if is_post else Notification.VERB_MENTION_COMMENT,
-                    post_id,
-                )
+        enqueue_mentions(text, user, is_post, post_id)
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     throttle_classes = [AnonRateThrottle, UserRateThrottle]
@@ -122,6 +178,7 @@ class CustomTokenObtainPairView(TokenObtainPairView):
         
 class CustomTokenRefreshView(TokenRefreshView):
     throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    serializer_class = FilteredTokenRefreshSerializer
 
     def post(self, request, *args, **kwargs):
         refresh_token = request.COOKIES.get("refresh_token")
@@ -311,6 +368,7 @@ def ActivateAccount(request, activation_key: str):
     )
     user.save()
     pending.delete()
+    index_user(user)
 
     MyUserSerializer(user, context={'request': request})
     return Response({"success": True}, status=status.HTTP_201_CREATED)
@@ -348,30 +406,110 @@ def Logout(request):
 @throttle_classes([AnonRateThrottle, UserRateThrottle])
 def SearchUsers(request):
     query = request.query_params.get('q', '').strip()
-    users = (
-        MyUser.objects.filter(Q(username__icontains=query) | Q(first_name__icontains=query))
-        .annotate(follower_count=Count('followers'))
-        .order_by('-follower_count', '-id')[:7]
-    )
+    users = search_users(query, 7)
     serializer = BasicUserSerializer(users, many=True, context={'request': request})
     return Response(serializer.data)
 
+POST_AUTHOR_FIELDS = {
+    'username': 'username',
+    'name': 'first_name',
+    'profile_picture': 'profile_picture',
+    'profile_picture_variants': 'profile_picture_variants',
+}
+
+def CachedUsers(request, ids):
+    """Serialized profiles by pk, built without any viewer-specific fields."""
+    def build(missing):
+        return {
+            user.pk: {**MyUserSerializer(user, context={'request': request}).data,
+                      'id': user.pk, 'private': user.private, 'version': user.version}
+            for user in MyUser.objects.filter(pk__in=missing)
+        }
+    return response_cache.fetch('myuser', ids, build, namespace=request.build_absolute_uri('/'))
+
+def CachedPosts(request, ids):
+    """Serialized posts by pk as ``(post, author)``; ``is_mine``, ``is_liked`` and the author fields come from RenderPost."""
+    def build(missing):
+        posts = Post.objects.filter(pk__in=missing).select_related('user').annotate(is_liked=Value(False))
+        built = {}
+        for post in posts:
+            data = PostSerializer(post, context={'request': request}).data
+            for field in ('is_mine', 'is_liked', *POST_AUTHOR_FIELDS):
+                data.pop(field)
+            built[post.pk] = {**data, 'user_id': post.user_id, 'version': post.version}
+        return built
+    posts = response_cache.fetch('post', ids, build, namespace=request.build_absolute_uri('/'))
+    authors = CachedUsers(request, {post['user_id'] for post in posts.values()})
+    return {pk: (post, authors[post['user_id']]) for pk, post in posts.items() if post['user_id'] in authors}
+
+def RenderPost(post, author, viewer, liked):
+    values = {
+        **post,
+        **{field: author[source] for field, source in POST_AUTHOR_FIELDS.items()},
+        'is_mine': post['user_id'] == viewer.pk,
+        'is_liked': liked,
+    }
+    return {field: values[field] for field in PostSerializer.Meta.fields}
+
+def ResolveUsername(username):
+    user_id = response_cache.get_or_set(
+        f'username:{username}',
+        lambda: MyUser.objects.filter(username=username).values_list('pk', flat=True).first(),
+        settings.RESPONSE_CACHE_TTL,
+    )
+    return user_id
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 @throttle_classes([AnonRateThrottle, UserRateThrottle])
-def GetUserProfile(request, username):    
-    try:
-        user = MyUser.objects.get(username=username)
-    except MyUser.DoesNotExist:
+def GetUserProfile(request, username):
+    user_id = ResolveUsername(username)
+    user = CachedUsers(request, [user_id]).get(user_id) if user_id else None
+    if user is None or user['username'] != username:
+        # Renamed or deleted since the username was cached.
+        user_id = MyUser.objects.filter(username=username).values_list('pk', flat=True).first()
+        user = CachedUsers(request, [user_id]).get(user_id) if user_id else None
+    if user is None:
         return Response({"error": "User not found."}, status=404)
 
-    try:
-        serializer = MyUserSerializer(user, context={'request': request})
-        is_following = request.user in user.followers.all()
+    following = is_following(request.user, MyUser(pk=user_id, private=user['private']))
 
-        return Response({**serializer.data, 'is_self': request.user.username == username, 'is_following': is_following})
-    except:
-        return Response({"error": "Error serializing user data."}, status=404)
+    def render():
+        profile = {field: user[field] for field in MyUserSerializer.Meta.fields}
+        return Response({**profile, 'is_self': request.user.username == username, 'is_following': following})
+
+    return conditional_response(request, make_etag('user', user_id, user['version'], request.user.pk, following), render)
+
+def PaginatedUserList(request, users, cache_as=None):
+    """Viewer and mutuals first, then everyone else by popularity.
+
+    ``cache_as`` is a ``(kind, pk, namespace)`` whose generation moves with
+    the list; the first page's ranking is then kept in the response cache.
+    """
+    paginator = PopularityKeysetPagination()
+    viewer = request.user
+    pinned = list(
+        users.filter(Q(pk=viewer.pk) | Exists(Follow.objects.filter(from_myuser=OuterRef('pk'), to_myuser=viewer.pk)))
+        .order_by('-follower_count', '-id')[:paginator.pinned_size]
+    )
+    pinned.sort(key=lambda u: u.pk != viewer.pk)
+    pinned_ids = {u.pk for u in pinned}
+    context = {"request": request}
+    if cache_as is None or request.query_params.get(paginator.cursor_query_param):
+        page = paginator.paginate_queryset(users.exclude(pk__in=pinned_ids), request)
+        page = BasicUserSerializer(page, many=True, context=context).data
+    else:
+        kind, pk, namespace = cache_as
+        limit = paginator.pinned_size + paginator.page_size + 1
+        ranked = response_cache.fetch(kind, [pk], lambda missing: {
+            pk: list(users.order_by('-follower_count', '-id').values_list('follower_count', 'pk')[:limit]),
+        }, namespace=namespace)[pk]
+        ids = paginator.paginate_ranked([row for row in ranked if row[1] not in pinned_ids], request)
+        cached = CachedUsers(request, ids)
+        page = [{field: cached[pk][field] for field in BasicUserSerializer.Meta.fields} for pk in ids if pk in cached]
+    if paginator.cursor is None:
+        page = BasicUserSerializer(pinned, many=True, context=context).data + page
+    return paginator.get_paginated_response(page)
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
@@ -382,21 +520,10 @@ def Followers(request, username):
     except MyUser.DoesNotExist:
         return Response({"error": "User not found."}, status=404)
     
-    if user.private and request.user not in user.followers.all():
+    if not can_view(request.user, user):
         return Response({"error": "This user has a private profile."}, status=403)
 
-    followers_qs = (
-        user.followers.all()
-            .annotate(follower_count=Count("followers"))
-            .order_by("-follower_count")
-    )
-
-    followers_list = list(followers_qs)
-    if request.user in followers_list:
-        followers_list = [request.user] + [u for u in followers_list if u != request.user]
-
-    serializer = BasicUserSerializer(followers_list, many=True, context={"request": request})
-    return Response(serializer.data)
+    return PaginatedUserList(request, user.followers.all(), cache_as=('myuser', user.pk, 'followers'))
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
@@ -407,20 +534,10 @@ def Following(request, username):
     except MyUser.DoesNotExist:
         return Response({"error": "User not found."}, status=404)
     
-    if user.private and request.user not in user.followers.all():
+    if not can_view(request.user, user):
         return Response({"error": "This user has a private profile."}, status=403)
 
-    following_qs = (
-        user.following.all()
-            .annotate(follower_count=Count("followers"))
-            .order_by("-follower_count")
-    )
-    following_list = list(following_qs)
-    if request.user in following_list:
-        following_list = [request.user] + [u for u in following_list if u != request.user]
-
-    serializer = BasicUserSerializer(following_qs, many=True, context={"request": request})
-    return Response(serializer.data)
+    return PaginatedUserList(request, user.following.all(), cache_as=('myuser', user.pk, 'following'))
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -440,8 +557,10 @@ def ToggleFollow(request):
     if user == target:
         return Response({"error": "You cannot follow yourself."}, status=status.HTTP_400_BAD_REQUEST)
 
-    if user in target.followers.all():
-        target.followers.remove(user)
+    was_pulled = pulled([target.pk])
+    if unfollow(target, user):
+        trim(user, target)
+        catch_up(was_pulled)
         DeleteRecentNotification(target, user, Notification.VERB_FOLLOW)
         return Response({"success": True, "following": False})
 
@@ -454,7 +573,8 @@ def ToggleFollow(request):
             FollowRequest.objects.create(requester=user, target=target)
             return Response({"success": True, "requested": True}, status=status.HTTP_201_CREATED)
         else:
-            target.followers.add(user)
+            follow(target, user)
+            backfill(user, target)
             if target.notify_follow:
                 CreateNotification(target, user, Notification.VERB_FOLLOW)
             return Response({"success": True, "following": True})
@@ -471,7 +591,7 @@ class FollowRequestListView(ListAPIView):
         user = self.request.user
         if not user.private:
             return FollowRequest.objects.none()
-        return FollowRequest.objects.filter(target=self.request.user).order_by('-created_at')
+        return FollowRequest.objects.filter(target=self.request.user).select_related('requester').order_by('-created_at')
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -487,7 +607,8 @@ def RespondFollowRequest(request, id):
         return Response({"error": "Follow request not found."}, status=status.HTTP_404_NOT_FOUND)
 
     if action == 'accept':
-        request.user.followers.add(fr.requester)
+        follow(request.user, fr.requester)
+        backfill(fr.requester, request.user)
         CreateNotification(fr.requester, request.user, Notification.VERB_FR_ACCEPTED)
         if request.user.notify_follow:
             CreateNotification(request.user, fr.requester, Notification.VERB_FOLLOW)
@@ -495,24 +616,49 @@ def RespondFollowRequest(request, id):
 
     return Response({"success": True}, status=status.HTTP_200_OK)
 
+def SelectFollowRequests(request):
+    follow_requests = FollowRequest.objects.filter(target=request.user)
+    ids = request.data.get('ids')
+    if ids is None:
+        return follow_requests
+    if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+        return None
+    return follow_requests.filter(pk__in=ids)
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 @throttle_classes([AnonRateThrottle, UserRateThrottle])
-def AcceptAllFollowRequests(request):
+def AcceptFollowRequests(request):
     user = request.user
     if not user.private:
         return Response({"error": "You do not have a private profile."}, status=status.HTTP_403_FORBIDDEN)
 
-    follow_requests = FollowRequest.objects.filter(target=user)
+    follow_requests = SelectFollowRequests(request)
+    if follow_requests is None:
+        return Response({"error": "ids must be a list of follow request ids."}, status=status.HTTP_400_BAD_REQUEST)
 
-    for fr in follow_requests:
-        user.followers.add(fr.requester)
-        CreateNotification(fr.requester, user, Notification.VERB_FR_ACCEPTED)
+    with transaction.atomic():
+        requester_ids = list(follow_requests.select_for_update().values_list('requester_id', flat=True))
+        FollowRequest.objects.filter(target=user, requester_id__in=requester_ids).delete()
+        added = follow_many(user, requester_ids)
+        backfill_many(added, user)
+        payloads = [notification_payload(pk, user.pk, Notification.VERB_FR_ACCEPTED) for pk in requester_ids]
         if user.notify_follow:
-            CreateNotification(user, fr.requester, Notification.VERB_FOLLOW)
-        fr.delete()
+            payloads += [notification_payload(user.pk, pk, Notification.VERB_FOLLOW) for pk in added]
+        enqueue_notifications(payloads)
 
-    return Response({"success": True, "accepted": True}, status=status.HTTP_200_OK)
+    return Response({"success": True, "accepted": len(requester_ids)}, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([AnonRateThrottle, UserRateThrottle])
+def RejectFollowRequests(request):
+    follow_requests = SelectFollowRequests(request)
+    if follow_requests is None:
+        return Response({"error": "ids must be a list of follow request ids."}, status=status.HTTP_400_BAD_REQUEST)
+
+    rejected, _ = follow_requests.delete()
+    return Response({"success": True, "rejected": rejected}, status=status.HTTP_200_OK)
 
 class NotificationListView(ListAPIView):
     serializer_class = NotificationSerializer
@@ -521,7 +667,13 @@ class NotificationListView(ListAPIView):
     throttle_classes = [AnonRateThrottle, UserRateThrottle]
 
     def get_queryset(self):
-        return Notification.objects.filter(recipient=self.request.user).order_by('-id')
+        return Notification.objects.filter(recipient=self.request.user).select_related('actor').order_by('-id')
+
+    def get_serializer(self, *args, **kwargs):
+        if args:
+            actor_ids = {a for notification in args[0] for a in notification.recent_actors}
+            kwargs['context'] = {**self.get_serializer_context(), 'actors': MyUser.objects.in_bulk(actor_ids)}
+        return super().get_serializer(*args, **kwargs)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -535,8 +687,36 @@ def MarkNotificationsRead(request):
         qs.filter(id__in=ids).update(read=True)
     else:
         return Response({"error": "invalid ids"}, status=status.HTTP_400_BAD_REQUEST)
+    publish_unread([request.user.pk])
     return Response({"success": True}, status=status.HTTP_200_OK)
 
+async def NotificationStream(request):
+    # A stream stays open for as long as the client does. Under ASGI that is
+    # one idle coroutine; under WSGI it would hold a worker thread for good,
+    # so WSGI deployments get a 503 and clients fall back to polling.
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {"error": "The notification stream is only served by the ASGI server."},
+            status=503,
+            headers={'Retry-After': '60'},
+        )
+
+    access_token = request.COOKIES.get('access_token')
+    try:
+        validated_token = CookiesAuthentication().get_validated_token(access_token)
+        user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+    except Exception:
+        return JsonResponse({"error": "Authentication credentials were not provided."}, status=401)
+
+    if not await MyUser.objects.filter(pk=user_id, is_active=True).aexists():
+        return JsonResponse({"error": "User not found."}, status=401)
+
+    return StreamingHttpResponse(
+        event_stream(request, user_id),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated])
 @throttle_classes([AnonRateThrottle, UserRateThrottle])
@@ -554,6 +734,8 @@ def EditUser(request):
     data['bio'] = normalize_whitespace(data.get('bio', '')).strip()
 
     serializer = MyUserSerializer(user, data, partial=True)
+    # What comment threads show of the user.
+    shown = (user.username, user.first_name, user.profile_picture.name)
 
     if not serializer.is_valid():
         return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
@@ -568,6 +750,13 @@ def EditUser(request):
         user.save()
     
     serializer.save()
+    adjust(MyUser, user.pk, version=1)
+    if (user.username, user.first_name, user.profile_picture.name) != shown:
+        touch_commented_posts(user)
+    index_user(user)
+    if 'profile_picture' in data:
+        register_media(user.pk, user.profile_picture.name)
+        enqueue_image(ImageJob.KIND_PROFILE, user)
     return Response({"success": True}, status=status.HTTP_200_OK)
 
 @api_view(['DELETE'])
@@ -598,59 +787,95 @@ def DeleteUser(request):
         expires="Thu, 01 Jan 1970 00:00:00 GMT",
     )
 
-    media_root = settings.MEDIA_ROOT
-    id_fragment = f"_{user.id}_"
-    for root, _, files in os.walk(media_root):
-        for filename in files:
-            if id_fragment in filename:
-                try:
-                    os.remove(os.path.join(root, filename))
-                except Exception as e:
-                    logger.exception("Could not delete media file")
-                    resp = Response(
-                        {"error": "Could not delete media files. Contact support."},
-                        status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    )
+    followed_ids = list(user.following.values_list('pk', flat=True))
+    follower_ids = list(user.followers.values_list('pk', flat=True))
+    liked_post_ids = list(user.liked_posts.values_list('pk', flat=True))
+    commented_post_ids = list(user.comments.values_list('post_id', flat=True))
+    liked_comment_ids = list(user.liked_comments.values_list('pk', flat=True))
+
+    was_pulled = pulled(followed_ids)
 
+    user_id = user.pk
     user.delete()
+    bump(MyUser, user_id)
+    unindex_user(user_id)
+    release_owner(user_id)
+
+    recount_users(MyUser.objects.filter(pk__in=followed_ids + follower_ids))
+    catch_up(was_pulled)
+    recount_posts(Post.objects.filter(pk__in=liked_post_ids + commented_post_ids))
+    mark_dirty(*liked_post_ids, *commented_post_ids)
+    recount_comments(Comment.objects.filter(pk__in=liked_comment_ids))
     return resp
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 @throttle_classes([AnonRateThrottle, UserRateThrottle])
 def GetPost(request, id):
-    try:
-        post = Post.objects.get(id=id)
-    except Post.DoesNotExist:
+    cached = CachedPosts(request, [id])
+    if id not in cached:
         return Response({"error": "Post not found."}, status=404)
+    post, author = cached[id]
 
-    if post.user.private and request.user not in post.user.followers.all():
+    if not can_view(request.user, MyUser(pk=author['id'], private=author['private'])):
         return Response({"error": "This user has a private profile."}, status=403)
 
-    serializer = PostSerializer(post, context={'request': request})
-
-    data = serializer.data
-    data['is_liked'] = request.user in post.likes.all()
+    def render():
+        liked = request.user.liked_posts.filter(pk=id).exists()
+        return Response(RenderPost(post, author, request.user, liked))
 
-    return Response(data)
+    etag = make_etag('post', id, post['version'], author['version'], request.user.pk)
+    return conditional_response(request, etag, render)
 
-class UserPostsView(ListAPIView):
+def CommentPreviews(request, posts, limit=5):
+    """The newest ``?comments=N`` comments of every post on the page, fetched in one query; None when not asked for."""
+    try:
+        limit = min(int(request.query_params.get('comments', 0)), limit)
+    except ValueError:
+        limit = 0
+    if limit <= 0:
+        return None
+    previews = {}
+    for comment in Comment.objects.with_engagement(request.user).latest_per_post([post.pk for post in posts], limit):
+        previews.setdefault(comment.post_id, []).append(comment)
+    return previews
+
+class CommentPreviewMixin:
+    """Adds the comment previews asked for with ``?comments=N`` to every post on the page."""
+
+    max_comment_previews = 5
+
+    def get_serializer(self, *args, **kwargs):
+        if args:
+            previews = CommentPreviews(self.request, args[0], self.max_comment_previews)
+            if previews is not None:
+                kwargs['context'] = {**self.get_serializer_context(), 'comment_previews': previews}
+        return super().get_serializer(*args, **kwargs)
+
+class UserPostsView(ConditionalListMixin, CommentPreviewMixin, ListAPIView):
     serializer_class = PostSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = PostCursorPagination
     throttle_classes = [AnonRateThrottle, UserRateThrottle]
 
+    def get_author(self):
+        if not hasattr(self, 'author'):
+            username = self.kwargs["username"]
+            try:
+                self.author = MyUser.objects.get(username=username)
+            except MyUser.DoesNotExist:
+                raise NotFound(detail="User not found.")
+
+            if not can_view(self.request.user, self.author):
+                raise PermissionDenied(detail="This user has a private profile.")
+        return self.author
+
+    def get_etag(self, request):
+        author = self.get_author()
+        return make_etag('posts', author.pk, author.version, author.posts_version, request.user.pk, request.get_full_path())
+
     def get_queryset(self):
-        username = self.kwargs["username"]
-        try:
-            user = MyUser.objects.get(username=username)
-        except MyUser.DoesNotExist:
-            raise NotFound(detail="User not found.")
-        
-        if user.private and self.request.user not in user.followers.all():
-            raise PermissionDenied(detail="This user has a private profile.")
-        
-        return user.posts.all().order_by('-id')
+        return Post.objects.filter(user=self.get_author()).with_engagement(self.request.user)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -662,6 +887,11 @@ def CreatePost(request):
     serializer = PostSerializer(data=data, context={'request': request})
     serializer.is_valid(raise_exception=True)
     serializer.save(user=request.user)
+    adjust(MyUser, request.user.pk, post_count=1, version=1)
+    fan_out(serializer.instance)
+    rank_new_post(serializer.instance)
+    register_media(request.user.pk, serializer.instance.image.name)
+    enqueue_image(ImageJob.KIND_POST, serializer.instance)
 
     CheckForMentions(data['text'], request.user, is_post=True, post_id=serializer.instance.id)
 
@@ -681,6 +911,7 @@ def EditPost(request, id):
     serializer = PostSerializer(post, data=data, partial=True, context={'request': request})
     serializer.is_valid(raise_exception=True)
     serializer.save(edited=True)
+    adjust(Post, post.pk, version=1)
 
     CheckForMentions(data['text'], request.user, is_post=True, post_id=id)
 
@@ -699,6 +930,8 @@ def DeletePost(request, id):
         return Response({"error": "You do not have permission to delete this post."}, status=status.HTTP_403_FORBIDDEN)
 
     post.delete()
+    bump(Post, id)
+    adjust(MyUser, request.user.pk, post_count=-1, version=1)
     return Response({"success": True}, status=status.HTTP_204_NO_CONTENT)
 
 @api_view(['POST'])
@@ -715,14 +948,15 @@ def ToggleLike(request):
     except Post.DoesNotExist:
         return Response({"error": "Post not found."}, status=status.HTTP_404_NOT_FOUND)
 
-    if request.user in post.likes.all():
-        post.likes.remove(request.user)
+    if unlike_post(post, request.user):
         liked = False
+        mark_dirty(post.pk)
         DeleteRecentNotification(post.user, request.user, Notification.VERB_LIKE, target_post_id=post_id)
     else:
-        post.likes.add(request.user)
         liked = True
-        CreateNotification(post.user, request.user, Notification.VERB_LIKE, target_post_id=post_id)
+        if like_post(post, request.user):
+            mark_dirty(post.pk)
+            CreateNotification(post.user, request.user, Notification.VERB_LIKE, target_post_id=post_id)
 
     return Response({"success": True, "liked": liked})
 
@@ -735,33 +969,30 @@ def Likers(request, id):
     except Post.DoesNotExist:
         return Response({"error": "Post not found."}, status=404)
 
-    likers_qs = (
-        post.likes.all()
-            .annotate(follower_count=Count("followers"))
-            .order_by("-follower_count")
-    )
-    likers_list = list(likers_qs)
-    if request.user in likers_list:
-        likers_list = [request.user] + [u for u in likers_list if u != request.user]
+    return PaginatedUserList(request, post.likes.all(), cache_as=('post', post.pk, 'likers'))
 
-    serializer = BasicUserSerializer(likers_qs, many=True, context={"request": request})
-    return Response(serializer.data)
-
-class CommentListView(ListAPIView):
+class CommentListView(ConditionalListMixin, ListAPIView):
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = CommentCursorPagination
     throttle_classes = [AnonRateThrottle, UserRateThrottle]
 
-    def get_queryset(self):
-        post_id = self.kwargs.get('id')
+    def get_post(self):
+        if not hasattr(self, 'post'):
+            post_id = self.kwargs.get('id')
 
-        try:
-            post = Post.objects.get(id=post_id)
-        except Post.DoesNotExist:
-            raise NotFound(detail="Post not found.")
+            try:
+                self.post = Post.objects.get(id=post_id)
+            except Post.DoesNotExist:
+                raise NotFound(detail="Post not found.")
+        return self.post
 
-        return post.comments.all()
+    def get_etag(self, request):
+        post = self.get_post()
+        return make_etag('comments', post.pk, post.version, request.user.pk, request.get_full_path())
+
+    def get_queryset(self):
+        return self.get_post().comments.with_engagement(self.request.user)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -779,6 +1010,8 @@ def CreateComment(request):
     serializer = CommentSerializer(data=data, context={'request': request})
     serializer.is_valid(raise_exception=True)
     serializer.save(user=request.user, post=post)
+    adjust(Post, post.pk, comment_count=1, version=1)
+    mark_dirty(post.pk)
 
     CheckForMentions(data['text'], request.user, is_post=False, post_id=post_id)
 
@@ -801,6 +1034,7 @@ def EditComment(request, id):
     serializer = CommentSerializer(comment, data=data, partial=True, context={'request': request})
     serializer.is_valid(raise_exception=True)
     serializer.save(edited=True)
+    adjust(Post, comment.post_id, version=1)
 
     CheckForMentions(data['text'], request.user, is_post=False, post_id=comment.post.id)
 
@@ -819,6 +1053,8 @@ def DeleteComment(request, id):
         return Response({"error": "You do not have permission to delete this comment."}, status=status.HTTP_403_FORBIDDEN)
 
     comment.delete()
+    adjust(Post, comment.post_id, comment_count=-1, version=1)
+    mark_dirty(comment.post_id)
     return Response({"success": True}, status=status.HTTP_204_NO_CONTENT)
 
 @api_view(['POST'])
@@ -834,11 +1070,10 @@ def ToggleCommentLike(request):
     except Comment.DoesNotExist:
         return Response({"error": "Comment not found."}, status=status.HTTP_404_NOT_FOUND)
 
-    if request.user in comment.likes.all():
-        comment.likes.remove(request.user)
+    if unlike_comment(comment, request.user):
         liked = False
     else:
-        comment.likes.add(request.user)
+        like_comment(comment, request.user)
         liked = True
 
     return Response({"success": True, "liked": liked})
@@ -852,61 +1087,228 @@ def CommentLikers(request, id):
     except Comment.DoesNotExist:
         return Response({"error": "Comment not found."}, status=404)
 
-    likers_qs = (
-        comment.likes.all()
-            .annotate(follower_count=Count("followers"))
-            .order_by("-follower_count")
-    )
-    likers_list = list(likers_qs)
-    if request.user in likers_list:
-        likers_list = [request.user] + [u for u in likers_list if u != request.user]
+    return PaginatedUserList(request, comment.likes.all(), cache_as=('post', comment.post_id, f'comment-likers:{comment.pk}'))
 
-    serializer = BasicUserSerializer(likers_qs, many=True, context={"request": request})
-    return Response(serializer.data)
-
-class FeedView(ListAPIView):
+class FeedView(CommentPreviewMixin, ListAPIView):
     serializer_class = PostSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = PostCursorPagination
+    pagination_class = FeedCursorPagination
     throttle_classes = [AnonRateThrottle, UserRateThrottle]
 
     def get_queryset(self):
-        following = list(self.request.user.following.all())
-        following.append(self.request.user)
-        return Post.objects.filter(user__in=following)
+        return feed_for(self.request.user).with_engagement(self.request.user)
+
+def DiscoverFirstPage(request, paginator):
+    def build():
+        posts = paginator.paginate_queryset(ranked_posts().only('id', 'created_at'), request)
+        return {'next': paginator.get_next_link(), 'ids': [post.pk for post in posts]}
+
+    return response_cache.get_or_set(
+        f'discover:{request.build_absolute_uri()}', build, settings.RESPONSE_CACHE_DISCOVER_TTL
+    )
 
-class DiscoverView(ListAPIView):
+def ServesCachedDiscover(request):
+    # Comment previews are overlaid per request, so the client's ?comments=N
+    # still reads the shared ranking.
+    return set(request.query_params) <= {'comments'}
+
+def RenderDiscoverPage(request, first, cached, liked, previews):
+    results = []
+    for pk in first['ids']:
+        if pk not in cached:
+            continue
+        post = RenderPost(*cached[pk], request.user, pk in liked)
+        if previews is not None:
+            post['latest_comments'] = CommentSerializer(previews.get(pk, []), many=True, context={'request': request}).data
+        results.append(post)
+    return {'next': first['next'], 'previous': None, 'results': results}
+
+class DiscoverView(CommentPreviewMixin, ListAPIView):
     serializer_class = PostSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = DiscoverCursorPagination
     throttle_classes = [AnonRateThrottle, UserRateThrottle]
 
     def get_queryset(self):
-        if connection.vendor == "postgresql":
-            age_minutes = ExpressionWrapper(
-                (Extract(Now(), "epoch") - Extract(F("created_at"), "epoch")) / 60.0,
-                output_field=FloatField(),
-            )
-        else:
-            table = Post._meta.db_table
-            age_minutes = RawSQL(
-                f"(julianday('now') - julianday({table}.\"created_at\")) * 1440.0",
-                [],
-                output_field=FloatField(),
-            )
+        return ranked_posts().with_engagement(self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        if not ServesCachedDiscover(request):
+            return super().list(request, *args, **kwargs)
+
+        # The ranking is shared by every viewer; is_liked, is_mine and the previews are per request.
+        first = DiscoverFirstPage(request, self.paginator)
+        cached = CachedPosts(request, first['ids'])
+        liked = set(request.user.liked_posts.filter(pk__in=first['ids']).values_list('pk', flat=True))
+        previews = CommentPreviews(request, [Post(pk=pk) for pk in first['ids']], self.max_comment_previews)
+        return Response(RenderDiscoverPage(request, first, cached, liked, previews))
 
-        score_expr = ExpressionWrapper(
-            100 * F("likes_count") + 100 * F("commenters_count") - age_minutes,
-            output_field=FloatField(),
+# Async versions of the hottest reads, routed instead of the views above
+# when ASYNC_VIEWS is set and the app runs under ASGI.
+
+@async_api_view
+async def AsyncSearchUsers(request):
+    query = request.query_params.get('q', '').strip()
+    users = await sync_to_async(search_users)(query, 7)
+    return ApiResponse(BasicUserSerializer(users, many=True, context={'request': request}).data)
+
+@async_api_view
+async def AsyncGetUserProfile(request, username):
+    async def load(user_id):
+        # The profile comes from the response cache or its own connection
+        # while the follow check runs on the request's.
+        users, following = await asyncio.gather(
+            in_thread(CachedUsers, request, [user_id]),
+            ais_following(request.user, MyUser(pk=user_id)),
         )
+        return users.get(user_id), following
+
+    user_id = await sync_to_async(ResolveUsername)(username)
+    user, following = await load(user_id) if user_id else (None, False)
+    if user is None or user['username'] != username:
+        # Renamed or deleted since the username was cached.
+        user_id = await MyUser.objects.filter(username=username).values_list('pk', flat=True).afirst()
+        user, following = await load(user_id) if user_id else (None, False)
+    if user is None:
+        return ApiResponse({"error": "User not found."}, status=404)
+
+    async def render():
+        profile = {field: user[field] for field in MyUserSerializer.Meta.fields}
+        return ApiResponse({**profile, 'is_self': request.user.username == username, 'is_following': following})
+
+    return await aconditional_response(request, make_etag('user', user_id, user['version'], request.user.pk, following), render)
+
+@async_api_view
+async def AsyncGetPost(request, id):
+    cached = await sync_to_async(CachedPosts)(request, [id])
+    if id not in cached:
+        return ApiResponse({"error": "Post not found."}, status=404)
+    post, author = cached[id]
+
+    if not await acan_view(request.user, MyUser(pk=author['id'], private=author['private'])):
+        return ApiResponse({"error": "This user has a private profile."}, status=403)
+
+    async def render():
+        liked = await request.user.liked_posts.filter(pk=id).aexists()
+        return ApiResponse(RenderPost(post, author, request.user, liked))
+
+    etag = make_etag('post', id, post['version'], author['version'], request.user.pk)
+    return await aconditional_response(request, etag, render)
+
+@async_api_view
+async def AsyncNotificationList(request):
+    paginator = NotificationPagination()
+    queryset = Notification.objects.filter(recipient=request.user).select_related('actor').order_by('-id')
+    page = await paginate_pages(paginator, queryset, request)
+    actors = await MyUser.objects.ain_bulk({actor for notification in page for actor in notification.recent_actors})
+    data = NotificationSerializer(page, many=True, context={'request': request, 'actors': actors}).data
+    return ApiResponse(paginator.get_paginated_response(data).data)
+
+async def AsyncSet(queryset):
+    return {value async for value in queryset}
+
+async def AsyncPostPage(request, paginator, queryset):
+    page = await paginate(paginator, queryset.with_engagement(request.user), request)
+    previews = await sync_to_async(CommentPreviews)(request, page)
+    context = {'request': request}
+    if previews is not None:
+        context['comment_previews'] = previews
+    data = PostSerializer(page, many=True, context=context).data
+    return ApiResponse(paginator.get_paginated_response(data).data)
+
+@async_api_view
+async def AsyncFeed(request):
+    queryset = await sync_to_async(feed_for)(request.user)
+    return await AsyncPostPage(request, FeedCursorPagination(), queryset)
+
+@async_api_view
+async def AsyncDiscover(request):
+    paginator = DiscoverCursorPagination()
+    if not ServesCachedDiscover(request):
+        return await AsyncPostPage(request, paginator, ranked_posts())
+
+    first = await sync_to_async(DiscoverFirstPage)(request, paginator)
+    liked_ids = request.user.liked_posts.filter(pk__in=first['ids']).values_list('pk', flat=True)
+    cached, liked, previews = await asyncio.gather(
+        in_thread(CachedPosts, request, first['ids']),
+        AsyncSet(liked_ids),
+        in_thread(CommentPreviews, request, [Post(pk=pk) for pk in first['ids']]),
+    )
+    return ApiResponse(RenderDiscoverPage(request, first, cached, liked, previews))
+
+def BatchSubRequest(request, path):
+    """Run one GET from a batch against its view, reusing the batch's authentication."""
+    parsed = urlsplit(path)
+    # Paths are relative to the API root like the client's own calls; full
+    # URLs, such as pagination links, are taken as they are.
+    target = parsed.path if parsed.netloc else reverse('batch').removesuffix('batch/') + parsed.path.lstrip('/')
+    try:
+        match = resolve(target)
+    except Resolver404:
+        return {'path': path, 'status': status.HTTP_404_NOT_FOUND, 'body': {"error": "Not found."}}
+
+    view_class = getattr(match.func, 'cls', None)
+    is_async = getattr(match.func, 'async_api', False)
+    is_get_view = view_class is not None and issubclass(view_class, APIView) and hasattr(view_class, 'get')
+    if not (is_async or is_get_view) or match.url_name == 'batch':
+        return {'path': path, 'status': status.HTTP_400_BAD_REQUEST, 'body': {"error": "This route cannot be batched."}}
+
+    sub = copy.copy(request._request)
+    sub.method = 'GET'
+    sub.path = sub.path_info = target
+    sub.GET = QueryDict(parsed.query)
+    sub.META = {**sub.META, 'REQUEST_METHOD': 'GET', 'PATH_INFO': target, 'QUERY_STRING': parsed.query}
+    sub.META.pop('HTTP_IF_NONE_MATCH', None)
+    sub.resolver_match = match
+    sub._force_auth_user = request.user
+    sub._force_auth_token = request.auth
+    sub.batched = True
 
-        annotated = Post.objects.annotate(
-                likes_count=Count("likes", distinct=True),
-                commenters_count=Count("comments__user", distinct=True),
-                age_minutes=age_minutes,
-                score=score_expr,
-            )
+    try:
+        view = async_to_sync(match.func) if is_async else match.func
+        response = view(sub, *match.args, **match.kwargs)
+    except Exception:
+        logger.exception("Batched request failed: %s", path)
+        return {'path': path, 'status': status.HTTP_500_INTERNAL_SERVER_ERROR, 'body': {"error": "Request failed."}}
+    if not isinstance(response, (Response, ApiResponse)):
+        response.close()
+        return {'path': path, 'status': status.HTTP_400_BAD_REQUEST, 'body': {"error": "This route cannot be batched."}}
+    return {'path': path, 'status': response.status_code, 'body': response.data}
+
+@replica_reads
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([AnonRateThrottle, UserRateThrottle])
+def Batch(request):
+    paths = request.data.get('requests')
+    if (
+        not isinstance(paths, list) or not paths or len(paths) > settings.BATCH_MAX_REQUESTS
+        or not all(isinstance(path, str) for path in paths)
+    ):
+        return Response(
+            {"error": f"requests must be a list of 1 to {settings.BATCH_MAX_REQUESTS} paths."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-        return (
-            annotated.order_by("-score", "-id")
-        )
\ No newline at end of file
+    if request.data.get('parallel') and len(paths) > 1 and settings.BATCH_MAX_WORKERS > 1:
+        def run(path):
+            try:
+                return BatchSubRequest(request, path)
+            finally:
+                connections.close_all()
+
+        # Each thread runs in a copy of this request's context, so sub-requests
+        # route their reads like it and their queries count towards its timings.
+        with ThreadPoolExecutor(max_workers=min(len(paths), settings.BATCH_MAX_WORKERS)) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, run, path) for path in paths]
+            responses = [future.result() for future in futures]
+    else:
+        responses = [BatchSubRequest(request, path) for path in paths]
+
+    return Response({'responses': responses})
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+@throttle_classes([AnonRateThrottle, UserRateThrottle])
+def Metrics(request):
+    return HttpResponse(render_prometheus(registry.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -4,6 +4,9 @@ import { API_URL } from "../constants/constants.js";
 
 const api = axios.create({ baseURL: API_URL, withCredentials: true });
 
+// Newest comments inlined with each post of a list, so a page needs no request per post.
+const COMMENT_PREVIEWS = 2;
+
 api.interceptors.response.use(
     (response) => response,
     async (error) => {
@@ -83,13 +86,31 @@ export const getUserApi = async (username) => {
     return response.data;
 };
 
-export const getFollowersApi = async (username) => {
-    const response = await api.get(`/followers/${username}/`);
+export const batchApi = async (requests, options = {}) => {
+    const response = await api.post("/batch/", { requests, parallel: true }, options);
+    return response.data.responses;
+};
+
+export const getProfilePageApi = async (username, options = {}) => {
+    const [user, posts] = await batchApi(
+        [`/user/${username}/`, `/posts/${username}/?comments=${COMMENT_PREVIEWS}`],
+        options
+    );
+    if (user.status !== 200) {
+        throw new Error(user.body?.error);
+    }
+    return { user: user.body, posts: posts.status === 200 ? posts.body : null };
+};
+
+export const getFollowersApi = async (username, cursor = null) => {
+    const url = cursor ? cursor : `/followers/${username}/`;
+    const response = await api.get(url);
     return response.data;
 };
 
-export const getFollowingApi = async (username) => {
-    const response = await api.get(`/following/${username}/`);
+export const getFollowingApi = async (username, cursor = null) => {
+    const url = cursor ? cursor : `/following/${username}/`;
+    const response = await api.get(url);
     return response.data;
 };
 
@@ -137,7 +158,7 @@ export const getPostApi = async (id) => {
 };
 
 export const getPostsApi = async (username, cursor = null) => {
-    const url = cursor ? cursor : `/posts/${username}/`;
+    const url = cursor ? cursor : `/posts/${username}/?comments=${COMMENT_PREVIEWS}`;
     const response = await api.get(url);
     return response.data;
 };
@@ -168,8 +189,9 @@ export const likeApi = async (postId) => {
     return response.data;
 };
 
-export const getLikersApi = async (id) => {
-    const res = await api.get(`/likers/${id}/`);
+export const getLikersApi = async (id, cursor = null) => {
+    const url = cursor ? cursor : `/likers/${id}/`;
+    const res = await api.get(url);
     return res.data;
 };
 
@@ -199,19 +221,35 @@ export const likeCommentApi = async (id) => {
     return response.data;
 };
 
-export const getCommentLikersApi = async (id) => {
-    const response = await api.get(`/comment-likers/${id}/`);
+export const getCommentLikersApi = async (id, cursor = null) => {
+    const url = cursor ? cursor : `/comment-likers/${id}/`;
+    const response = await api.get(url);
     return response.data;
 };
 
 export const feedApi = async (cursor = null) => {
-    const url = cursor ? cursor : `/feed/`;
+    const url = cursor ? cursor : `/feed/?comments=${COMMENT_PREVIEWS}`;
     const response = await api.get(url);
     return response.data;
 };
 
 export const discoverApi = async (cursor = null) => {
-    const url = cursor ? cursor : `/discover/`;
+    const url = cursor ? cursor : `/discover/?comments=${COMMENT_PREVIEWS}`;
     const response = await api.get(url);
     return response.data;
 };
+
+export const getNotificationsApi = async (page = null) => {
+    const url = page ? page : `/notifications/`;
+    const response = await api.get(url);
+    return response.data;
+};
+
+export const markNotificationsReadApi = async (ids = "all") => {
+    await api.post("/notifications/mark-read/", { ids });
+    return { success: true };
+};
+
+// Served only by the ASGI server; elsewhere it is refused and the caller should poll.
+export const openNotificationStream = () =>
+    new EventSource(`${API_URL}/notifications/stream/`, { withCredentials: true });
@@ -75,6 +75,8 @@ const Comment = ({
     const [likersOpen, setLikersOpen] = useState(false);
     const [likersLoading, setLikersLoading] = useState(false);
     const [likers, setLikers] = useState([]);
+    const [likersNext, setLikersNext] = useState(null);
+    const likersLoadingMore = useRef(false);
 
     const editRef = useRef(null);
 
@@ -114,12 +116,25 @@ const Comment = ({
         setLikersLoading(true);
         try {
             const data = await getCommentLikersApi(id);
-            setLikers(data);
+            setLikers(data.results);
+            setLikersNext(data.next);
         } finally {
             setLikersLoading(false);
         }
     };
 
+    const loadMoreLikers = async () => {
+        if (!likersNext || likersLoadingMore.current) return;
+        likersLoadingMore.current = true;
+        try {
+            const data = await getCommentLikersApi(id, likersNext);
+            setLikers((prev) => [...prev, ...data.results]);
+            setLikersNext(data.next);
+        } finally {
+            likersLoadingMore.current = false;
+        }
+    };
+
     const startEditing = () => {
         setEditText(displayText);
         setEditing(true);
@@ -288,6 +303,8 @@ const Comment = ({
                 users={likers}
                 title={t("likers_title")}
                 loading={likersLoading}
+                hasMore={!!likersNext}
+                onLoadMore={loadMoreLikers}
             />
         </>
     );
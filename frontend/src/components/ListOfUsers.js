@@ -14,7 +14,7 @@ import {
 import { useNavigate } from "react-router-dom";
 import { COLOR_1, COLOR_2, COLOR_4 } from "../constants/constants.js";
 
-const ListOfUsers = ({ isOpen, onClose, users, title, loading }) => {
+const ListOfUsers = ({ isOpen, onClose, users, title, loading, hasMore, onLoadMore }) => {
     const navigate = useNavigate();
 
     const goProfile = (username) => {
@@ -22,13 +22,20 @@ const ListOfUsers = ({ isOpen, onClose, users, title, loading }) => {
         navigate(`/${username}`);
     };
 
+    const handleScroll = (e) => {
+        const { scrollTop, scrollHeight, clientHeight } = e.currentTarget;
+        if (hasMore && onLoadMore && scrollHeight - scrollTop - clientHeight < 200) {
+            onLoadMore();
+        }
+    };
+
     return (
         <Modal isOpen={isOpen} onClose={onClose} size="sm" isCentered>
             <ModalOverlay />
             <ModalContent bg={COLOR_1}>
                 <ModalHeader color={COLOR_4}>{title}</ModalHeader>
                 <ModalCloseButton color={COLOR_4} />
-                <ModalBody maxH="60vh" overflowY="auto" p={0}>
+                <ModalBody maxH="60vh" overflowY="auto" p={0} onScroll={handleScroll}>
                     {loading ? (
                         <Spinner m={6} />
                     ) : (
@@ -56,6 +63,7 @@ const ListOfUsers = ({ isOpen, onClose, users, title, loading }) => {
                                     </VStack>
                                 </HStack>
                             ))}
+                            {hasMore && <Spinner m={4} alignSelf="center" />}
                         </VStack>
                     )}
                 </ModalBody>
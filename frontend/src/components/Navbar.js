@@ -9,6 +9,7 @@ import { COLOR_1, COLOR_3 } from "../constants/constants.js";
 import { useAuth } from "../contexts/useAuth.js";
 import { useLang } from "../contexts/useLang.js";
 import UserSearch from "./UserSearch.js";
+import Notifications from "./Notifications.js";
 
 const MotionBox = motion.div;
 
@@ -72,6 +73,7 @@ const Navbar = () => {
                 </HStack>
                 <FiHelpCircle size={iconSize} onClick={() => navigate("/site/info")} cursor="pointer" />
                 <FiSearch size={iconSize} onClick={() => setOpen((v) => !v)} cursor="pointer" />
+                {user && <Notifications iconSize={iconSize} />}
                 <CgProfile size={iconSize} onClick={goProfile} cursor="pointer" />
             </HStack>
         </Flex>
@@ -0,0 +1,178 @@
+import { useState, useEffect, useRef } from "react";
+import { useNavigate } from "react-router-dom";
+import { Box, VStack, HStack, Avatar, Text, Spinner, useOutsideClick } from "@chakra-ui/react";
+import { motion, AnimatePresence } from "framer-motion";
+import { FiBell } from "react-icons/fi";
+
+import { getNotificationsApi, markNotificationsReadApi, openNotificationStream } from "../api/endpoints.js";
+import { useLang } from "../contexts/useLang.js";
+import { COLOR_1, COLOR_2, COLOR_3, COLOR_4 } from "../constants/constants.js";
+
+const MotionBox = motion.div;
+
+// How long to wait before reopening a stream the server closed or refused.
+const RECONNECT_MS = 30000;
+
+const Notifications = ({ iconSize }) => {
+    const { t } = useLang();
+    const navigate = useNavigate();
+    const ref = useRef();
+    const [open, setOpen] = useState(false);
+    const [items, setItems] = useState([]);
+    const [unread, setUnread] = useState(0);
+    const [loading, setLoading] = useState(true);
+
+    useOutsideClick({ ref, handler: () => setOpen(false) });
+
+    useEffect(() => {
+        let source = null;
+        let timer = null;
+
+        const load = async (countUnread) => {
+            try {
+                const data = await getNotificationsApi();
+                setItems(data.results);
+                if (countUnread) {
+                    setUnread(data.results.filter((n) => !n.read).length);
+                }
+            } catch (err) {
+                console.error("Error loading notifications:", err);
+            } finally {
+                setLoading(false);
+            }
+        };
+
+        const connect = () => {
+            source = openNotificationStream();
+            source.addEventListener("unread", (e) => setUnread(JSON.parse(e.data).unread_count));
+            source.addEventListener("notification", (e) => {
+                const { notification } = JSON.parse(e.data);
+                setItems((list) => [notification, ...list.filter((n) => n.id !== notification.id)]);
+            });
+            source.onerror = () => {
+                // While the connection is only interrupted the browser reconnects by itself.
+                if (source.readyState !== EventSource.CLOSED) return;
+                // Refused (no ASGI server) or the access token expired: fetch the list
+                // instead, which also refreshes the token, and try the stream again later.
+                load(true);
+                timer = setTimeout(connect, RECONNECT_MS);
+            };
+        };
+
+        load(false);
+        connect();
+        return () => {
+            clearTimeout(timer);
+            source?.close();
+        };
+    }, []);
+
+    const toggle = async () => {
+        const opening = !open;
+        setOpen(opening);
+        if (opening && unread > 0) {
+            setUnread(0);
+            setItems((list) => list.map((n) => ({ ...n, read: true })));
+            try {
+                await markNotificationsReadApi();
+            } catch (err) {
+                console.error("Error marking notifications read:", err);
+            }
+        }
+    };
+
+    const go = (notification) => {
+        setOpen(false);
+        if (notification.target_post_id) {
+            navigate(`/post/${notification.target_post_id}`);
+        } else if (notification.actor) {
+            navigate(`/${notification.actor.username}`);
+        }
+    };
+
+    const describe = (notification) => {
+        const others = notification.actor_count - 1;
+        const name = notification.actor?.first_name || `@${notification.actor?.username}`;
+        const rest = others > 0 ? ` ${t("notification_others").replace("{n}", others)}` : "";
+        return `${name}${rest} ${t(`notification_${notification.verb}`)}`;
+    };
+
+    return (
+        <Box ref={ref} position="relative">
+            <Box position="relative" cursor="pointer" onClick={toggle}>
+                <FiBell size={iconSize} />
+                {unread > 0 && (
+                    <Text
+                        position="absolute"
+                        top="-4px"
+                        right="-6px"
+                        minW="18px"
+                        px={1}
+                        borderRadius="full"
+                        bg={COLOR_1}
+                        color={COLOR_4}
+                        fontSize="xs"
+                        fontWeight="bold"
+                        textAlign="center"
+                    >
+                        {unread > 99 ? "99+" : unread}
+                    </Text>
+                )}
+            </Box>
+
+            <AnimatePresence>
+                {open && (
+                    <MotionBox
+                        initial={{ opacity: 0, y: -10 }}
+                        animate={{ opacity: 1, y: 0 }}
+                        exit={{ opacity: 0, y: -10 }}
+                        transition={{ type: "spring", stiffness: 260, damping: 26 }}
+                        style={{
+                            position: "absolute",
+                            top: "calc(100% + 5px)",
+                            right: 0,
+                            width: 300,
+                            maxHeight: "60vh",
+                            overflowY: "auto",
+                            zIndex: 1000,
+                        }}
+                    >
+                        <Box bg={COLOR_3}>
+                            <Text px={3} py={2} fontWeight="bold" color={COLOR_1}>
+                                {t("notifications_title")}
+                            </Text>
+                            {loading ? (
+                                <Spinner m={4} />
+                            ) : items.length === 0 ? (
+                                <Text px={3} pb={3} fontSize="sm" color={COLOR_1}>
+                                    {t("notifications_empty")}
+                                </Text>
+                            ) : (
+                                <VStack align="stretch" spacing={0}>
+                                    {items.map((notification) => (
+                                        <HStack
+                                            key={notification.id}
+                                            px={2}
+                                            py={2}
+                                            fontWeight={notification.read ? "normal" : "bold"}
+                                            _hover={{ bg: COLOR_2 }}
+                                            cursor="pointer"
+                                            onClick={() => go(notification)}
+                                        >
+                                            <Avatar size="sm" src={notification.actor?.profile_picture || undefined} />
+                                            <Text fontSize="sm" color={COLOR_1}>
+                                                {describe(notification)}
+                                            </Text>
+                                        </HStack>
+                                    ))}
+                                </VStack>
+                            )}
+                        </Box>
+                    </MotionBox>
+                )}
+            </AnimatePresence>
+        </Box>
+    );
+};
+
+export default Notifications;
@@ -50,12 +50,15 @@ const Post = ({
     username,
     name,
     profile_picture,
+    profile_picture_variants,
     image,
+    image_variants,
     text,
     formatted_date,
     like_count,
     is_liked,
     comment_count,
+    latest_comments,
     is_edited: originalEdited,
     onDelete,
 }) => {
@@ -81,6 +84,8 @@ const Post = ({
     const [likersOpen, setLikersOpen] = useState(false);
     const [likersLoading, setLikersLoading] = useState(false);
     const [likers, setLikers] = useState([]);
+    const [likersNext, setLikersNext] = useState(null);
+    const likersLoadingMore = useRef(false);
 
     useEffect(() => {
         const editRefElement = editRef.current;
@@ -118,12 +123,25 @@ const Post = ({
         setLikersLoading(true);
         try {
             const data = await getLikersApi(id);
-            setLikers(data);
+            setLikers(data.results);
+            setLikersNext(data.next);
         } finally {
             setLikersLoading(false);
         }
     };
 
+    const loadMoreLikers = async () => {
+        if (!likersNext || likersLoadingMore.current) return;
+        likersLoadingMore.current = true;
+        try {
+            const data = await getLikersApi(id, likersNext);
+            setLikers((prev) => [...prev, ...data.results]);
+            setLikersNext(data.next);
+        } finally {
+            likersLoadingMore.current = false;
+        }
+    };
+
     const handleShare = () => {
         const url = `${BASE_URL}/post/${id}`;
         navigator.clipboard.writeText(url).then(() => {
@@ -186,7 +204,7 @@ const Post = ({
             <Box w="full">
                 <Flex align="center" mb={3} w="full">
                     <Flex onClick={() => navigate(`/${username}`)} cursor="pointer" w="auto" align="center">
-                        <Avatar size="md" src={profile_picture || undefined} />
+                        <Avatar size="md" src={profile_picture_variants?.avatar_160?.webp || profile_picture || undefined} />
                         <VStack align="flex-start" ml={3} flex="1" minW="0">
                             {name && (
                                 <Text fontWeight="bold" color={COLOR_4} w="full" isTruncated>
@@ -266,9 +284,9 @@ const Post = ({
                 )}
 
                 {image && (
-                    <Link href={image} isExternal>
+                    <Link href={image_variants?.full?.webp || image} isExternal>
                         <Image
-                            src={image}
+                            src={image_variants?.feed?.webp || image}
                             alt="post image"
                             w="full"
                             borderRadius="md"
@@ -305,6 +323,31 @@ const Post = ({
                         </>
                     )}
                 </HStack>
+
+                {latest_comments?.length > 0 && (
+                    <VStack align="stretch" spacing={1} mt={2}>
+                        {latest_comments.map((comment) => (
+                            <Text
+                                key={comment.id}
+                                fontSize="sm"
+                                color={COLOR_4}
+                                noOfLines={2}
+                                cursor="pointer"
+                                onClick={() => navigate(`/post/${id}`)}
+                            >
+                                <Text as="span" fontWeight="bold">
+                                    @{comment.username}
+                                </Text>{" "}
+                                {comment.text}
+                            </Text>
+                        ))}
+                        {comment_count > latest_comments.length && (
+                            <Text fontSize="sm" color={COLOR_3} cursor="pointer" onClick={() => navigate(`/post/${id}`)}>
+                                {t("view_all_comments").replace("{n}", comment_count)}
+                            </Text>
+                        )}
+                    </VStack>
+                )}
             </Box>
 
             <ConfirmDialog
@@ -327,6 +370,8 @@ const Post = ({
                 users={likers}
                 title={t("likers_title_post")}
                 loading={likersLoading}
+                hasMore={!!likersNext}
+                onLoadMore={loadMoreLikers}
             />
         </>
     );
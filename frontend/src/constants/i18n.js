@@ -125,6 +125,16 @@ nimi pi ilo Siko: qedized
 lipu toki ilo: contact@qedized.com`,
         email_cant_be_changed: "sina ken ala ante e ni.",
         email_placeholder: "nimi@kulupu.ijo",
+        notifications_title: "sona sin",
+        notifications_empty: "sona sin li lon ala.",
+        notification_others: "en jan {n} ante",
+        notification_follow: "li kute e sina",
+        notification_like: "li olin e lipu sina",
+        notification_comment: "li toki lon lipu sina",
+        notification_mention_post: "li toki e nimi sina lon lipu",
+        notification_mention_comment: "li toki e nimi sina lon toki",
+        notification_fr_accepted: "li pona e wile kute sina",
+        view_all_comments: "o lukin e toki ale ({n})",
     },
 
     en: {
@@ -257,5 +267,15 @@ Discord: qedized
 Email: contact@qedized.com`,
         email_cant_be_changed: "Email cannot be edited.",
         email_placeholder: "name@domain.tld",
+        notifications_title: "Notifications",
+        notifications_empty: "No notifications yet.",
+        notification_others: "and {n} others",
+        notification_follow: "followed you",
+        notification_like: "liked your post",
+        notification_comment: "commented on your post",
+        notification_mention_post: "mentioned you in a post",
+        notification_mention_comment: "mentioned you in a comment",
+        notification_fr_accepted: "accepted your follow request",
+        view_all_comments: "View all {n} comments",
     },
 };
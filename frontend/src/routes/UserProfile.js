@@ -18,7 +18,7 @@ import { useNavigate, useParams } from "react-router-dom";
 import { COLOR_1, COLOR_3, COLOR_4 } from "../constants/constants.js";
 import { useAuth } from "../contexts/useAuth.js";
 import { useLang } from "../contexts/useLang.js";
-import { followApi, getUserApi, getFollowersApi, getFollowingApi, getPostsApi } from "../api/endpoints.js";
+import { followApi, getProfilePageApi, getFollowersApi, getFollowingApi, getPostsApi } from "../api/endpoints.js";
 import ListOfUsers from "../components/ListOfUsers.js";
 import CreatePost from "../components/CreatePost.js";
 import Post from "../components/Post.js";
@@ -59,31 +59,44 @@ const UserProfile = () => {
     const [usersModalTitle, setUsersModalTitle] = useState("");
     const [usersModalLoading, setUsersModalLoading] = useState(false);
     const [usersInModal, setUsersInModal] = useState([]);
+    const [usersModalNext, setUsersModalNext] = useState(null);
+    const usersModalFetch = useRef(null);
+    const usersModalLoadingMore = useRef(false);
 
-    const openFollowers = async () => {
-        setUsersModalTitle(t("followers_capitalized"));
+    const openUsersModal = async (title, fetchPage) => {
+        setUsersModalTitle(title);
         setUsersModalOpen(true);
         setUsersModalLoading(true);
+        setUsersInModal([]);
+        setUsersModalNext(null);
+        usersModalFetch.current = fetchPage;
         try {
-            const data = await getFollowersApi(username);
-            setUsersInModal(data);
+            const data = await fetchPage(null);
+            setUsersInModal(data.results);
+            setUsersModalNext(data.next);
         } finally {
             setUsersModalLoading(false);
         }
     };
 
-    const openFollowing = async () => {
-        setUsersModalTitle(t("following_capitalized"));
-        setUsersModalOpen(true);
-        setUsersModalLoading(true);
+    const loadMoreUsers = async () => {
+        if (!usersModalNext || usersModalLoadingMore.current) return;
+        usersModalLoadingMore.current = true;
         try {
-            const data = await getFollowingApi(username);
-            setUsersInModal(data);
+            const data = await usersModalFetch.current(usersModalNext);
+            setUsersInModal((prev) => [...prev, ...data.results]);
+            setUsersModalNext(data.next);
         } finally {
-            setUsersModalLoading(false);
+            usersModalLoadingMore.current = false;
         }
     };
 
+    const openFollowers = () =>
+        openUsersModal(t("followers_capitalized"), (cursor) => getFollowersApi(username, cursor));
+
+    const openFollowing = () =>
+        openUsersModal(t("following_capitalized"), (cursor) => getFollowingApi(username, cursor));
+
     const handleFollowButton = async () => {
         const data = await followApi(username);
         if (data) {
@@ -110,12 +123,18 @@ const UserProfile = () => {
 
     useEffect(() => {
         const controller = new AbortController();
+        setPosts([]);
+        setNextCursor(null);
         (async () => {
             try {
-                const data = await getUserApi(username, { signal: controller.signal });
-                setIsSelf(data.is_self);
-                setIsFollowing(data.is_following);
-                setProfile(data);
+                const { user, posts } = await getProfilePageApi(username, { signal: controller.signal });
+                setIsSelf(user.is_self);
+                setIsFollowing(user.is_following);
+                setProfile(user);
+                if (posts) {
+                    setPosts(posts.results);
+                    setNextCursor(posts.next ? posts.next : false);
+                }
             } catch {
                 setError(t("profile_not_found"));
             } finally {
@@ -126,7 +145,7 @@ const UserProfile = () => {
     }, [username, t]);
 
     const loadPosts = useCallback(
-        async (cursor = null) => {
+        async (cursor) => {
             setLoadingPosts(true);
             try {
                 const data = await getPostsApi(username, cursor);
@@ -139,12 +158,6 @@ const UserProfile = () => {
         [username]
     );
 
-    useEffect(() => {
-        setPosts([]);
-        setNextCursor(null);
-        loadPosts(null);
-    }, [loadPosts]);
-
     const lastPostRef = useCallback(
         (node) => {
             if (loadingPosts) return;
@@ -328,6 +341,8 @@ const UserProfile = () => {
                 users={usersInModal}
                 title={usersModalTitle}
                 loading={usersModalLoading}
+                hasMore={!!usersModalNext}
+                onLoadMore={loadMoreUsers}
             />
         </Box>
     );